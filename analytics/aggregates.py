@@ -0,0 +1,180 @@
+import re
+from sqlalchemy import func, select
+from db.models import MetricRollup, MetricSnapshot, MetricValue
+
+SQL_AGGREGATIONS = ("avg", "min", "max", "sum", "count")
+
+BUCKET_UNITS_MS = {
+    "s": 1000,
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000
+}
+
+def parse_bucket(value):
+    # "30s", "5m", "1h", "1d" or plain milliseconds
+    match = re.fullmatch(r"(\d+)([smhd]?)", value or "")
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"Invalid bucket: {value}")
+    return int(match.group(1)) * BUCKET_UNITS_MS.get(match.group(2), 1)
+
+def parse_aggregations(value):
+    # comma separated avg, min, max, sum, count and percentiles such as p50, p95, p99.9
+    aggregations = [aggregation.strip() for aggregation in (value or "avg").split(",") if aggregation.strip()]
+    for aggregation in aggregations:
+        if aggregation not in SQL_AGGREGATIONS and not _percentile(aggregation):
+            raise ValueError(f"Unknown aggregation: {aggregation}")
+    return aggregations
+
+def _percentile(aggregation):
+    match = re.fullmatch(r"p(\d{1,2}(\.\d+)?|100)", aggregation)
+    return float(match.group(1)) / 100 if match else None
+
+class Aggregates:
+    def __init__(self, logger, rollups=None, cold_storage=None):
+        self.logger = logger
+        # rollups are only trusted when they are being maintained, and only over their recorded coverage
+        self.rollups = rollups
+        self.cold_storage = cold_storage
+
+    def query(self, session, start_ms, end_ms, bucket_ms, aggregations,
+              device_id=None, device_metric_type_id=None):
+        if any(_percentile(aggregation) for aggregation in aggregations):
+            return self._from_values(session, start_ms, end_ms, bucket_ms, aggregations,
+                                     device_id, device_metric_type_id)
+        resolution_ms = self._rollup_resolution(bucket_ms)
+        covered_ms = None if resolution_ms is None else self.rollups.coverage(session).get(resolution_ms)
+        if covered_ms is None:
+            return self._from_raw(session, start_ms, end_ms, bucket_ms, aggregations,
+                                  device_id, device_metric_type_id)
+
+        # whole buckets from the rollup coverage on come from the rollups, the ragged buckets
+        # at either end of the range and anything older are read raw
+        inner_start_ms = max(start_ms, covered_ms)
+        inner_start_ms += -inner_start_ms % bucket_ms
+        inner_end_ms = end_ms - end_ms % bucket_ms
+        if inner_start_ms >= inner_end_ms:
+            return self._from_raw(session, start_ms, end_ms, bucket_ms, aggregations,
+                                  device_id, device_metric_type_id)
+        rows = self._from_rollups(session, resolution_ms, inner_start_ms, inner_end_ms, bucket_ms,
+                                  aggregations, device_id, device_metric_type_id)
+        for edge_start_ms, edge_end_ms in ((start_ms, inner_start_ms), (inner_end_ms, end_ms)):
+            if edge_end_ms > edge_start_ms:
+                rows += self._from_raw(session, edge_start_ms, edge_end_ms, bucket_ms, aggregations,
+                                       device_id, device_metric_type_id)
+        rows.sort(key=lambda row: (row["device_metric_type_id"], row["bucket_start_ms"]))
+        return rows
+
+    def _from_raw(self, session, start_ms, end_ms, bucket_ms, aggregations, device_id, device_metric_type_id):
+        if self.cold_storage is not None and self.cold_storage.partitions(start_ms, end_ms):
+            # ranges reaching into cold storage are merged with the hot rows in pandas
+            return self._from_values(session, start_ms, end_ms, bucket_ms, aggregations,
+                                     device_id, device_metric_type_id)
+        return self._from_raw_sql(session, start_ms, end_ms, bucket_ms, aggregations,
+                                  device_id, device_metric_type_id)
+
+    def _rollup_resolution(self, bucket_ms):
+        # coarsest rollup that tiles the buckets
+        if self.rollups is None:
+            return None
+        for resolution_ms in reversed(self.rollups.resolutions):
+            if bucket_ms % resolution_ms == 0:
+                return resolution_ms
+        return None
+
+    def _from_rollups(self, session, resolution_ms, start_ms, end_ms, bucket_ms, aggregations,
+                      device_id, device_metric_type_id):
+        bucket = MetricRollup.bucket_start_ms - MetricRollup.bucket_start_ms % bucket_ms
+        columns = {
+            "avg": func.sum(MetricRollup.sum_value) / func.sum(MetricRollup.count),
+            "min": func.min(MetricRollup.min_value),
+            "max": func.max(MetricRollup.max_value),
+            "sum": func.sum(MetricRollup.sum_value),
+            "count": func.sum(MetricRollup.count)
+        }
+        query = select(MetricRollup.device_metric_type_id, bucket.label("bucket_start_ms"),
+                       *[columns[aggregation].label(aggregation) for aggregation in aggregations])\
+            .where(
+                MetricRollup.resolution_ms == resolution_ms,
+                MetricRollup.bucket_start_ms >= start_ms,
+                MetricRollup.bucket_start_ms < end_ms
+            )
+        if device_id is not None:
+            query = query.where(MetricRollup.device_id == device_id)
+        if device_metric_type_id is not None:
+            query = query.where(MetricRollup.device_metric_type_id == device_metric_type_id)
+        query = query.group_by(MetricRollup.device_metric_type_id, bucket)\
+            .order_by(MetricRollup.device_metric_type_id, bucket)
+        return [dict(row._mapping) for row in session.execute(query)]
+
+    def _from_raw_sql(self, session, start_ms, end_ms, bucket_ms, aggregations,
+                      device_id, device_metric_type_id):
+        bucket = MetricSnapshot.server_ts_ms - MetricSnapshot.server_ts_ms % bucket_ms
+        columns = {
+            "avg": func.avg(MetricValue.value),
+            "min": func.min(MetricValue.value),
+            "max": func.max(MetricValue.value),
+            "sum": func.sum(MetricValue.value),
+            "count": func.count(MetricValue.value)
+        }
+        query = self._raw_query(
+            select(MetricValue.device_metric_type_id, bucket.label("bucket_start_ms"),
+                   *[columns[aggregation].label(aggregation) for aggregation in aggregations]),
+            start_ms, end_ms, device_id, device_metric_type_id
+        )
+        query = query.group_by(MetricValue.device_metric_type_id, bucket)\
+            .order_by(MetricValue.device_metric_type_id, bucket)
+        return [dict(row._mapping) for row in session.execute(query)]
+
+    def _from_values(self, session, start_ms, end_ms, bucket_ms, aggregations,
+                     device_id, device_metric_type_id):
+        # percentiles have no SQLite aggregate, the values are grouped with pandas instead
+        import pandas as pd
+
+        query = self._raw_query(
+            select(MetricValue.device_metric_type_id, MetricSnapshot.server_ts_ms, MetricValue.value),
+            start_ms, end_ms, device_id, device_metric_type_id
+        )
+        columns = ["device_metric_type_id", "server_ts_ms", "value"]
+        frame = pd.DataFrame(session.execute(query).all(), columns=columns)
+        if self.cold_storage is not None:
+            cold = self.cold_storage.read_values(columns, device_id, device_metric_type_id, start_ms, end_ms)
+            if len(cold["value"]):
+                # skip concat with an empty frame, it would upcast the integer columns
+                frames = [pd.DataFrame(cold), frame] if len(frame) else [pd.DataFrame(cold)]
+                frame = pd.concat(frames, ignore_index=True)
+        if frame.empty:
+            return []
+        frame["bucket_start_ms"] = frame["server_ts_ms"] - frame["server_ts_ms"] % bucket_ms
+        grouped = frame.groupby(["device_metric_type_id", "bucket_start_ms"])["value"]
+
+        result = pd.DataFrame(index=grouped.size().index)
+        for aggregation in aggregations:
+            quantile = _percentile(aggregation)
+            if quantile is not None:
+                result[aggregation] = grouped.quantile(quantile)
+            elif aggregation == "avg":
+                result[aggregation] = grouped.mean()
+            else:
+                result[aggregation] = getattr(grouped, aggregation)()
+        result = result.reset_index()
+        # back to plain Python types for the JSON response
+        return [
+            {column: (value.item() if hasattr(value, "item") else value) for column, value in row.items()}
+            for row in result.to_dict(orient="records")
+        ]
+
+    def _raw_query(self, query, start_ms, end_ms, device_id, device_metric_type_id):
+        # served by the (device_id, server_ts_ms) and server_ts_ms indexes
+        query = query.select_from(MetricValue)\
+            .join(MetricSnapshot, MetricValue.metric_snapshot_id == MetricSnapshot.metric_snapshot_id)\
+            .where(
+                MetricSnapshot.server_ts_ms >= start_ms,
+                MetricSnapshot.server_ts_ms < end_ms,
+                MetricValue.value.isnot(None)
+            )
+        if device_id is not None:
+            query = query.where(MetricSnapshot.device_id == device_id)
+        if device_metric_type_id is not None:
+            query = query.where(MetricValue.device_metric_type_id == device_metric_type_id)
+        return query
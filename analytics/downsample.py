@@ -0,0 +1,73 @@
+import numpy as np
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+def target_points(width_px, points_per_pixel=2, max_points=5000):
+    # more points than pixels cannot be drawn, so the chart width decides the budget
+    return int(max(2, min(width_px * points_per_pixel, max_points)))
+
+def downsample(x, y, n_out, method="lttb"):
+    if method == "lttb":
+        return lttb(x, y, n_out)
+    if method == "minmax":
+        return min_max(x, y, n_out)
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+def lttb(x, y, n_out):
+    # largest triangle three buckets, keeps the points that shape the line
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n:
+        return x, y
+    if n_out < 3:
+        # no room for a bucket between the fixed end points
+        return x[[0, n - 1]], y[[0, n - 1]]
+
+    # first and last points are fixed, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # average point of every bucket, for the "next bucket" corner of the triangle
+    bucket_sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    bucket_sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    bucket_sizes = np.diff(edges)
+    avg_x = np.append(bucket_sums_x / bucket_sizes, x[-1])
+    avg_y = np.append(bucket_sums_y / bucket_sizes, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # twice the triangle area, vectorized over the bucket
+        areas = np.abs(
+            (x[previous] - avg_x[bucket + 1]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y[bucket + 1] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return x[selected], y[selected]
+
+def min_max(x, y, n_out):
+    # min and max of every bucket, in time order, so spikes are never lost
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    n_buckets = n_out // 2
+    if n_out >= n:
+        return x, y
+    if n_buckets < 1:
+        return x[[0, n - 1]], y[[0, n - 1]]
+
+    bucket_size = -(-n // n_buckets)
+    padded = np.full(n_buckets * bucket_size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, bucket_size)
+    # trailing buckets can be pure padding when n is small
+    filled = ~np.all(np.isnan(padded), axis=1)
+    offsets = np.arange(n_buckets)[filled] * bucket_size
+    min_index = offsets + np.nanargmin(padded[filled], axis=1)
+    max_index = offsets + np.nanargmax(padded[filled], axis=1)
+
+    selected = np.unique(np.concatenate([min_index, max_index]))
+    return x[selected], y[selected]
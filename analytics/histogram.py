@@ -0,0 +1,58 @@
+from itertools import chain
+import numpy as np
+from sqlalchemy import select
+from db.models import MetricSnapshot, MetricValue
+
+def fetch_metric_values(session, device_id=None, start_ms=None, end_ms=None, chunk_size=50000,
+                        cold_storage=None):
+    # (device_metric_type_id, value) as two NumPy columns, never as ORM objects
+    type_ids, values = _fetch_hot_values(session, device_id, start_ms, end_ms, chunk_size)
+    if cold_storage is not None:
+        cold = cold_storage.read_values(["device_metric_type_id", "value"], device_id, None, start_ms, end_ms)
+        if len(cold["value"]):
+            type_ids = np.concatenate([cold["device_metric_type_id"], type_ids])
+            values = np.concatenate([cold["value"], values])
+    return type_ids, values
+
+def _fetch_hot_values(session, device_id, start_ms, end_ms, chunk_size):
+    query = select(MetricValue.device_metric_type_id, MetricValue.value)\
+        .where(MetricValue.value.isnot(None))
+    if device_id is not None or start_ms is not None or end_ms is not None:
+        query = query.join(MetricSnapshot, MetricValue.metric_snapshot_id == MetricSnapshot.metric_snapshot_id)
+        if device_id is not None:
+            query = query.where(MetricSnapshot.device_id == device_id)
+        if start_ms is not None:
+            query = query.where(MetricSnapshot.server_ts_ms >= start_ms)
+        if end_ms is not None:
+            query = query.where(MetricSnapshot.server_ts_ms < end_ms)
+
+    result = session.execute(query.execution_options(stream_results=True))
+    blocks = [
+        np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=2 * len(rows)).reshape(-1, 2)
+        for rows in result.partitions(chunk_size)
+    ]
+    if not blocks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    columns = np.concatenate(blocks)
+    return columns[:, 0].astype(np.int64), columns[:, 1]
+
+def compute_histograms(type_ids, values, bins=30, bin_width=None):
+    # one np.histogram per metric type over a single sorted copy of the data
+    histograms = {}
+    if len(values) == 0:
+        return histograms
+    order = np.argsort(type_ids, kind="stable")
+    type_ids = type_ids[order]
+    values = values[order]
+    unique_ids, starts = np.unique(type_ids, return_index=True)
+    for device_metric_type_id, group in zip(unique_ids, np.split(values, starts[1:])):
+        if bin_width:
+            low = np.floor(group.min() / bin_width) * bin_width
+            edges = np.arange(low, group.max() + bin_width, bin_width)
+            if len(edges) < 2:
+                edges = np.array([low, low + bin_width])
+            counts, edges = np.histogram(group, bins=edges)
+        else:
+            counts, edges = np.histogram(group, bins=bins)
+        histograms[int(device_metric_type_id)] = (counts, edges)
+    return histograms
@@ -0,0 +1,40 @@
+from itertools import chain
+import numpy as np
+from sqlalchemy import select
+from db.models import MetricSnapshot, MetricValue
+
+def fetch_series(session, device_metric_type_id, start_ms=None, end_ms=None, chunk_size=50000,
+                 cold_storage=None):
+    # (server_ts_ms, value) of one series in time order, as NumPy columns
+    ts_ms, values = _fetch_hot_series(session, device_metric_type_id, start_ms, end_ms, chunk_size)
+    if cold_storage is not None:
+        # tiered days are always older than anything still in SQLite
+        cold_ts_ms, cold_values = cold_storage.read_series(device_metric_type_id, start_ms, end_ms)
+        if len(cold_ts_ms):
+            ts_ms = np.concatenate([cold_ts_ms, ts_ms])
+            values = np.concatenate([cold_values, values])
+    return ts_ms, values
+
+def _fetch_hot_series(session, device_metric_type_id, start_ms, end_ms, chunk_size):
+    query = select(MetricSnapshot.server_ts_ms, MetricValue.value)\
+        .join(MetricSnapshot, MetricValue.metric_snapshot_id == MetricSnapshot.metric_snapshot_id)\
+        .where(
+            MetricValue.device_metric_type_id == device_metric_type_id,
+            MetricValue.value.isnot(None),
+            MetricSnapshot.server_ts_ms.isnot(None)
+        )
+    if start_ms is not None:
+        query = query.where(MetricSnapshot.server_ts_ms >= start_ms)
+    if end_ms is not None:
+        query = query.where(MetricSnapshot.server_ts_ms < end_ms)
+    query = query.order_by(MetricSnapshot.server_ts_ms, MetricSnapshot.metric_snapshot_id)
+
+    result = session.execute(query.execution_options(stream_results=True))
+    blocks = [
+        np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=2 * len(rows)).reshape(-1, 2)
+        for rows in result.partitions(chunk_size)
+    ]
+    if not blocks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    columns = np.concatenate(blocks)
+    return columns[:, 0].astype(np.int64), columns[:, 1]
@@ -0,0 +1,21 @@
+// opens one Server-Sent Events stream for the selected gauge series and
+// pushes every update into the gauge-live store, replacing interval polling
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    live: {
+        subscribe: function(subscription) {
+            if (window.liveUpdatesSource) {
+                window.liveUpdatesSource.close();
+                window.liveUpdatesSource = null;
+            }
+            if (!subscription || !subscription.url) {
+                return window.dash_clientside.no_update;
+            }
+            var source = new EventSource(subscription.url);
+            source.onmessage = function(event) {
+                window.dash_clientside.set_props("gauge-live", {data: JSON.parse(event.data)});
+            };
+            window.liveUpdatesSource = source;
+            return subscription.url;
+        }
+    }
+});
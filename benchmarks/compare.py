@@ -0,0 +1,38 @@
+# python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+import json
+import sys
+
+METRICS = [
+    ("p50 ms", lambda stats: stats["latency_ms"]["p50"], False),
+    ("p99 ms", lambda stats: stats["latency_ms"]["p99"], False),
+    ("req/s", lambda stats: stats["throughput_rps"], True)
+]
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+def change(before, after, higher_is_better):
+    if not before or after is None:
+        return ""
+    percent = (after - before) / before * 100
+    better = percent > 0 if higher_is_better else percent < 0
+    return f"{percent:+.1f}% {'better' if better else 'worse' if percent else ''}".rstrip()
+
+def compare(before, after):
+    lines = [f"before {before.get('git_commit')} {before['started']}  after {after.get('git_commit')} {after['started']}"]
+    if before["dataset"] != after["dataset"]:
+        lines.append("warning: the runs used different datasets")
+    for name in sorted(set(before["scenarios"]) & set(after["scenarios"])):
+        lines.append(name)
+        for label, metric, higher_is_better in METRICS:
+            old = metric(before["scenarios"][name])
+            new = metric(after["scenarios"][name])
+            lines.append(f"  {label:<8} {old:>10} -> {new:>10}  {change(old, new, higher_is_better)}")
+    lines.append(f"peak RSS MB {before['peak_rss_mb']['total']} -> {after['peak_rss_mb']['total']}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m benchmarks.compare <before.json> <after.json>")
+    print(compare(load(sys.argv[1]), load(sys.argv[2])))
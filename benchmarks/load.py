@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from db.timestamps import TIMESTAMP_FORMAT
+
+DASH_UPDATE = "/dash/_dash-update-component"
+
+def percentile(sorted_values, fraction):
+    # nearest rank on an already sorted list
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class Scenario:
+    # one request type, run(client, rng) returns the HTTP status
+    def __init__(self, name, dataset, endpoints):
+        self.name = name
+        self.dataset = dataset
+        self.endpoints = endpoints
+
+    def pick_series(self, rng):
+        device_id = rng.randrange(1, self.dataset.devices + 1)
+        device_metric_type_id, name = rng.choice(self.dataset.metric_types_by_device[device_id])
+        return device_id, device_metric_type_id, name
+
+class PostMetricSnapshot(Scenario):
+    def run(self, client, rng):
+        device_id = rng.randrange(1, self.dataset.devices + 1)
+        payload = {
+            "device_id": device_id,
+            "device_name": self.dataset.device_names[device_id],
+            "client_timestamp_utc": datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT),
+            "client_timezone_mins": 0,
+            "snapshots": [
+                {"device_metric_type_id": device_metric_type_id, "device_metric_type_name": name,
+                 "metric_value": round(rng.uniform(0, 100), 2)}
+                for device_metric_type_id, name in self.dataset.metric_types_by_device[device_id]
+            ]
+        }
+        return client.post(self.endpoints.post_metric_snapshot, json=payload).status_code
+
+class GaugeCallback(Scenario):
+    # update_gauge on a selection change, which goes through _update_gauge_callback
+    def run(self, client, rng):
+        device_id, _, name = self.pick_series(rng)
+        body = {
+            "output": "gauge.figure",
+            "outputs": {"id": "gauge", "property": "figure"},
+            "inputs": [
+                {"id": "device-dropdown", "property": "value", "value": self.dataset.device_names[device_id]},
+                {"id": "metric-dropdown", "property": "value", "value": name},
+                {"id": "gauge-live", "property": "data", "value": None}
+            ],
+            "state": [{"id": "gauge-subscription", "property": "data", "value": None}],
+            "changedPropIds": ["metric-dropdown.value"]
+        }
+        return client.post(DASH_UPDATE, json=body).status_code
+
+class TableCallback(Scenario):
+    # one page per request, each thread walks `pages` pages forward carrying the keyset cursors
+    # like the browser does, then starts over on page 1
+    pages = 5
+    outputs = [
+        ("records-table", "data"), ("page-number-display", "children"),
+        ("next-page", "disabled"), ("previous-page", "disabled"), ("current-page", "data")
+    ]
+
+    def __init__(self, name, dataset, endpoints):
+        super().__init__(name, dataset, endpoints)
+        self._state = threading.local()
+
+    def run(self, client, rng):
+        clicks = getattr(self._state, "clicks", 0)
+        current_page = getattr(self._state, "current_page", None) if clicks else None
+        body = {
+            "output": ".." + "...".join(f"{component}.{prop}" for component, prop in self.outputs) + "..",
+            "outputs": [{"id": component, "property": prop} for component, prop in self.outputs],
+            "inputs": [
+                {"id": "next-page", "property": "n_clicks", "value": clicks},
+                {"id": "previous-page", "property": "n_clicks", "value": 0}
+            ],
+            "state": [{"id": "current-page", "property": "data",
+                       "value": current_page or {"page": 1, "cursors": [None]}}],
+            "changedPropIds": ["next-page.n_clicks"] if clicks else []
+        }
+        response = client.post(DASH_UPDATE, json=body)
+        if response.status_code == 200:
+            self._state.current_page = response.get_json()["response"]["current-page"]["data"]
+            self._state.clicks = (clicks + 1) % self.pages
+        return response.status_code
+
+class HistogramCallback(Scenario):
+    ranges = [None, 3600000, 86400000]
+
+    def run(self, client, rng):
+        device_id, _, _ = self.pick_series(rng)
+        body = {
+            "output": "histogram.figure",
+            "outputs": {"id": "histogram", "property": "figure"},
+            "inputs": [
+                {"id": "url", "property": "pathname", "value": "/dash/histogram"},
+                {"id": "histogram-device-dropdown", "property": "value",
+                 "value": rng.choice([None, self.dataset.device_names[device_id]])},
+                {"id": "histogram-range-dropdown", "property": "value", "value": rng.choice(self.ranges)}
+            ],
+            "changedPropIds": ["url.pathname"]
+        }
+        return client.post(DASH_UPDATE, json=body).status_code
+
+SCENARIOS = {
+    "post_metric_snapshot": PostMetricSnapshot,
+    "gauge": GaugeCallback,
+    "table": TableCallback,
+    "histogram": HistogramCallback
+}
+
+def run_scenario(app, scenario, requests, concurrency, rng_seed=42):
+    # requests split across `concurrency` threads, each with its own test client
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(index, count):
+        client = app.test_client()
+        rng = random.Random(rng_seed + index)
+        local_latencies = []
+        local_statuses = {}
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                status = scenario.run(client, rng)
+            except Exception:
+                status = "exception"
+            local_latencies.append((time.perf_counter() - started) * 1000)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    counts = [requests // concurrency + (1 if index < requests % concurrency else 0) for index in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker, index, count) for index, count in enumerate(counts)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if status != 200)
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50": _round(percentile(latencies, 0.50)),
+            "p90": _round(percentile(latencies, 0.90)),
+            "p99": _round(percentile(latencies, 0.99)),
+            "max": _round(latencies[-1] if latencies else None)
+        }
+    }
+
+def _round(value):
+    return round(value, 3) if value is not None else None
@@ -0,0 +1,126 @@
+# python -m benchmarks.run [--devices 10 --metric-types 4 --snapshots 10000]
+#                          [--requests 500 --concurrency 4 --scenarios post_metric_snapshot,gauge,table,histogram]
+# seeds a local SQLite file, drives the app through the Flask test client and writes the results as JSON
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime
+from benchmarks.load import SCENARIOS, run_scenario
+from benchmarks.seed import Dataset, seed
+from lib_config.config import Config
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Seed a synthetic dataset and benchmark ingest and dashboard paths")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--metric-types", type=int, default=4, help="metric types per device")
+    parser.add_argument("--snapshots", type=int, default=10000, help="snapshots per device")
+    parser.add_argument("--interval-ms", type=int, default=10000, help="time between snapshots of one device")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--db", default=os.path.join(BENCHMARK_DIR, "data", "bench.db"))
+    parser.add_argument("--reuse", action="store_true", help="keep an existing --db seeded with the same sizes")
+    parser.add_argument("--config", default="lib_config/config.json", help="config the benchmark config is based on")
+    parser.add_argument("--output", default=None, help="results file, defaults to benchmarks/results/<time>.json")
+    return parser.parse_args(argv)
+
+def write_config(base_path, db_path, config_path):
+    # the app config pointed at the benchmark database, benchmark progress on the console,
+    # no per-request app logs and no background deletes
+    with open(base_path) as file:
+        config = json.load(file)
+    config["database"]["engine_string"] = f"sqlite:///{os.path.abspath(db_path)}?check_same_thread=False"
+    config["database"]["auto_migrate"] = True
+    # the seeded history is older than the tiering and retention windows
+    config["retention"]["enabled"] = False
+    config["cold_storage"]["enabled"] = False
+    config["logging_config"]["level"] = "INFO"
+    config["logging_config"]["console_output"]["level"] = "INFO"
+    config["logging_config"]["sampling"] = [{"logger": "main", "max_level": "INFO", "rate": 0}]
+    config["logging_config"]["file_output"]["enabled"] = False
+    os.makedirs(os.path.dirname(config_path), exist_ok=True)
+    with open(config_path, "w") as file:
+        json.dump(config, file, indent=4)
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenario_names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenario_names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}, choose from {', '.join(SCENARIOS)}")
+
+    # main builds the application at import time, so the config has to be in place first;
+    # it also sets up logging the way the app does
+    config_path = os.path.join(os.path.dirname(os.path.abspath(args.db)), "bench_config.json")
+    write_config(args.config, args.db, config_path)
+    os.environ["APP_CONFIG_PATH"] = config_path
+    Config()
+    logger = logging.getLogger("benchmarks")
+
+    if args.reuse and os.path.exists(args.db):
+        dataset = Dataset(args.db, args.devices, args.metric_types, args.snapshots, args.interval_ms)
+        for device_id in range(1, args.devices + 1):
+            dataset.device_names[device_id] = f"bench-device-{device_id}"
+            dataset.metric_types_by_device[device_id] = [
+                ((device_id - 1) * args.metric_types + index + 1, f"Metric{index + 1}")
+                for index in range(args.metric_types)
+            ]
+    else:
+        dataset = seed(logger, args.db, args.devices, args.metric_types, args.snapshots, args.interval_ms)
+    rss_after_seed = peak_rss_mb()
+
+    import main as app_main
+    endpoints = app_main.application.config.server.api.endpoints
+
+    results = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "dataset": dataset.summary(),
+        "concurrency": args.concurrency,
+        "scenarios": {},
+        "peak_rss_mb": {"after_seed": rss_after_seed}
+    }
+    for name in scenario_names:
+        scenario = SCENARIOS[name](name, dataset, endpoints)
+        if args.warmup:
+            run_scenario(app_main.app, scenario, args.warmup, args.concurrency)
+        stats = run_scenario(app_main.app, scenario, args.requests, args.concurrency)
+        stats["peak_rss_mb"] = peak_rss_mb()
+        results["scenarios"][name] = stats
+        logger.info("%-22s p50 %8.2f ms  p99 %8.2f ms  %8.1f req/s  errors %d",
+                    name, stats["latency_ms"]["p50"], stats["latency_ms"]["p99"],
+                    stats["throughput_rps"], stats["errors"])
+    results["peak_rss_mb"]["total"] = peak_rss_mb()
+
+    output = args.output or os.path.join(BENCHMARK_DIR, "results",
+                                         datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=4)
+    logger.info("Peak RSS %.1f MB, results written to %s", results["peak_rss_mb"]["total"], output)
+    return results
+
+if __name__ == "__main__":
+    main()
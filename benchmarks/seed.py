@@ -0,0 +1,120 @@
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, insert
+from db.migrations import Migrations
+from db.models import Device, DeviceMetricType, MetricSnapshot, MetricValue
+from db.rollups import Rollups, ROLLUP_RESOLUTIONS
+from db.timestamps import TIMESTAMP_FORMAT
+
+@dataclass
+class Dataset:
+    path: str
+    devices: int
+    metric_types: int  # per device
+    snapshots: int  # per device
+    interval_ms: int
+    # device_id -> device_name, device_id -> [(device_metric_type_id, name)]
+    device_names: dict = field(default_factory=dict)
+    metric_types_by_device: dict = field(default_factory=dict)
+    seed_seconds: float = 0.0
+
+    def summary(self):
+        return {
+            "path": self.path,
+            "devices": self.devices,
+            "metric_types_per_device": self.metric_types,
+            "snapshots_per_device": self.snapshots,
+            "metric_values": self.devices * self.metric_types * self.snapshots,
+            "interval_ms": self.interval_ms,
+            "seed_seconds": round(self.seed_seconds, 3)
+        }
+
+def seed(logger, path, devices=10, metric_types=4, snapshots=10000, interval_ms=10000,
+         batch_size=20000, rng_seed=42):
+    # fresh SQLite file, every device reports every metric type once per interval up to now
+    started = time.perf_counter()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    engine = create_engine(f"sqlite:///{path}")
+    Migrations(logger, engine).create_tables_and_indexes()
+
+    rng = random.Random(rng_seed)
+    dataset = Dataset(path, devices, metric_types, snapshots, interval_ms)
+    for device_id in range(1, devices + 1):
+        dataset.device_names[device_id] = f"bench-device-{device_id}"
+        dataset.metric_types_by_device[device_id] = [
+            ((device_id - 1) * metric_types + index + 1, f"Metric{index + 1}")
+            for index in range(metric_types)
+        ]
+
+    with engine.begin() as connection:
+        connection.execute(insert(Device.__table__), [
+            {"device_id": device_id, "device_name": name} for device_id, name in dataset.device_names.items()
+        ])
+        connection.execute(insert(DeviceMetricType.__table__), [
+            {"device_metric_type_id": device_metric_type_id, "device_id": device_id, "name": name}
+            for device_id, types in dataset.metric_types_by_device.items()
+            for device_metric_type_id, name in types
+        ])
+
+    # snapshots interleaved across devices in time order, like real traffic
+    end_ms = int(time.time() * 1000)
+    start_ms = end_ms - snapshots * interval_ms
+    snapshot_rows = []
+    value_rows = []
+    snapshot_id = 0
+    levels = {
+        device_metric_type_id: rng.uniform(10, 90)
+        for types in dataset.metric_types_by_device.values() for device_metric_type_id, _ in types
+    }
+    for step in range(snapshots):
+        for device_id in range(1, devices + 1):
+            snapshot_id += 1
+            ts_ms = start_ms + step * interval_ms + rng.randrange(interval_ms)
+            text = datetime.fromtimestamp(ts_ms / 1000, timezone.utc).strftime(TIMESTAMP_FORMAT)
+            snapshot_rows.append({
+                "metric_snapshot_id": snapshot_id,
+                "device_id": device_id,
+                "client_timestamp_utc": text,
+                "client_timezone_mins": 0,
+                "server_timestamp_utc": text,
+                "server_timezone_mins": 0,
+                "client_ts_ms": ts_ms,
+                "server_ts_ms": ts_ms
+            })
+            for device_metric_type_id, _ in dataset.metric_types_by_device[device_id]:
+                # bounded random walk so histograms and charts have some shape
+                level = min(100.0, max(0.0, levels[device_metric_type_id] + rng.gauss(0, 2)))
+                levels[device_metric_type_id] = level
+                value_rows.append({
+                    "metric_snapshot_id": snapshot_id,
+                    "device_metric_type_id": device_metric_type_id,
+                    "value": round(level, 2)
+                })
+        if len(value_rows) >= batch_size:
+            _flush(engine, snapshot_rows, value_rows)
+    _flush(engine, snapshot_rows, value_rows)
+
+    # latest values and rollups are derived the same way a migrated production database gets them
+    Migrations(logger, engine).run()
+    rollups = Rollups(logger, list(ROLLUP_RESOLUTIONS))
+    rollups.start_coverage(engine)
+    rollups.backfill(engine)
+    engine.dispose()
+    dataset.seed_seconds = time.perf_counter() - started
+    logger.info("Seeded %s in %.1fs", path, dataset.seed_seconds)
+    return dataset
+
+def _flush(engine, snapshot_rows, value_rows):
+    with engine.begin() as connection:
+        if snapshot_rows:
+            connection.execute(insert(MetricSnapshot.__table__), snapshot_rows)
+        if value_rows:
+            connection.execute(insert(MetricValue.__table__), value_rows)
+    snapshot_rows.clear()
+    value_rows.clear()
@@ -0,0 +1,444 @@
+import dash
+from dash import dcc, html, dash_table
+import plotly.graph_objects as go
+from db.metrics import format_metric_rows
+from db.models import DeviceMetricType, Device
+from managers.database_manager import DatabaseManager
+from analytics.histogram import fetch_metric_values, compute_histograms
+from datetime import datetime
+
+# set by init_dashboard, the callbacks only run once the application exists
+application = None
+
+def init_dashboard(server, app_instance):
+    # mounts the Dash UI on the Flask server, API-only workers never import this module
+    global application
+    application = app_instance
+    dash_app = dash.Dash(__name__, server=server, url_base_pathname='/dash/')
+    dash_app.layout = html.Div([
+        dcc.Location(id="url", refresh=False),
+        html.Div(id="page-content")
+    ])
+    return dash_app
+
+def get_device_options():
+    session = None
+    try:
+        cached_devices = application.identity_cache.list_devices()
+        if cached_devices is not None:
+            return [{'label': device_name, 'value': device_name} for _, device_name in cached_devices]
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            devices = session.query(Device.device_name).all()
+            return [{'label': device[0], 'value': device[0]} for device in devices]
+    except Exception as e:
+        application.logger.error(f"Error fetching devices: {e}")
+        return []
+
+
+# dash layout
+def gauge_page():
+    device_options = get_device_options()
+    return html.Div([
+        html.H1("Gauge Dashboard"),
+        dcc.Link("Go to Table", href="/dash/table"),
+        html.Br(),
+        dcc.Link("Go to Histogram", href="/dash/histogram"),
+        html.Br(),
+        dcc.Dropdown(
+            id='device-dropdown',
+            options=device_options,
+            value=device_options[0]['value'] if device_options else None,
+            placeholder="Select a device",
+            style={'width': '50%'}
+        ),
+        dcc.Dropdown(
+            id='metric-dropdown',
+            options=[],
+            placeholder="Select a metric",
+            style={'width': '50%'}
+        ),
+        dcc.Graph(id="gauge"),
+        dcc.Graph(id="series-chart"),
+        # new values are pushed over Server-Sent Events (assets/live_updates.js) instead of polling
+        dcc.Store(id="gauge-subscription"),
+        dcc.Store(id="gauge-live"),
+        dcc.Store(id="gauge-stream-url")
+    ])
+
+def table_page():
+    return html.Div([
+        html.H1("Table Dashboard"),
+        dcc.Link("Go to Gauge", href="/dash/gauge"),
+        html.Br(),
+        dcc.Link("Go to Histogram", href="/dash/histogram"),
+        html.Br(),
+        html.A(html.Button('Refresh Data'),href='/dash/table'),
+        html.Br(),
+        dash_table.DataTable(
+            id="records-table",
+            columns=[
+                {"name": col, "id": col}
+                for col in [
+                    "metric_snapshot_id", "device_id", "device_name",
+                    "metric_type_id", "metric_type_name", "metric_value",
+                    "timestamp_utc"
+                ]
+            ],
+            data=[],
+        ),
+        html.Div(id="page-number-display", children="Page 1 of X"),
+        html.Button("Previous", id="previous-page", n_clicks=0, disabled=True),
+        html.Button("Next", id="next-page", n_clicks=0, disabled=True),
+        dcc.Store(id="current-page", data={"page": 1, "cursors": [None]}),  # page number and keyset cursors
+    ])
+
+def histogram_page():
+    device_options = get_device_options()
+    return html.Div([
+        html.H1("Histogram Dashboard"),
+        dcc.Link("Go to Gauge", href="/dash/gauge"),
+        html.Br(),
+        dcc.Link("Go to Table", href="/dash/table"),
+        html.Br(),
+        dcc.Dropdown(
+            id='histogram-device-dropdown',
+            options=device_options,
+            placeholder="All devices",
+            style={'width': '50%'}
+        ),
+        dcc.Dropdown(
+            id='histogram-range-dropdown',
+            options=[
+                {'label': 'Last hour', 'value': 60 * 60 * 1000},
+                {'label': 'Last day', 'value': 24 * 60 * 60 * 1000},
+                {'label': 'Last week', 'value': 7 * 24 * 60 * 60 * 1000},
+            ],
+            placeholder="All time",
+            style={'width': '50%'}
+        ),
+        dcc.Graph(id="histogram")
+    ])
+
+# current page callback
+@dash.callback(
+    dash.dependencies.Output("page-content", "children"),
+    [dash.dependencies.Input("url", "pathname")]
+)
+def display_page(pathname):
+    if pathname == "/dash/gauge":
+        return gauge_page()
+    elif pathname == "/dash/table":
+        return table_page()
+    elif pathname == "/dash/histogram":
+        return histogram_page()
+    else:
+        # 404 page
+        return html.Div([
+            html.H1("404 - Page Not Found"),
+            dcc.Link("Go to Gauge", href="/dash/gauge"),
+            html.Br(),
+            dcc.Link("Go to Table", href="/dash/table"),
+            html.Br(),
+            dcc.Link("Go to Histogram", href="/dash/histogram"),
+        ])
+
+# gauge callback
+@dash.callback(
+    dash.dependencies.Output("gauge", "figure"),
+    [
+        dash.dependencies.Input("device-dropdown", "value"),
+        dash.dependencies.Input("metric-dropdown", "value"),
+        dash.dependencies.Input("gauge-live", "data")
+    ],
+    [
+        dash.dependencies.State("gauge-subscription", "data")
+    ]
+)
+
+def update_gauge(device_name, metric_type, live, subscription):
+    # pushed updates carry the value, so only a selection change reads the database
+    ctx = dash.callback_context
+    triggered = ctx.triggered[0]["prop_id"].split(".")[0] if ctx.triggered else None
+    if triggered == "gauge-live" and live and subscription \
+            and live["device_metric_type_id"] == subscription["device_metric_type_id"]:
+        return gauge_figure(live["value"], metric_type,
+                            _thresholds(subscription["device_id"], subscription["device_metric_type_id"]))
+    return _update_gauge_callback(device_name, metric_type)
+
+# subscription callback, the stream url for the selected series
+@dash.callback(
+    dash.dependencies.Output("gauge-subscription", "data"),
+    [
+        dash.dependencies.Input("device-dropdown", "value"),
+        dash.dependencies.Input("metric-dropdown", "value")
+    ]
+)
+def update_gauge_subscription(device_name, metric_type):
+    try:
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            device_id, device_metric_type_id = application.identity_cache.resolve_series(session, device_name, metric_type)
+    except Exception as e:
+        application.logger.error(f"Error resolving series: {e}")
+        return None
+    if device_metric_type_id is None:
+        return None
+    return {
+        "device_id": device_id,
+        "device_metric_type_id": device_metric_type_id,
+        "url": f"{application.config.server.api.endpoints.stream_latest_values}?series={device_id}:{device_metric_type_id}"
+    }
+
+dash.clientside_callback(
+    dash.dependencies.ClientsideFunction(namespace="live", function_name="subscribe"),
+    dash.dependencies.Output("gauge-stream-url", "data"),
+    [dash.dependencies.Input("gauge-subscription", "data")]
+)
+
+def _update_gauge_callback(device_name, metric_type):
+    session = None
+    latest_metric_value = None
+    final_value = 0
+    thresholds = []
+    try:
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            device_id, device_metric_type_id = application.identity_cache.resolve_series(session, device_name, metric_type)
+            if device_metric_type_id is not None:
+                thresholds = _thresholds(device_id, device_metric_type_id)
+                recent = application.ring_buffers.latest(device_metric_type_id) \
+                    if application.ring_buffers is not None else None
+                if recent is not None:
+                    latest_metric_value = (recent[1], recent[2])
+                else:
+                    # point lookup in latest_metric_values instead of scanning the history
+                    latest = application.data.getLatestValue(session, device_id, device_metric_type_id)
+                    latest_metric_value = (latest.value, latest.metric_snapshot_id) if latest else None
+    
+    except Exception as e:
+        application.logger.error(f"Error fetching data: {e}")
+        final_value = 0
+
+    if latest_metric_value:
+        final_value = latest_metric_value[0]
+    else:
+        final_value = 0
+
+    return gauge_figure(final_value, metric_type, thresholds)
+
+def _thresholds(device_id, device_metric_type_id):
+    if application.alerts is None:
+        return []
+    return application.alerts.thresholds(device_id, device_metric_type_id)
+
+def gauge_figure(value, metric_type, thresholds=()):
+    # update the gauge figure, alert thresholds are drawn as a red line
+    bounds = [value or 0, *thresholds]
+    gauge = {"axis": {"range": [min(0, *bounds), max(100, *bounds)]}}
+    if thresholds:
+        gauge["threshold"] = {"line": {"color": "red", "width": 4}, "thickness": 0.75, "value": thresholds[0]}
+    fig = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=value,
+        title={"text": f"{metric_type} Value"},
+        gauge=gauge
+    ))
+    return fig
+
+# series callback
+@dash.callback(
+    dash.dependencies.Output("series-chart", "figure"),
+    [
+        dash.dependencies.Input("device-dropdown", "value"),
+        dash.dependencies.Input("metric-dropdown", "value")
+    ]
+)
+def update_series_chart(device_name, metric_type):
+    try:
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            _, device_metric_type_id = application.identity_cache.resolve_series(session, device_name, metric_type)
+            if device_metric_type_id is None:
+                return {"data": [], "layout": {"title": "Select a metric"}}
+            end_ms = int(datetime.now().timestamp() * 1000)
+            start_ms = end_ms - application.config.downsample.dashboard_window_ms
+            _, ts_ms, values = application.build_series(session, device_metric_type_id, start_ms, end_ms,
+                                                        application.config.downsample.default_width_px)
+
+        return {
+            "data": [go.Scattergl(
+                x=ts_ms,  # epoch milliseconds, plotted by a date axis
+                y=values,
+                mode="lines",
+                name=metric_type
+            )],
+            "layout": go.Layout(
+                title=f"{metric_type} over time",
+                xaxis={"title": "Time (UTC)", "type": "date"},
+                yaxis={"title": "Metric Value"}
+            )
+        }
+    except Exception as e:
+        application.logger.error(f"Error fetching series: {e}")
+        return {"data": [], "layout": {"title": "Error loading series"}}
+
+# metrics callback
+@dash.callback(
+    dash.dependencies.Output("metric-dropdown", "options"),
+    [dash.dependencies.Input("device-dropdown", "value")]
+)
+def update_metrics_dropdown(device_name):
+    # updating the metrics dropdown options based on the selected device
+    session = None
+    try:
+        # served from the identity cache when it holds every device and type
+        device_id = application.identity_cache.get_device_id(device_name)
+        cached_metrics = application.identity_cache.list_metric_types(device_id) if device_id is not None else None
+        if cached_metrics is not None:
+            return [{'label': name, 'value': name} for _, name in cached_metrics]
+
+        # getting metrics types for the selected device
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            metrics = session.query(DeviceMetricType.name)\
+                .join(Device, DeviceMetricType.device_id == Device.device_id)\
+                .filter(Device.device_name == device_name)\
+                .all()
+            
+            # format results for the dropdown
+            metric_options = [{'label': metric[0], 'value': metric[0]} for metric in metrics]
+            return metric_options
+    except Exception as e:
+        application.logger.error(f"Error fetching metrics for device '{device_name}': {e}")
+        return []
+
+def get_total_records(session):
+    try:
+        # cached count of table rows, kept current by the ingest path
+        return application.row_count.count(session)
+    except Exception as e:
+        print(f"Error calculating total records: {e}")
+        return 0
+
+def fetch_metric_details_paginated(session, cursor=None, page_size=20):
+    try:
+        # keyset paginated query, cost does not grow with the page number
+        rows, next_cursor = application.data.getMetricValuesPage(session, cursor, page_size)
+        return format_metric_rows(rows), next_cursor
+
+    except Exception as e:
+        print(f"Error fetching metric details: {e}")
+        return [], None
+
+# table callback
+@dash.callback(
+    [
+        dash.dependencies.Output("records-table", "data"),
+        dash.dependencies.Output("page-number-display", "children"),
+        dash.dependencies.Output("next-page", "disabled"),
+        dash.dependencies.Output("previous-page", "disabled"),
+        dash.dependencies.Output("current-page", "data")
+    ],
+    [
+        dash.dependencies.Input("next-page", "n_clicks"),
+        dash.dependencies.Input("previous-page", "n_clicks")
+    ],
+    [
+        dash.dependencies.State("current-page", "data")
+    ]
+)
+def update_table(next_clicks, previous_clicks, current_page):
+    # cursors[n] is the keyset cursor that starts page n + 1
+    current_page = current_page or {"page": 1, "cursors": [None]}
+    page = current_page["page"]
+    cursors = current_page["cursors"]
+    page_size = 20  # number of records per page
+
+    # find which button was clicked and update page number accordingly
+    ctx = dash.callback_context
+    if ctx.triggered:
+        button_id = ctx.triggered[0]["prop_id"].split(".")[0]
+        if button_id == "next-page" and page < len(cursors):
+            page += 1
+        elif button_id == "previous-page" and page > 1:
+            page -= 1
+
+    try:
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            # number of total records
+            total_records = get_total_records(session)
+            max_page = max(1, (total_records + page_size - 1) // page_size)  # formula for page number calculation
+            
+            # fetch data for the current page
+            data, next_cursor = fetch_metric_details_paginated(session, cursors[page - 1], page_size)
+            cursors = cursors[:page] + ([next_cursor] if next_cursor else [])
+            
+            # determine whether buttons should be disabled
+            disable_next = next_cursor is None
+            disable_previous = page <= 1
+            
+            application.logger.debug("Page: %d, Max Page: %d, Next: %s, Previous: %s",
+                                     page, max_page, disable_next, disable_previous)
+
+        return data, f"Page {page} of {max_page}", disable_next, disable_previous, {"page": page, "cursors": cursors}
+    except Exception as e:
+        print(f"Error updating table: {e}")
+        return [], "Error loading data", True, True, current_page
+
+@dash.callback(
+    dash.dependencies.Output("histogram", "figure"),
+    [
+        dash.dependencies.Input("url", "pathname"),  # trigger when the page is loaded
+        dash.dependencies.Input("histogram-device-dropdown", "value"),
+        dash.dependencies.Input("histogram-range-dropdown", "value")
+    ]
+)
+def update_histogram(pathname, device_name=None, range_ms=None):
+    if pathname != "/dash/histogram":
+        return dash.no_update
+    
+    try:
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            device_id = None
+            if device_name:
+                # an unknown device has nothing to plot, -1 never matches
+                device_id = application.identity_cache.resolve_device_id(session, device_name)
+                device_id = -1 if device_id is None else device_id
+            start_ms = int(datetime.now().timestamp() * 1000) - range_ms if range_ms else None
+
+            # values come back as NumPy columns and only the bin counts go to the browser
+            type_ids, values = fetch_metric_values(session, device_id, start_ms,
+                                                   cold_storage=application.cold_storage)
+            histograms = compute_histograms(type_ids, values,
+                                            application.config.histogram.bins,
+                                            application.config.histogram.bin_width)
+            names_by_type = dict(
+                session.query(DeviceMetricType.device_metric_type_id, DeviceMetricType.name)
+                .filter(DeviceMetricType.device_metric_type_id.in_(list(histograms)))
+                .all()
+            )
+
+        # creating one bar trace per metric type
+        traces = []
+        for metric_type_id, (counts, edges) in histograms.items():
+            traces.append(go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=counts,
+                width=edges[1:] - edges[:-1],
+                opacity=0.6,
+                name=f"Metric Type {names_by_type.get(metric_type_id, metric_type_id)}"
+            ))
+
+        # layout
+        layout = go.Layout(
+            title="Metric Value Distribution by Metric Type",
+            xaxis={"title": "Metric Value"},
+            yaxis={"title": "Count"},
+            legend={"title": "Metric Types"},
+            barmode="overlay"
+        )
+
+        return {"data": traces, "layout": layout}
+
+    except Exception as e:
+        print(f"Error fetching data for histogram: {e}")
+        return {
+            "data": [],
+            "layout": {"title": "Error loading histogram"}
+        }
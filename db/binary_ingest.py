@@ -0,0 +1,70 @@
+import math
+import struct
+from datetime import datetime, timezone
+from .ingest import SnapshotRecord
+from .timestamps import TIMESTAMP_FORMAT
+
+# Content-Type of the compact ingest body, names are registered once and never sent here
+BINARY_MIMETYPE = "application/vnd.metrics.snapshots"
+
+# body:     magic "MS", version byte, then snapshots back to back
+# snapshot: device_id u32, client_ts_ms i64, client_timezone_mins i16, value count u16
+# value:    device_metric_type_id u32, value f64 (NaN for null)
+MAGIC = b"MS\x01"
+SNAPSHOT = struct.Struct("<IqhH")
+VALUE = struct.Struct("<Id")
+
+def encode_snapshots(snapshots):
+    # (device_id, client_ts_ms, client_timezone_mins, [(device_metric_type_id, value), ...]) -> bytes
+    parts = [MAGIC]
+    for device_id, client_ts_ms, client_timezone_mins, values in snapshots:
+        parts.append(SNAPSHOT.pack(device_id, client_ts_ms, client_timezone_mins, len(values)))
+        parts.extend(VALUE.pack(device_metric_type_id, math.nan if value is None else value)
+                     for device_metric_type_id, value in values)
+    return b"".join(parts)
+
+def iter_snapshot_records(stream):
+    # SnapshotRecords read one snapshot at a time off a file-like body, so memory stays bounded by
+    # the largest single snapshot; a bad header fails here, framing errors while iterating
+    if _read(stream, len(MAGIC)) != MAGIC:
+        raise ValueError("Not a version 1 binary snapshot body")
+    return _iter_records(stream)
+
+def _read(stream, size):
+    # request streams may return short reads before the end of the body
+    parts = []
+    while size > 0:
+        part = stream.read(size)
+        if not part:
+            break
+        parts.append(part)
+        size -= len(part)
+    return b"".join(parts)
+
+def _iter_records(stream):
+    offset = len(MAGIC)
+    while True:
+        header = _read(stream, SNAPSHOT.size)
+        if not header:
+            return
+        if len(header) < SNAPSHOT.size:
+            raise ValueError(f"Truncated snapshot header at byte {offset}")
+        device_id, client_ts_ms, client_timezone_mins, count = SNAPSHOT.unpack(header)
+        offset += SNAPSHOT.size
+        body = _read(stream, count * VALUE.size)
+        if len(body) < count * VALUE.size:
+            raise ValueError(f"Truncated values at byte {offset}")
+        record = SnapshotRecord(
+            device_id=device_id,
+            # names come from the registry, BulkIngest rejects ids that were never registered
+            device_name=None,
+            client_timestamp_utc=datetime.fromtimestamp(client_ts_ms / 1000, timezone.utc).strftime(TIMESTAMP_FORMAT),
+            client_timezone_mins=client_timezone_mins,
+            client_ts_ms=client_ts_ms
+        )
+        record.values = [
+            (device_metric_type_id, None, None if value != value else value)
+            for device_metric_type_id, value in VALUE.iter_unpack(body)
+        ]
+        offset += len(body)
+        yield record
@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+import numpy as np
+from sqlalchemy import delete, func, select
+from .models import MetricSnapshot, MetricValue
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# same order as the export columns, client_ts_ms is nullable so it is kept as float64 with NaN
+SNAPSHOT_COLUMNS = {
+    "metric_snapshot_id": np.int64,
+    "device_id": np.int64,
+    "client_timestamp_utc": np.str_,
+    "client_timezone_mins": np.int32,
+    "server_timestamp_utc": np.str_,
+    "server_timezone_mins": np.int32,
+    "client_ts_ms": np.float64,
+    "server_ts_ms": np.int64
+}
+
+# denormalised so series, histogram and aggregate reads never touch the snapshot files
+VALUE_COLUMNS = {
+    "metric_snapshot_id": np.int64,
+    "device_id": np.int64,
+    "device_metric_type_id": np.int64,
+    "server_ts_ms": np.int64,
+    "value": np.float64
+}
+
+class ColdStorage:
+    # one directory per UTC day holding a .npy file per column, read back memory mapped
+    # snapshots are sorted by (server_ts_ms, metric_snapshot_id),
+    # values by (device_metric_type_id, server_ts_ms, metric_snapshot_id)
+    def __init__(self, logger, path, batch_size=1000):
+        self.logger = logger
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(self.path, exist_ok=True)
+        self._listing = (None, [])
+
+    def partitions(self, start_ms=None, end_ms=None):
+        # day start of every complete partition overlapping [start_ms, end_ms)
+        days = self._days()
+        return [
+            day for day in days
+            if (start_ms is None or day + DAY_MS > start_ms) and (end_ms is None or day < end_ms)
+        ]
+
+    def _days(self):
+        # the listing only changes when a partition directory is renamed in or removed
+        mtime = os.stat(self.path).st_mtime_ns
+        if self._listing[0] != mtime:
+            days = []
+            for name in os.listdir(self.path):
+                # skips the .tmp / .old directories of a partition being rewritten
+                if "." not in name and os.path.exists(os.path.join(self.path, name, "meta.json")):
+                    days.append(int(datetime.strptime(name, "%Y-%m-%d")
+                                    .replace(tzinfo=timezone.utc).timestamp() * 1000))
+            self._listing = (mtime, sorted(days))
+        return self._listing[1]
+
+    def _directory(self, day_ms):
+        name = datetime.fromtimestamp(day_ms / 1000, timezone.utc).strftime("%Y-%m-%d")
+        return os.path.join(self.path, name)
+
+    def _load(self, day_ms, table, column):
+        return np.load(os.path.join(self._directory(day_ms), f"{table}.{column}.npy"), mmap_mode="r")
+
+    def read_values(self, columns, device_id=None, device_metric_type_id=None, start_ms=None, end_ms=None):
+        # only the requested column files are opened, non null values in partition order
+        blocks = {column: [] for column in columns}
+        for day in self.partitions(start_ms, end_ms):
+            low, high = 0, None
+            if device_metric_type_id is not None:
+                type_ids = self._load(day, "values", "device_metric_type_id")
+                low = int(np.searchsorted(type_ids, device_metric_type_id, "left"))
+                high = int(np.searchsorted(type_ids, device_metric_type_id, "right"))
+                if low == high:
+                    continue
+            values = self._load(day, "values", "value")[low:high]
+            mask = ~np.isnan(values)
+            if start_ms is not None or end_ms is not None:
+                ts_ms = self._load(day, "values", "server_ts_ms")[low:high]
+                if start_ms is not None:
+                    mask &= ts_ms >= start_ms
+                if end_ms is not None:
+                    mask &= ts_ms < end_ms
+            if device_id is not None:
+                mask &= self._load(day, "values", "device_id")[low:high] == device_id
+            for column in columns:
+                blocks[column].append(self._load(day, "values", column)[low:high][mask])
+        return {
+            column: np.concatenate(blocks[column]) if blocks[column] else np.empty(0, VALUE_COLUMNS[column])
+            for column in columns
+        }
+
+    def read_series(self, device_metric_type_id, start_ms=None, end_ms=None):
+        # same shape as analytics.series.fetch_series, already in time order
+        columns = self.read_values(["server_ts_ms", "value"], None, device_metric_type_id, start_ms, end_ms)
+        return columns["server_ts_ms"], columns["value"]
+
+    def iter_snapshots(self, device_id=None, start_ms=None, end_ms=None, limit=None, chunk_size=1000):
+        # export rows as tuples in SNAPSHOT_COLUMNS order, chunk by chunk
+        remaining = limit
+        for day in self.partitions(start_ms, end_ms):
+            ts_ms = self._load(day, "snapshots", "server_ts_ms")
+            low = int(np.searchsorted(ts_ms, start_ms, "left")) if start_ms is not None else 0
+            high = int(np.searchsorted(ts_ms, end_ms, "left")) if end_ms is not None else len(ts_ms)
+            indexes = np.arange(low, high)
+            if device_id is not None:
+                indexes = indexes[self._load(day, "snapshots", "device_id")[low:high] == device_id]
+            if remaining is not None:
+                indexes = indexes[:remaining]
+                remaining -= len(indexes)
+            columns = {column: self._load(day, "snapshots", column) for column in SNAPSHOT_COLUMNS}
+            for offset in range(0, len(indexes), chunk_size):
+                chunk = indexes[offset:offset + chunk_size]
+                client_ts_ms = columns["client_ts_ms"][chunk]
+                yield list(zip(
+                    *[columns[column][chunk].tolist() for column in list(SNAPSHOT_COLUMNS)[:6]],
+                    [None if np.isnan(ts) else int(ts) for ts in client_ts_ms],
+                    columns["server_ts_ms"][chunk].tolist()
+                ))
+            if remaining == 0:
+                return
+
+    def tier(self, engine, cutoff_ms):
+        # moves every whole UTC day before cutoff_ms out of SQLite, returns (snapshots, values) moved
+        cutoff_ms -= cutoff_ms % DAY_MS
+        moved_snapshots = 0
+        moved_values = 0
+        while True:
+            with engine.connect() as connection:
+                oldest = connection.execute(
+                    select(func.min(MetricSnapshot.server_ts_ms)).where(MetricSnapshot.server_ts_ms < cutoff_ms)
+                ).scalar()
+            if oldest is None:
+                break
+            day = oldest - oldest % DAY_MS
+            snapshots, values = self._read_day(engine, day)
+            self._write_partition(day, snapshots, values)
+            # the files are complete before anything is deleted, a crash in between is deduplicated next run
+            snapshot_count, value_count = self._delete(engine, snapshots["metric_snapshot_id"])
+            moved_snapshots += snapshot_count
+            moved_values += value_count
+            self.logger.info("Tiered %d snapshots and %d values to %s",
+                             snapshot_count, value_count, self._directory(day))
+        return moved_snapshots, moved_values
+
+    def drop_before(self, cutoff_ms):
+        # removes partitions that end on or before cutoff_ms, returns the number of values dropped
+        dropped = 0
+        for day in self.partitions(None, cutoff_ms):
+            if day + DAY_MS > cutoff_ms:
+                continue
+            directory = self._directory(day)
+            with open(os.path.join(directory, "meta.json")) as file:
+                dropped += json.load(file)["values"]
+            shutil.rmtree(directory)
+            self.logger.info("Dropped cold partition %s", directory)
+        return dropped
+
+    def _read_day(self, engine, day):
+        snapshot_columns = MetricSnapshot.__table__.c
+        with engine.connect() as connection:
+            snapshots = self._read_columns(connection, SNAPSHOT_COLUMNS,
+                select(*[snapshot_columns[column] for column in SNAPSHOT_COLUMNS])
+                .where(snapshot_columns.server_ts_ms >= day, snapshot_columns.server_ts_ms < day + DAY_MS)
+            )
+            values = self._read_columns(connection, VALUE_COLUMNS,
+                select(MetricValue.metric_snapshot_id, MetricSnapshot.device_id,
+                       MetricValue.device_metric_type_id, MetricSnapshot.server_ts_ms, MetricValue.value)
+                .join(MetricSnapshot, MetricValue.metric_snapshot_id == MetricSnapshot.metric_snapshot_id)
+                .where(MetricSnapshot.server_ts_ms >= day, MetricSnapshot.server_ts_ms < day + DAY_MS)
+            )
+        return snapshots, values
+
+    def _read_columns(self, connection, columns, statement):
+        # streamed batch_size rows at a time, only the column arrays of a day are ever held in full
+        result = connection.execution_options(stream_results=True, max_row_buffer=self.batch_size).execute(statement)
+        chunks = [_to_columns(rows, columns) for rows in result.partitions(self.batch_size)]
+        if not chunks:
+            return _to_columns([], columns)
+        return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in columns}
+
+    def _write_partition(self, day, snapshots, values):
+        directory = self._directory(day)
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            # late rows for a day already on disk, merged and deduplicated by key
+            snapshots = _merge(snapshots, self._read_all(day, "snapshots", SNAPSHOT_COLUMNS), ["metric_snapshot_id"])
+            values = _merge(values, self._read_all(day, "values", VALUE_COLUMNS),
+                            ["metric_snapshot_id", "device_metric_type_id"])
+        snapshots = _sort(snapshots, ["server_ts_ms", "metric_snapshot_id"])
+        values = _sort(values, ["device_metric_type_id", "server_ts_ms", "metric_snapshot_id"])
+
+        # written beside the partition and renamed in, readers never see half a day
+        staging = directory + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for table, columns in (("snapshots", snapshots), ("values", values)):
+            for column, array in columns.items():
+                np.save(os.path.join(staging, f"{table}.{column}.npy"), array)
+        with open(os.path.join(staging, "meta.json"), "w") as file:
+            json.dump({"day_ms": day, "snapshots": len(snapshots["metric_snapshot_id"]),
+                       "values": len(values["metric_snapshot_id"])}, file)
+        if os.path.exists(directory):
+            retired = directory + ".old"
+            shutil.rmtree(retired, ignore_errors=True)
+            os.rename(directory, retired)
+            os.rename(staging, directory)
+            shutil.rmtree(retired)
+        else:
+            os.rename(staging, directory)
+
+    def _read_all(self, day, table, columns):
+        return {column: np.array(self._load(day, table, column)) for column in columns}
+
+    def _delete(self, engine, snapshot_ids):
+        snapshot_count = 0
+        value_count = 0
+        snapshot_ids = snapshot_ids.tolist()
+        for offset in range(0, len(snapshot_ids), self.batch_size):
+            batch = snapshot_ids[offset:offset + self.batch_size]
+            with engine.begin() as connection:
+                value_count += connection.execute(
+                    delete(MetricValue).where(MetricValue.metric_snapshot_id.in_(batch))
+                ).rowcount
+                snapshot_count += connection.execute(
+                    delete(MetricSnapshot).where(MetricSnapshot.metric_snapshot_id.in_(batch))
+                ).rowcount
+        return snapshot_count, value_count
+
+def _to_columns(rows, columns):
+    transposed = list(zip(*rows)) or [()] * len(columns)
+    arrays = {}
+    for (column, dtype), data in zip(columns.items(), transposed):
+        if dtype is np.str_:
+            arrays[column] = np.array(data, dtype=np.str_)
+        else:
+            # None becomes NaN for the float columns
+            arrays[column] = np.array(data, dtype=dtype)
+    return arrays
+
+def _merge(new, existing, keys):
+    merged = {column: np.concatenate([new[column], existing[column]]) for column in new}
+    # np.unique keeps the first occurrence, so freshly read rows win
+    _, first = np.unique(np.stack([merged[key] for key in keys]), axis=1, return_index=True)
+    return {column: array[first] for column, array in merged.items()}
+
+def _sort(columns, keys):
+    order = np.lexsort([columns[key] for key in reversed(keys)])
+    return {column: array[order] for column, array in columns.items()}
+
+if __name__ == "__main__":
+    # python -m db.cold_storage tier
+    import sys
+    import time
+    from lib_config.config import Config
+    from managers.connection_manager import ConnectionManager
+    if sys.argv[1:] != ["tier"]:
+        sys.exit("usage: python -m db.cold_storage tier")
+    config = Config()
+    connection_manager = ConnectionManager(logging.getLogger(__name__), config.database)
+    ColdStorage(logging.getLogger(__name__), config.cold_storage.path, config.retention.batch_size).tier(
+        connection_manager.engine, int(time.time() * 1000) - config.retention.raw_days * DAY_MS)
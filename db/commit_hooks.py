@@ -0,0 +1,23 @@
+import logging
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_CALLBACKS_KEY = "after_commit_callbacks"
+
+logger = logging.getLogger(__name__)
+
+def on_commit(session, callback):
+    # run callback once the session's transaction commits, dropped if it rolls back
+    session.info.setdefault(_CALLBACKS_KEY, []).append(callback)
+
+@event.listens_for(Session, "after_commit")
+def _run_callbacks(session):
+    for callback in session.info.pop(_CALLBACKS_KEY, []):
+        try:
+            callback()
+        except Exception as e:
+            logger.error("After commit callback failed: %s", e)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_callbacks(session, previous_transaction):
+    session.info.pop(_CALLBACKS_KEY, None)
@@ -0,0 +1,313 @@
+import math
+from collections import namedtuple
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import Device, DeviceMetricType, LatestMetricValue, MetricSnapshot, MetricValue
+from .commit_hooks import on_commit
+from .timestamps import TIMESTAMP_FORMAT, to_epoch_ms
+
+@dataclass
+class SnapshotRecord:
+    device_id: int
+    device_name: str
+    client_timestamp_utc: str
+    client_timezone_mins: int
+    # (device_metric_type_id, device_metric_type_name, metric_value)
+    values: list = field(default_factory=list)
+    # set by decoders that already have epoch milliseconds
+    client_ts_ms: int = None
+
+@dataclass
+class IngestResult:
+    metric_snapshot_id: int = None
+    error: str = None
+
+# handed to ingest listeners once the values are committed, client_ts_ms is None when the
+# client timestamp could not be parsed
+IngestedValue = namedtuple("IngestedValue", [
+    "metric_snapshot_id", "device_id", "device_metric_type_id", "value", "server_ts_ms", "client_ts_ms"
+])
+
+def parse_payload(data):
+    # structure of payload matches the post_metric_snapshot body
+    if not isinstance(data, dict):
+        raise ValueError("Payload must be a JSON object")
+    try:
+        snapshots = data["snapshots"]
+        record = SnapshotRecord(
+            device_id=int(data["device_id"]),
+            device_name=data["device_name"],
+            client_timestamp_utc=parse_client_timestamp(data["client_timestamp_utc"]),
+            client_timezone_mins=int(data["client_timezone_mins"])
+        )
+        for snapshot in snapshots:
+            record.values.append((
+                int(snapshot["device_metric_type_id"]),
+                snapshot["device_metric_type_name"],
+                parse_metric_value(snapshot["metric_value"])
+            ))
+    except KeyError as e:
+        raise ValueError(f"Missing field: {e.args[0]}")
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid payload: {e}")
+    return record
+
+def parse_client_timestamp(value):
+    # stored as sent, but it has to be a timestamp in the one format the time columns are derived from
+    if value is None:
+        raise ValueError("client_timestamp_utc is required")
+    if not isinstance(value, str) or to_epoch_ms(value) is None:
+        raise ValueError(f"client_timestamp_utc must look like {datetime(2024, 12, 31, 23, 59, 59).strftime(TIMESTAMP_FORMAT)}, "
+                         f"got {value!r}")
+    return value
+
+def parse_metric_value(value):
+    # numbers and numeric strings become floats, null stays null
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"metric_value must be a number, got {type(value).__name__}")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"metric_value must be a number, got {value!r}")
+    if not math.isfinite(number):
+        raise ValueError(f"metric_value must be finite, got {value!r}")
+    return number
+
+def client_error(e, default="Internal server error"):
+    # validation and not-found errors are written for the client, anything else (database errors
+    # carry the SQL and its parameters, Python errors their internals) is only logged
+    if isinstance(e, KeyError):
+        return f"Missing field: {e.args[0]}"
+    if isinstance(e, (ValueError, LookupError)):
+        return str(e)
+    return default
+
+def server_timestamp():
+    now_UTC = datetime.now(timezone.utc)
+    server_timestamp_utc = now_UTC.astimezone().strftime(TIMESTAMP_FORMAT)
+    server_timezone_mins = int(now_UTC.astimezone().utcoffset().total_seconds() / 60)
+    server_ts_ms = int(now_UTC.timestamp() * 1000)
+    return server_timestamp_utc, server_timezone_mins, server_ts_ms
+
+class BulkIngest:
+    def __init__(self, logger, identity_cache=None):
+        self.logger = logger
+        self.identity_cache = identity_cache
+        self.listeners = []
+        self.writers = []
+
+    def add_listener(self, listener):
+        # listener(values) is called with the IngestedValue list after each commit
+        self.listeners.append(listener)
+
+    def add_writer(self, writer):
+        # writer(session, values) runs inside the ingest transaction, before commit
+        self.writers.append(writer)
+
+    def ingest(self, session, records):
+        # one result per record, rejected records carry an error and are not written
+        results = [IngestResult() for _ in records]
+        self._validate(records, results)
+        self._ensure_devices(session, records, results)
+        self._ensure_metric_types(session, records, results)
+
+        server_timestamp_utc, server_timezone_mins, server_ts_ms = server_timestamp()
+        snapshot_table = MetricSnapshot.__table__
+        ingested = []
+        for record, result in zip(records, results):
+            if result.error:
+                continue
+            client_ts_ms = record.client_ts_ms if record.client_ts_ms is not None \
+                else to_epoch_ms(record.client_timestamp_utc)
+            # one snapshot per payload, every metric value hangs off it
+            inserted = session.execute(insert(snapshot_table).values(
+                device_id=record.device_id,
+                client_timestamp_utc=record.client_timestamp_utc,
+                client_timezone_mins=record.client_timezone_mins,
+                server_timestamp_utc=server_timestamp_utc,
+                server_timezone_mins=server_timezone_mins,
+                client_ts_ms=client_ts_ms,
+                server_ts_ms=server_ts_ms
+            ))
+            result.metric_snapshot_id = inserted.inserted_primary_key[0]
+            for device_metric_type_id, _, metric_value in record.values:
+                ingested.append(IngestedValue(result.metric_snapshot_id, record.device_id,
+                                              device_metric_type_id, metric_value, server_ts_ms, client_ts_ms))
+
+        if ingested:
+            # executemany, a single prepared statement for every value row
+            session.execute(insert(MetricValue.__table__), [
+                {
+                    "metric_snapshot_id": value.metric_snapshot_id,
+                    "device_metric_type_id": value.device_metric_type_id,
+                    "value": value.value
+                }
+                for value in ingested
+            ])
+            self._update_latest_values(session, ingested)
+            for writer in self.writers:
+                writer(session, ingested)
+            self._notify_after_commit(session, ingested)
+
+        accepted = sum(1 for result in results if not result.error)
+        self.logger.debug("Bulk ingested %d of %d snapshots, %d values", accepted, len(records), len(ingested))
+        return results
+
+    def register(self, session, device_id, device_name, metric_types):
+        # names for the binary format, metric_types is [(device_metric_type_id, name), ...]
+        record = SnapshotRecord(device_id, device_name, None, 0,
+                                [(device_metric_type_id, name, None) for device_metric_type_id, name in metric_types])
+        results = [IngestResult()]
+        self._validate([record], results)
+        self._ensure_devices(session, [record], results)
+        self._ensure_metric_types(session, [record], results)
+        if results[0].error:
+            raise ValueError(results[0].error)
+
+    def _update_latest_values(self, session, ingested):
+        # upsert, a row only moves forward to a newer snapshot
+        latest = LatestMetricValue.__table__
+        statement = sqlite_insert(latest)
+        statement = statement.on_conflict_do_update(
+            index_elements=[latest.c.device_id, latest.c.device_metric_type_id],
+            set_={
+                "metric_snapshot_id": statement.excluded.metric_snapshot_id,
+                "value": statement.excluded.value,
+                "server_ts_ms": statement.excluded.server_ts_ms
+            },
+            where=statement.excluded.metric_snapshot_id > latest.c.metric_snapshot_id
+        )
+        session.execute(statement, [
+            {
+                "device_id": value.device_id,
+                "device_metric_type_id": value.device_metric_type_id,
+                "metric_snapshot_id": value.metric_snapshot_id,
+                "value": value.value,
+                "server_ts_ms": value.server_ts_ms
+            }
+            for value in ingested
+        ])
+
+    def _notify_after_commit(self, session, ingested):
+        if not self.listeners:
+            return
+
+        def notify():
+            # every listener sees the batch, one that fails is logged and does not stop the others
+            for listener in self.listeners:
+                try:
+                    listener(ingested)
+                except Exception as e:
+                    self.logger.error("Ingest listener %s failed: %s", getattr(listener, "__qualname__", listener), e)
+        on_commit(session, notify)
+
+    def _validate(self, records, results):
+        for record, result in zip(records, results):
+            type_ids = [value[0] for value in record.values]
+            if len(type_ids) != len(set(type_ids)):
+                result.error = "Duplicate device_metric_type_id in snapshots"
+
+    def _ensure_devices(self, session, records, results):
+        device_ids = {record.device_id for record, result in zip(records, results) if not result.error}
+        existing = {device_id for device_id in device_ids if self._cached_device(device_id)}
+        missing = device_ids - existing
+        if missing:
+            found = session.execute(
+                select(Device.device_id, Device.device_name).where(Device.device_id.in_(missing))
+            ).all()
+            existing.update(device_id for device_id, _ in found)
+            self._cache_after_commit(session, devices=found)
+
+        new_devices = {}
+        for record, result in zip(records, results):
+            if result.error or record.device_id in existing:
+                continue
+            if not record.device_name:
+                result.error = f"Unknown device {record.device_id}"
+                continue
+            new_devices.setdefault(record.device_id, record.device_name)
+
+        if new_devices:
+            session.execute(
+                sqlite_insert(Device.__table__)
+                .values([{"device_id": device_id, "device_name": device_name}
+                         for device_id, device_name in new_devices.items()])
+                .on_conflict_do_nothing(index_elements=["device_id"])
+            )
+            self._cache_after_commit(session, devices=new_devices.items())
+
+    def _ensure_metric_types(self, session, records, results):
+        # (device_id, device_metric_type_id) pairs already known to the cache skip the database
+        owners = {}
+        missing = set()
+        for record, result in zip(records, results):
+            if result.error:
+                continue
+            for value in record.values:
+                if self._cached_metric_type(record.device_id, value[0]):
+                    owners[value[0]] = record.device_id
+                else:
+                    missing.add(value[0])
+        if missing:
+            # device_metric_type_id is the primary key, so one lookup resolves every type in the batch
+            found = session.execute(
+                select(DeviceMetricType.device_id, DeviceMetricType.device_metric_type_id, DeviceMetricType.name)
+                .where(DeviceMetricType.device_metric_type_id.in_(missing))
+            ).all()
+            owners.update((device_metric_type_id, device_id) for device_id, device_metric_type_id, _ in found)
+            self._cache_after_commit(session, metric_types=found)
+
+        new_types = {}
+        for record, result in zip(records, results):
+            if result.error:
+                continue
+            for device_metric_type_id, device_metric_type_name, _ in record.values:
+                owner = owners.get(device_metric_type_id, new_types.get(device_metric_type_id, (record.device_id,))[0])
+                if owner != record.device_id:
+                    result.error = f"Metric type {device_metric_type_id} belongs to device {owner}"
+                    break
+                if device_metric_type_id in owners or device_metric_type_id in new_types:
+                    continue
+                if not device_metric_type_name:
+                    result.error = f"Unknown metric type {device_metric_type_id}"
+                    break
+                new_types[device_metric_type_id] = (record.device_id, device_metric_type_name)
+
+        if new_types:
+            session.execute(
+                sqlite_insert(DeviceMetricType.__table__)
+                .values([{"device_metric_type_id": device_metric_type_id,
+                          "device_id": device_id,
+                          "name": name}
+                         for device_metric_type_id, (device_id, name) in new_types.items()])
+                .on_conflict_do_nothing(index_elements=["device_metric_type_id"])
+            )
+            self._cache_after_commit(session, metric_types=[
+                (device_id, device_metric_type_id, name)
+                for device_metric_type_id, (device_id, name) in new_types.items()
+            ])
+
+    def _cached_device(self, device_id):
+        return self.identity_cache is not None and self.identity_cache.get_device_name(device_id) is not None
+
+    def _cached_metric_type(self, device_id, device_metric_type_id):
+        return (self.identity_cache is not None
+                and self.identity_cache.get_metric_type_name(device_id, device_metric_type_id) is not None)
+
+    def _cache_after_commit(self, session, devices=(), metric_types=()):
+        # only publish rows to the cache once they are durable
+        if self.identity_cache is None:
+            return
+        devices = list(devices)
+        metric_types = list(metric_types)
+
+        def publish():
+            for device_id, device_name in devices:
+                self.identity_cache.add_device(device_id, device_name)
+            for device_id, device_metric_type_id, name in metric_types:
+                self.identity_cache.add_metric_type(device_id, device_metric_type_id, name)
+        on_commit(session, publish)
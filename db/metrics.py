@@ -1,11 +1,43 @@
-from datetime import datetime, timezone
 from dataclasses import dataclass
-from .models import Base, Device, DeviceMetricType, MetricSnapshot, MetricValue
+from sqlalchemy import select, tuple_
+from .models import Base, Device, DeviceMetricType, LatestMetricValue, MetricSnapshot, MetricValue
+from .ingest import BulkIngest, parse_payload
+
+def encode_cursor(cursor):
+    if cursor is None:
+        return None
+    metric_snapshot_id, device_metric_type_id = cursor
+    return f"{metric_snapshot_id}:{device_metric_type_id}"
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        metric_snapshot_id, device_metric_type_id = value.split(":")
+        return int(metric_snapshot_id), int(device_metric_type_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {value}")
+
+def format_metric_rows(rows):
+    # getMetricValuesPage rows as table records
+    return [
+        {
+            "metric_snapshot_id": row.metric_snapshot_id,
+            "device_id": row.device_id,
+            "device_name": row.device_name,
+            "metric_type_id": row.device_metric_type_id,
+            "metric_type_name": row.metric_type_name,
+            "metric_value": row.value,
+            "timestamp_utc": row.server_timestamp_utc,
+        }
+        for row in rows
+    ]
 
 @dataclass
 class Metrics:
-    def __init__(self, logger):
+    def __init__(self, logger, identity_cache=None):
         self.logger = logger
+        self.ingest = BulkIngest(logger, identity_cache)
 
     def getAllMetrics(self, session):
         self.logger.debug("Fetching all metrics")
@@ -13,75 +45,105 @@ class Metrics:
         if not all_snapshots:
             self.logger.error("No snapshot found")
             return None
-        for snapshot in all_snapshots:
-            self.logger.info(f"Line 1: Snapshot ID: {snapshot.metric_snapshot_id}, Device ID: {snapshot.device_id}, Client timestamp: {snapshot.client_timestamp_utc}")
-            self.logger.info(f"Line 2: Client timezone: {snapshot.client_timezone_mins},  Server timestamp: {snapshot.server_timestamp_utc}, Server timezone: {snapshot.server_timezone_mins}")
-        self.logger.debug(f"Type of all_snapshots: {type(all_snapshots)}")
+        self.logger.debug("Fetched %d snapshots", len(all_snapshots))
         return all_snapshots
 
+    def iterMetricSnapshots(self, session, device_id=None, start_ms=None, end_ms=None,
+                            limit=None, chunk_size=1000):
+        # yields lists of row tuples read through a server side cursor, never the whole table
+        columns = MetricSnapshot.__table__.c
+        query = select(
+            columns.metric_snapshot_id,
+            columns.device_id,
+            columns.client_timestamp_utc,
+            columns.client_timezone_mins,
+            columns.server_timestamp_utc,
+            columns.server_timezone_mins,
+            columns.client_ts_ms,
+            columns.server_ts_ms
+        )
+        if device_id is not None:
+            query = query.where(columns.device_id == device_id)
+        # time ranges are served by the (device_id, server_ts_ms) and server_ts_ms indexes
+        if start_ms is not None:
+            query = query.where(columns.server_ts_ms >= start_ms)
+        if end_ms is not None:
+            query = query.where(columns.server_ts_ms < end_ms)
+        if start_ms is not None or end_ms is not None:
+            query = query.order_by(columns.server_ts_ms, columns.metric_snapshot_id)
+        else:
+            query = query.order_by(columns.metric_snapshot_id)
+        if limit is not None:
+            query = query.limit(limit)
+
+        result = session.execute(query.execution_options(stream_results=True))
+        for chunk in result.partitions(chunk_size):
+            yield chunk
+
     def addMetricSnapshot(self, device_id, device_name, snapshots,
                            client_timestamp_utc, client_timezone_mins,
                              session):
-        
-        # find or create device
-        device = session.query(Device).filter_by(device_id=device_id).first()
-        if not device:
-            device = Device(
-                device_id=device_id,
-                device_name=device_name
-            )
-            session.add(device)
-            session.flush()  # get the id of newly created device to use later
-
-        server_timestamp_utc = datetime.now().strftime("%d-%m-%Y %H:%M:%S") 
-        now_UTC = datetime.now(timezone.utc)
-        server_timezone_mins = int(now_UTC.astimezone().utcoffset().total_seconds() / 60)
-
-        for snapshot in snapshots:
-            device_metric_type_id = snapshot["device_metric_type_id"]
-            device_metric_type_name = snapshot["device_metric_type_name"]
-            metric_value = snapshot["metric_value"]
-
-            metric_snapshot = MetricSnapshot(
-                device_id = device_id,
-                client_timestamp_utc = client_timestamp_utc,
-                client_timezone_mins = client_timezone_mins,
-                server_timestamp_utc = server_timestamp_utc,
-                server_timezone_mins = server_timezone_mins
-            )
-            session.add(metric_snapshot)
-            session.flush()
+        record = parse_payload({
+            "device_id": device_id,
+            "device_name": device_name,
+            "snapshots": snapshots,
+            "client_timestamp_utc": client_timestamp_utc,
+            "client_timezone_mins": client_timezone_mins
+        })
+        # device, metric types, snapshot and values are written set-based in a handful of statements
+        result = self.ingest.ingest(session, [record])[0]
+        if result.error:
+            raise ValueError(result.error)
 
-            metric_snapshot_id = metric_snapshot.metric_snapshot_id
-
-            device_metric_type = session.query(DeviceMetricType).filter_by(
-                device_metric_type_id=device_metric_type_id, 
-                device_id=device_id
-            ).first()
-            
-            if not device_metric_type:
-                device_metric_type = DeviceMetricType(
-                    device_metric_type_id = device_metric_type_id,
-                    device_id = device_id,
-                    name = device_metric_type_name
-                )
-                session.add(device_metric_type)
-                session.flush()
-
-            metric_value = MetricValue(
-                metric_snapshot_id = metric_snapshot_id,
-                device_metric_type_id = device_metric_type_id,
-                value = metric_value
-            )
-            session.add(metric_value)
-
-        self.logger.info(f"Added metric snapshot: {snapshots}")
+        self.logger.debug("Added metric snapshot %d with %d values", result.metric_snapshot_id, len(snapshots))
         return snapshots
     
     def getMetricSnapshot(self, metric_snapshot_id, session):
         snapshot = session.query(MetricSnapshot).filter(MetricSnapshot.metric_snapshot_id == metric_snapshot_id).first()
         if not snapshot:
-            self.logger.error(f"Snapshot with ID {metric_snapshot_id} not found")
+            self.logger.error("Snapshot with ID %s not found", metric_snapshot_id)
             return None
-        self.logger.info(f"Snapshot found: {snapshot}")
+        self.logger.debug("Snapshot found: %s", snapshot)
         return snapshot
+
+    def getMetricValuesPage(self, session, cursor=None, page_size=20):
+        # keyset pagination, newest first; cursor is the last (snapshot id, metric type id) already seen,
+        # so every page is an index range scan on the metric_values primary key
+        query = session.query(
+            MetricValue.metric_snapshot_id,
+            Device.device_name,
+            Device.device_id,
+            DeviceMetricType.device_metric_type_id,
+            DeviceMetricType.name.label("metric_type_name"),
+            MetricValue.value,
+            MetricSnapshot.server_timestamp_utc
+        )\
+            .select_from(MetricValue)\
+            .join(MetricSnapshot, MetricValue.metric_snapshot_id == MetricSnapshot.metric_snapshot_id)\
+            .join(Device, MetricSnapshot.device_id == Device.device_id)\
+            .join(DeviceMetricType, MetricValue.device_metric_type_id == DeviceMetricType.device_metric_type_id)
+        if cursor is not None:
+            query = query.filter(
+                tuple_(MetricValue.metric_snapshot_id, MetricValue.device_metric_type_id) < tuple_(*cursor)
+            )
+        rows = query\
+            .order_by(MetricValue.metric_snapshot_id.desc(), MetricValue.device_metric_type_id.desc())\
+            .limit(page_size + 1)\
+            .all()
+
+        # the extra row only tells us whether another page exists
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1].metric_snapshot_id, rows[-1].device_metric_type_id)
+        return rows, next_cursor
+
+    def getLatestValue(self, session, device_id, device_metric_type_id):
+        # primary key point lookup on the table the ingest path keeps current
+        return session.get(LatestMetricValue, (device_id, device_metric_type_id))
+
+    def getCurrentValues(self, session, device_id=None):
+        query = session.query(LatestMetricValue)
+        if device_id is not None:
+            query = query.filter(LatestMetricValue.device_id == device_id)
+        return query.order_by(LatestMetricValue.device_id, LatestMetricValue.device_metric_type_id).all()
@@ -0,0 +1,120 @@
+import logging
+from sqlalchemy import bindparam, inspect, select, text, update
+from .models import Base, LatestMetricValue, MetricSnapshot
+from .timestamps import to_epoch_ms
+
+class Migrations:
+    def __init__(self, logger, engine, batch_size=5000, incremental_vacuum=False):
+        self.logger = logger
+        self.engine = engine
+        self.batch_size = batch_size
+        self.incremental_vacuum = incremental_vacuum
+
+    def run(self):
+        self.add_timestamp_columns()
+        self.create_tables_and_indexes()
+        self.backfill_timestamps()
+        self.backfill_latest_values()
+        if self.incremental_vacuum:
+            self.enable_incremental_vacuum()
+
+    def add_timestamp_columns(self):
+        # a new database gets the columns from create_tables_and_indexes
+        inspector = inspect(self.engine)
+        if not inspector.has_table("metric_snapshots"):
+            return
+        existing = {column["name"] for column in inspector.get_columns("metric_snapshots")}
+        with self.engine.begin() as connection:
+            for column in ("client_ts_ms", "server_ts_ms"):
+                if column not in existing:
+                    self.logger.info("Adding metric_snapshots.%s", column)
+                    connection.execute(text(f"ALTER TABLE metric_snapshots ADD COLUMN {column} INTEGER"))
+
+    def create_tables_and_indexes(self):
+        # create_all only creates missing tables, indexes on existing tables are checked one by one
+        tables = [table for table in Base.metadata.sorted_tables if table.name != "sqlite_sequence"]
+        Base.metadata.create_all(self.engine, tables=tables)
+        for table in tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
+
+    def backfill_timestamps(self):
+        # small batches so the write lock is never held for long
+        columns = MetricSnapshot.__table__.c
+        statement = update(MetricSnapshot.__table__)\
+            .where(columns.metric_snapshot_id == bindparam("snapshot_id"))\
+            .values(client_ts_ms=bindparam("client_ms"), server_ts_ms=bindparam("server_ms"))
+        last_id = 0
+        total = 0
+        while True:
+            with self.engine.begin() as connection:
+                rows = connection.execute(
+                    select(
+                        columns.metric_snapshot_id,
+                        columns.client_timestamp_utc,
+                        columns.client_timezone_mins,
+                        columns.server_timestamp_utc,
+                        columns.server_timezone_mins
+                    )
+                    .where(columns.metric_snapshot_id > last_id, columns.server_ts_ms.is_(None))
+                    .order_by(columns.metric_snapshot_id)
+                    .limit(self.batch_size)
+                ).all()
+                if not rows:
+                    break
+                connection.execute(statement, [
+                    {
+                        "snapshot_id": row.metric_snapshot_id,
+                        # client timestamps are sent as UTC, server ones were written in local time
+                        "client_ms": to_epoch_ms(row.client_timestamp_utc),
+                        "server_ms": to_epoch_ms(row.server_timestamp_utc, row.server_timezone_mins)
+                    }
+                    for row in rows
+                ])
+            last_id = rows[-1].metric_snapshot_id
+            total += len(rows)
+        if total:
+            self.logger.info("Backfilled epoch timestamps for %d snapshots", total)
+        return total
+
+    def backfill_latest_values(self):
+        # only seeds an empty table, from then on ingest keeps it current
+        with self.engine.begin() as connection:
+            if connection.execute(select(LatestMetricValue.device_id).limit(1)).first():
+                return 0
+            result = connection.execute(text("""
+                INSERT INTO latest_metric_values
+                    (device_id, device_metric_type_id, metric_snapshot_id, value, server_ts_ms)
+                SELECT t.device_id, mv.device_metric_type_id, mv.metric_snapshot_id, mv.value, ms.server_ts_ms
+                FROM device_metric_types t
+                JOIN metric_values mv ON mv.device_metric_type_id = t.device_metric_type_id
+                    AND mv.metric_snapshot_id = (
+                        SELECT max(metric_snapshot_id) FROM metric_values
+                        WHERE device_metric_type_id = t.device_metric_type_id
+                    )
+                JOIN metric_snapshots ms ON ms.metric_snapshot_id = mv.metric_snapshot_id
+            """))
+        if result.rowcount:
+            self.logger.info("Seeded latest values for %d series", result.rowcount)
+        return result.rowcount
+
+    def enable_incremental_vacuum(self):
+        # auto_vacuum can only be switched on an existing file by a full VACUUM, done once
+        if self.engine.dialect.name != "sqlite":
+            return False
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+                return False
+            self.logger.info("Switching to auto_vacuum=INCREMENTAL, running a full VACUUM")
+            connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            connection.exec_driver_sql("VACUUM")
+        return True
+
+if __name__ == "__main__":
+    # python -m db.migrations
+    from lib_config.config import Config
+    from managers.connection_manager import ConnectionManager
+    config = Config()
+    connection_manager = ConnectionManager(logging.getLogger(__name__), config.database)
+    Migrations(logging.getLogger(__name__), connection_manager.engine,
+               config.database.migration_batch_size, config.retention.incremental_vacuum).run()
@@ -1,5 +1,5 @@
 # coding: utf-8
-from sqlalchemy import Column, Float, ForeignKey, Integer, Table, Text
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, Table, Text
 from sqlalchemy.sql.sqltypes import NullType
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -41,9 +41,17 @@ class MetricSnapshot(Base):
     client_timezone_mins = Column(Integer, nullable=False)
     server_timestamp_utc = Column(Text, nullable=False)
     server_timezone_mins = Column(Integer, nullable=False)
+    # epoch milliseconds (UTC), sortable and indexed copies of the text timestamps
+    client_ts_ms = Column(Integer)
+    server_ts_ms = Column(Integer)
 
     device = relationship('Device')
 
+    __table_args__ = (
+        Index('ix_metric_snapshots_device_id_server_ts_ms', 'device_id', 'server_ts_ms'),
+        Index('ix_metric_snapshots_server_ts_ms', 'server_ts_ms'),
+    )
+
     def to_dict(self):
         return {
             "metric_snapshot_id": self.metric_snapshot_id,
@@ -52,6 +60,8 @@ class MetricSnapshot(Base):
             "client_timezone_mins": self.client_timezone_mins,
             "server_timestamp_utc": self.server_timestamp_utc,
             "server_timezone_mins": self.server_timezone_mins,
+            "client_ts_ms": self.client_ts_ms,
+            "server_ts_ms": self.server_ts_ms,
         }
 
 
@@ -64,3 +74,62 @@ class MetricValue(Base):
 
     device_metric_type = relationship('DeviceMetricType')
     metric_snapshot = relationship('MetricSnapshot')
+
+    __table_args__ = (
+        Index('ix_metric_values_device_metric_type_id_snapshot', 'device_metric_type_id', 'metric_snapshot_id'),
+    )
+
+
+class LatestMetricValue(Base):
+    __tablename__ = 'latest_metric_values'
+
+    # newest value of every series, maintained by the ingest path
+    device_id = Column(ForeignKey('devices.device_id'), primary_key=True, nullable=False)
+    device_metric_type_id = Column(ForeignKey('device_metric_types.device_metric_type_id'), primary_key=True, nullable=False)
+    metric_snapshot_id = Column(Integer, nullable=False)
+    value = Column(Float)
+    server_ts_ms = Column(Integer)
+
+    def to_dict(self):
+        return {
+            "device_id": self.device_id,
+            "device_metric_type_id": self.device_metric_type_id,
+            "metric_snapshot_id": self.metric_snapshot_id,
+            "value": self.value,
+            "server_ts_ms": self.server_ts_ms,
+        }
+
+
+class MetricRollup(Base):
+    __tablename__ = 'metric_rollups'
+
+    # pre-aggregated bucket of one series, resolution_ms is 1 minute, 1 hour or 1 day
+    resolution_ms = Column(Integer, primary_key=True, nullable=False)
+    device_metric_type_id = Column(ForeignKey('device_metric_types.device_metric_type_id'), primary_key=True, nullable=False)
+    bucket_start_ms = Column(Integer, primary_key=True, nullable=False)
+    device_id = Column(ForeignKey('devices.device_id'), nullable=False)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    sum_value = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
+    last_value = Column(Float, nullable=False)
+    last_ts_ms = Column(Integer, nullable=False)
+
+    def to_dict(self):
+        return {
+            "bucket_start_ms": self.bucket_start_ms,
+            "min": self.min_value,
+            "max": self.max_value,
+            "avg": self.sum_value / self.count if self.count else None,
+            "sum": self.sum_value,
+            "count": self.count,
+            "last": self.last_value,
+        }
+
+
+class RollupCoverage(Base):
+    __tablename__ = 'rollup_coverage'
+
+    # metric_rollups of a resolution are complete from start_ms on, older ranges are read raw
+    resolution_ms = Column(Integer, primary_key=True)
+    start_ms = Column(Integer, nullable=False)
@@ -0,0 +1,226 @@
+import logging
+import time
+from sqlalchemy import case, delete, func, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import MetricRollup, MetricSnapshot, RollupCoverage
+
+ROLLUP_RESOLUTIONS = {
+    "1m": 60 * 1000,
+    "1h": 60 * 60 * 1000,
+    "1d": 24 * 60 * 60 * 1000
+}
+
+# row_number() picks the newest raw value of each bucket as its last value
+BUCKETS_FROM_RAW = """
+    {insert}
+    WITH ranked AS (
+        SELECT mv.device_metric_type_id, ms.device_id, mv.value, ms.server_ts_ms,
+               ms.server_ts_ms - ms.server_ts_ms % :resolution AS bucket_start_ms,
+               row_number() OVER (
+                   PARTITION BY mv.device_metric_type_id,
+                                ms.server_ts_ms - ms.server_ts_ms % :resolution
+                   ORDER BY ms.server_ts_ms DESC, ms.metric_snapshot_id DESC
+               ) AS newest
+        FROM metric_snapshots ms
+        JOIN metric_values mv ON mv.metric_snapshot_id = ms.metric_snapshot_id
+        WHERE ms.server_ts_ms >= :window_start AND ms.server_ts_ms < :window_end
+            AND mv.value IS NOT NULL {series}
+    )
+    SELECT :resolution AS resolution_ms, device_metric_type_id, bucket_start_ms, device_id,
+           min(value) AS min_value, max(value) AS max_value, sum(value) AS sum_value, count(value) AS count,
+           max(CASE WHEN newest = 1 THEN value END) AS last_value, max(server_ts_ms) AS last_ts_ms
+    FROM ranked
+    GROUP BY device_metric_type_id, bucket_start_ms
+"""
+
+INSERT_ROLLUPS = """
+    INSERT INTO metric_rollups
+        (resolution_ms, device_metric_type_id, bucket_start_ms, device_id,
+         min_value, max_value, sum_value, count, last_value, last_ts_ms)
+"""
+
+class Rollups:
+    def __init__(self, logger, resolutions=None):
+        self.logger = logger
+        self.resolutions = sorted(ROLLUP_RESOLUTIONS[name] for name in (resolutions or ROLLUP_RESOLUTIONS))
+
+    def apply(self, session, ingested):
+        # BulkIngest writer: fold the batch in memory first, then one upsert per bucket
+        buckets = {}
+        for value in ingested:
+            number = _number(value.value)
+            if number is None:
+                continue
+            value = value._replace(value=number)
+            for resolution_ms in self.resolutions:
+                key = (resolution_ms, value.device_metric_type_id,
+                       value.server_ts_ms - value.server_ts_ms % resolution_ms)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = {
+                        "resolution_ms": key[0],
+                        "device_metric_type_id": key[1],
+                        "bucket_start_ms": key[2],
+                        "device_id": value.device_id,
+                        "min_value": value.value,
+                        "max_value": value.value,
+                        "sum_value": value.value,
+                        "count": 1,
+                        "last_value": value.value,
+                        "last_ts_ms": value.server_ts_ms
+                    }
+                    continue
+                bucket["min_value"] = min(bucket["min_value"], value.value)
+                bucket["max_value"] = max(bucket["max_value"], value.value)
+                bucket["sum_value"] += value.value
+                bucket["count"] += 1
+                if value.server_ts_ms >= bucket["last_ts_ms"]:
+                    bucket["last_value"] = value.value
+                    bucket["last_ts_ms"] = value.server_ts_ms
+        if buckets:
+            session.execute(self._upsert_statement(), list(buckets.values()))
+
+    def _upsert_statement(self):
+        rollups = MetricRollup.__table__
+        statement = sqlite_insert(rollups)
+        excluded = statement.excluded
+        # two argument min() / max() are SQLite's scalar functions, not aggregates
+        return statement.on_conflict_do_update(
+            index_elements=[rollups.c.resolution_ms, rollups.c.device_metric_type_id, rollups.c.bucket_start_ms],
+            set_={
+                "min_value": func.min(rollups.c.min_value, excluded.min_value),
+                "max_value": func.max(rollups.c.max_value, excluded.max_value),
+                "sum_value": rollups.c.sum_value + excluded.sum_value,
+                "count": rollups.c.count + excluded.count,
+                "last_value": case(
+                    (excluded.last_ts_ms >= rollups.c.last_ts_ms, excluded.last_value),
+                    else_=rollups.c.last_value
+                ),
+                "last_ts_ms": func.max(rollups.c.last_ts_ms, excluded.last_ts_ms)
+            }
+        )
+
+    def start_coverage(self, engine, now_ms=None):
+        # called when ingest starts maintaining rollups, only buckets after the current one are complete
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        coverage = RollupCoverage.__table__
+        with engine.begin() as connection:
+            # a resolution that was switched off missed updates
+            connection.execute(delete(coverage).where(coverage.c.resolution_ms.notin_(self.resolutions)))
+            connection.execute(
+                sqlite_insert(coverage).on_conflict_do_nothing(index_elements=[coverage.c.resolution_ms]),
+                [{"resolution_ms": resolution_ms, "start_ms": now_ms - now_ms % resolution_ms + resolution_ms}
+                 for resolution_ms in self.resolutions]
+            )
+
+    def clear_coverage(self, engine):
+        # ingest without rollups leaves a gap, they are not trusted again until rebuilt
+        with engine.begin() as connection:
+            connection.execute(delete(RollupCoverage.__table__))
+
+    def coverage(self, session):
+        # resolution_ms -> first bucket start from which the rollups are complete
+        return dict(session.execute(select(RollupCoverage.resolution_ms, RollupCoverage.start_ms)).all())
+
+    def choose_resolution(self, start_ms, end_ms, max_points):
+        # finest resolution that still fits in max_points buckets, else the coarsest one
+        for resolution_ms in self.resolutions:
+            if (end_ms - start_ms) / resolution_ms <= max_points:
+                return resolution_ms
+        return self.resolutions[-1]
+
+    def query(self, session, device_metric_type_id, start_ms, end_ms, max_points=500, resolution_ms=None):
+        resolution_ms = resolution_ms or self.choose_resolution(start_ms, end_ms, max_points)
+        first_bucket_ms = start_ms - start_ms % resolution_ms
+        # buckets before the rollup coverage starts are aggregated from the raw rows
+        covered_ms = self.coverage(session).get(resolution_ms)
+        split_ms = end_ms if covered_ms is None else \
+            min(max(first_bucket_ms, covered_ms + -covered_ms % resolution_ms), end_ms)
+        rows = []
+        if split_ms > first_bucket_ms:
+            rows += self._from_raw(session, device_metric_type_id, first_bucket_ms,
+                                   split_ms + -split_ms % resolution_ms, resolution_ms)
+        if split_ms < end_ms:
+            rows += session.query(MetricRollup)\
+                .filter(
+                    MetricRollup.resolution_ms == resolution_ms,
+                    MetricRollup.device_metric_type_id == device_metric_type_id,
+                    MetricRollup.bucket_start_ms >= split_ms,
+                    MetricRollup.bucket_start_ms < end_ms
+                )\
+                .order_by(MetricRollup.bucket_start_ms)\
+                .all()
+        return resolution_ms, rows
+
+    def _from_raw(self, session, device_metric_type_id, start_ms, end_ms, resolution_ms):
+        # transient MetricRollup rows, never added to the session
+        result = session.execute(
+            text(BUCKETS_FROM_RAW.format(insert="", series="AND mv.device_metric_type_id = :device_metric_type_id")
+                 + " ORDER BY bucket_start_ms"),
+            {"resolution": resolution_ms, "window_start": start_ms, "window_end": end_ms,
+             "device_metric_type_id": device_metric_type_id}
+        )
+        return [MetricRollup(**row._mapping) for row in result]
+
+    def backfill(self, engine, start_ms=None, end_ms=None):
+        # rebuilds rollups from raw rows one day at a time, so each transaction stays short
+        with engine.connect() as connection:
+            bounds = connection.execute(
+                select(func.min(MetricSnapshot.server_ts_ms), func.max(MetricSnapshot.server_ts_ms))
+            ).one()
+        if bounds[0] is None:
+            return 0
+        day_ms = ROLLUP_RESOLUTIONS["1d"]
+        window_start = start_ms if start_ms is not None else bounds[0]
+        window_start -= window_start % day_ms
+        # without an end every raw row is rebuilt, newer ones were written with their rollups
+        explicit_end = end_ms is not None
+        end_ms = end_ms if explicit_end else bounds[1] + 1
+
+        total = 0
+        rollups = MetricRollup.__table__
+        first_window = window_start
+        while window_start < end_ms:
+            window_end = window_start + day_ms
+            with engine.begin() as connection:
+                connection.execute(delete(rollups).where(
+                    rollups.c.bucket_start_ms >= window_start,
+                    rollups.c.bucket_start_ms < window_end
+                ))
+                for resolution_ms in self.resolutions:
+                    result = connection.execute(
+                        text(BUCKETS_FROM_RAW.format(insert=INSERT_ROLLUPS, series="")),
+                        {"resolution": resolution_ms, "window_start": window_start, "window_end": window_end}
+                    )
+                    total += result.rowcount
+            window_start = window_end
+
+        # coverage moves back to the first rebuilt day when the rebuilt range reaches what ingest maintains,
+        # a database that never ran with rollups enabled has no coverage to extend
+        coverage = RollupCoverage.__table__
+        statement = update(coverage).where(coverage.c.resolution_ms.in_(self.resolutions),
+                                           coverage.c.start_ms > first_window)
+        if explicit_end:
+            statement = statement.where(coverage.c.start_ms <= window_start)
+        with engine.begin() as connection:
+            connection.execute(statement.values(start_ms=first_window))
+        self.logger.info("Backfilled %d rollup buckets", total)
+        return total
+
+def _number(value):
+    # parse_payload already hands over floats, anything else must not break the ingest transaction
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+if __name__ == "__main__":
+    # python -m db.rollups backfill
+    import sys
+    from lib_config.config import Config
+    from managers.connection_manager import ConnectionManager
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m db.rollups backfill")
+    config = Config()
+    connection_manager = ConnectionManager(logging.getLogger(__name__), config.database)
+    Rollups(logging.getLogger(__name__), config.rollups.resolutions).backfill(connection_manager.engine)
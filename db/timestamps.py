@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta, timezone
+
+TIMESTAMP_FORMAT = "%d-%m-%Y %H:%M:%S"
+
+def to_epoch_ms(timestamp, timezone_mins=0):
+    # text timestamps are wall clock time timezone_mins ahead of UTC
+    try:
+        parsed = datetime.strptime(timestamp, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+    return int((parsed - timedelta(minutes=timezone_mins or 0)).timestamp() * 1000)
+
+def parse_time_arg(value):
+    # request arguments are epoch milliseconds or the stored text format in UTC
+    if value is None or value == "":
+        return None
+    if value.lstrip("-").isdigit():
+        return int(value)
+    epoch_ms = to_epoch_ms(value)
+    if epoch_ms is None:
+        raise ValueError(f"Invalid timestamp: {value}")
+    return epoch_ms
@@ -0,0 +1,48 @@
+# gunicorn -c gunicorn.conf.py main:app
+# SQLite takes one writer at a time, so the master starts writer.py before forking and every
+# worker hands its writes to it (managers/writer_coordinator.py)
+import os
+import subprocess
+import sys
+import time
+from lib_config.config import load_config
+
+app_config = load_config(os.path.abspath(os.environ.get("APP_CONFIG_PATH", "lib_config/config.json")))
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 2))
+# Server-Sent Events hold a thread for as long as the client is connected,
+# live_updates.max_streams_per_worker keeps the rest of the threads for other requests
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", 8))
+# workers must import main after the fork, each builds its own caches
+preload_app = False
+
+def on_starting(server):
+    # generated in the master, the writer and every forked worker inherit it
+    os.environ.setdefault("APP_WRITER_AUTHKEY", os.urandom(32).hex())
+    socket_path = app_config.multiprocess.socket_path
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server.writer = subprocess.Popen([sys.executable, "writer.py"], env=dict(os.environ, APP_ROLE="writer"))
+    # the writer runs migrations first, workers start once it accepts connections
+    deadline = time.monotonic() + app_config.multiprocess.startup_timeout_seconds
+    while not os.path.exists(socket_path):
+        if server.writer.poll() is not None:
+            raise RuntimeError(f"Writer exited with code {server.writer.returncode}")
+        if time.monotonic() > deadline:
+            server.writer.terminate()
+            raise RuntimeError("Writer did not start in time")
+        time.sleep(0.1)
+    os.environ["APP_ROLE"] = "worker"
+    server.log.info("Writer process %d ready on %s", server.writer.pid, socket_path)
+
+def on_exit(server):
+    writer = getattr(server, "writer", None)
+    if writer is not None and writer.poll() is None:
+        # the writer drains what the workers already handed over
+        writer.terminate()
+        try:
+            writer.wait(30)
+        except subprocess.TimeoutExpired:
+            writer.kill()
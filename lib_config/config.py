@@ -1,8 +1,16 @@
 import json
 import os
 import logging
+from dataclasses import fields, make_dataclass
+from functools import lru_cache
+from keyword import iskeyword
+from types import MappingProxyType
 from logging.handlers import RotatingFileHandler
 import colorlog
+from lib_config.logging_pipeline import build_filters, start_queue_listener
+
+# root handlers and listener of the last Config, a second Config in the process replaces them
+_installed_logging = {"handlers": [], "listener": None}
 
 class ColourConfig:
     DEBUG: str
@@ -36,31 +44,85 @@ class LoggingConfig:
     console_output: ConsoleOutput
     file_output: FileOutput
 
+def _missing(self, key):
+    raise KeyError(f"Key not found: {key}")
+
+def _section_data(self):
+    # back to plain JSON types, for code that wants the mapping itself
+    return {field.name: _thaw(getattr(self, field.name)) for field in fields(self)}
+
+def _thaw(value):
+    if hasattr(value, "__dataclass_fields__"):
+        return value.data
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+@lru_cache(maxsize=None)
+def _section_class(name, keys, types):
+    # one frozen, slotted class per distinct section shape
+    return make_dataclass(
+        "".join(part.capitalize() for part in name.split("_")) + "Section",
+        list(zip(keys, types)),
+        frozen=True,
+        slots=True,
+        namespace={
+            "__getattr__": _missing,
+            "__getitem__": lambda self, key: getattr(self, key),
+            "data": property(_section_data)
+        }
+    )
+
+def freeze(value, name="config"):
+    # dicts become frozen sections (read-only mappings when a key is not an identifier), lists become tuples
+    if isinstance(value, dict):
+        items = {key: freeze(item, key) for key, item in value.items()}
+        if not all(key.isidentifier() and not iskeyword(key) and key != "data" for key in items):
+            return MappingProxyType(items)
+        keys = tuple(items)
+        section = _section_class(name, keys, tuple(type(item) for item in items.values()))
+        return section(**items)
+    if isinstance(value, list):
+        return tuple(freeze(item, name) for item in value)
+    return value
+
+def validate(settings):
+    # settings that only make sense together, checked once when the file is loaded
+    if settings.cold_storage.enabled and settings.retention.cold_days < settings.retention.raw_days:
+        raise ValueError("retention.cold_days must not be shorter than retention.raw_days, "
+                         "raw days move to cold storage once they expire")
+
+@lru_cache(maxsize=None)
+def load_config(config_path):
+    # parsed once per process and file, every Config after the first shares the result
+    with open(config_path) as file:
+        settings = freeze(json.load(file))
+    validate(settings)
+    return settings
+
 class Config:
     database: DatabaseConfig
     logging_config: LoggingConfig
 
 
-    def __init__(self, config_path: str = "lib_config/config.json"):
+    def __init__(self, config_path: str = None):
+        # APP_CONFIG_PATH points the app at another config, the benchmarks use it
+        config_path = config_path or os.environ.get("APP_CONFIG_PATH", "lib_config/config.json")
         self.set_up_config(config_path)
         self.set_up_logger()
 
     def set_up_config(self, config_path):
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"Config file not found: {config_path}")
-        with open(config_path) as file:
-            self.data = json.load(file)
+        self.settings = load_config(os.path.abspath(config_path))
+        self.data = self.settings.data
+        # top level sections become plain attributes, nothing is built on access
+        for field in fields(self.settings):
+            setattr(self, field.name, getattr(self.settings, field.name))
 
     def __getattr__(self, key):
-        if key in self.data:
-            value = self.data[key]
-            if isinstance(value, dict):
-                nested_config = Config.__new__(Config)
-                nested_config.data = value
-                if type(value) == object:
-                    print("Warning, item is a dict")
-                return nested_config
-            return value
         raise KeyError(f"Key not found: {key}")
 
     def consoleColourFormatter(self, colours, console_config):
@@ -86,9 +148,18 @@ class Config:
         console_config = log_config.get("console_output", {})
         file_config = log_config.get("file_output", {})
 
-        # create logger
+        # create logger, records below the root level are dropped before a LogRecord is built
         logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)  # capture all levels; handlers will filter
+        logger.setLevel(getattr(logging, log_config.get("level", "DEBUG").upper()))
+        previous_handlers = list(_installed_logging["handlers"])
+        if _installed_logging["listener"] is not None:
+            _installed_logging["listener"].stop()
+            previous_handlers += _installed_logging["listener"].handlers
+        for handler in previous_handlers:
+            logger.removeHandler(handler)
+            handler.close()
+        handlers = []
+        self.log_listener = None
 
         # Console logging
         if console_config.get("enabled", False):
@@ -97,7 +168,7 @@ class Config:
             console_handler.setLevel(getattr(logging, console_config.get("level", "INFO").upper()))
             console_formatter = self.consoleColourFormatter(colours, console_config)
             console_handler.setFormatter(console_formatter)
-            logger.addHandler(console_handler)
+            handlers.append(console_handler)
 
         # File logging
         if file_config.get("enabled", False):
@@ -113,4 +184,17 @@ class Config:
             file_handler.setLevel(getattr(logging, file_config.get("level", "WARNING").upper()))
             file_formatter = logging.Formatter(file_config.get("format"), file_config.get("date_format"))
             file_handler.setFormatter(file_formatter)
-            logger.addHandler(file_handler)
+            handlers.append(file_handler)
+
+        # sampling and rate limiting run in the calling thread, before anything is queued
+        queue_config = log_config.get("queue", {})
+        if handlers and queue_config.get("enabled", False):
+            # console and file I/O happen on a listener thread, callers only enqueue
+            queue_handler, self.log_listener = start_queue_listener(handlers, queue_config.get("size", 10000))
+            handlers = [queue_handler]
+        for handler in handlers:
+            # one set of filters per handler, shared ones would count every record once per handler
+            for log_filter in build_filters(log_config):
+                handler.addFilter(log_filter)
+            logger.addHandler(handler)
+        _installed_logging.update(handlers=handlers, listener=self.log_listener)
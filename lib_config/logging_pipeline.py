@@ -0,0 +1,109 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+class DeferredQueueHandler(QueueHandler):
+    # QueueHandler.prepare merges msg and args on the calling thread, so later changes to the
+    # arguments cannot leak into the record; formatters and I/O run on the listener thread
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        # a full queue drops the record rather than blocking the caller
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class SamplingFilter(logging.Filter):
+    # rules: [{"logger": "main", "max_level": "DEBUG", "rate": 0.1}], first match wins,
+    # a rule covers its logger and the children of it, at max_level and below
+    def __init__(self, rules):
+        super().__init__()
+        self.rules = [
+            (rule["logger"], logging.getLevelName(rule.get("max_level", "DEBUG").upper()), float(rule["rate"]))
+            for rule in rules
+        ]
+
+    def filter(self, record):
+        for name, max_level, rate in self.rules:
+            if record.levelno <= max_level and (record.name == name or record.name.startswith(name + ".")):
+                return rate >= 1.0 or random.random() < rate
+        return True
+
+class RateLimitFilter(logging.Filter):
+    # at most `burst` records per logger, level and message template every interval,
+    # the first record of the next interval says how many were suppressed
+    def __init__(self, burst, interval_seconds, max_level="INFO"):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval_seconds
+        self.max_level = logging.getLevelName(max_level.upper())
+        self._lock = threading.Lock()
+        self._windows = {}  # (name, levelno, msg) -> [window start, emitted, suppressed]
+
+    def filter(self, record):
+        # warnings and errors above max_level are never rate limited
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                if len(self._windows) > 10000:
+                    self._windows.clear()
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed and not record.args:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        elif suppressed and isinstance(record.args, tuple):
+            record.msg = f"{record.msg} (%d similar messages suppressed)"
+            record.args = record.args + (suppressed,)
+        return True
+
+def build_filters(log_config):
+    # new instances on every call, each handler needs its own counters
+    filters = []
+    if log_config.get("sampling"):
+        filters.append(SamplingFilter(log_config["sampling"]))
+    rate_limit = log_config.get("rate_limit", {})
+    if rate_limit.get("enabled", False):
+        filters.append(RateLimitFilter(rate_limit.get("burst", 10), rate_limit.get("interval_seconds", 1),
+                                       rate_limit.get("max_level", "INFO")))
+    return filters
+
+class DeferredQueueListener(QueueListener):
+    # tracks whether it runs itself, stop flushes whatever is still queued and is safe to call more than once
+    def __init__(self, log_queue, *handlers, respect_handler_level=False):
+        super().__init__(log_queue, *handlers, respect_handler_level=respect_handler_level)
+        self.running = False
+
+    def start(self):
+        super().start()
+        self.running = True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        super().stop()
+
+def start_queue_listener(handlers, queue_size):
+    # callers only pay for a put_nowait, the handlers run on the listener thread
+    log_queue = queue.Queue(queue_size)
+    listener = DeferredQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return DeferredQueueHandler(log_queue), listener
@@ -1,382 +1,203 @@
 from flask import Flask, request
 import flask
-import dash
-from dash import dcc, html, dash_table
-import plotly.graph_objects as go
-import pandas as pd
+import os
 from lib_config.config import Config
-from db.metrics import Metrics
-from db.models import MetricSnapshot, DeviceMetricType, Device, MetricValue
+from db.metrics import Metrics, encode_cursor, decode_cursor, format_metric_rows
+from db.models import DeviceMetricType
 from managers.database_manager import DatabaseManager
+from managers.connection_manager import ConnectionManager
+from managers.ingest_manager import IngestManager
+from managers.write_behind_queue import WriteBehindQueue
+from managers.identity_cache import IdentityCache
+from managers.row_count_cache import RowCountCache
+from managers.retention_manager import RetentionManager
+from managers.export_manager import ExportManager
+from managers.pubsub import PubSub, parse_series_keys
+from managers.ring_buffer_store import RingBufferStore
+from managers.response_manager import ResponseManager, dumps
+from managers.instrumentation import Instrumentation, PROMETHEUS_MIMETYPE
+from managers.writer_coordinator import WriterClient, WriterServer
+from managers.alert_manager import AlertManager
+from db.ingest import client_error, parse_payload
+from db.binary_ingest import BINARY_MIMETYPE
+from db.migrations import Migrations
+from db.timestamps import parse_time_arg
+from db.rollups import Rollups, ROLLUP_RESOLUTIONS
+from db.cold_storage import ColdStorage
+from analytics.series import fetch_series
+from analytics.aggregates import Aggregates, parse_aggregations, parse_bucket
+from analytics.downsample import downsample, target_points, DOWNSAMPLE_METHODS
 from datetime import datetime
-import json
 import logging
-import requests
-from sqlalchemy import create_engine
 
 app = Flask(__name__)
 
-# define dash app
-dash_app = dash.Dash(__name__, server=app, url_base_pathname='/dash/')
-
-def get_device_options():
-    session = None
-    try:
-        with DatabaseManager(application.logger, application.engine) as session:
-            devices = session.query(Device.device_name).all()
-            return [{'label': device[0], 'value': device[0]} for device in devices]
-    except Exception as e:
-        application.logger.error(f"Error fetching devices: {e}")
-        return []
-
-
-# dash layout
-def gauge_page():
-    device_options = get_device_options()
-    return html.Div([
-        html.H1("Gauge Dashboard"),
-        dcc.Link("Go to Table", href="/dash/table"),
-        html.Br(),
-        dcc.Link("Go to Histogram", href="/dash/histogram"),
-        html.Br(),
-        dcc.Dropdown(
-            id='device-dropdown',
-            options=device_options,
-            value=device_options[0]['value'] if device_options else None,
-            placeholder="Select a device",
-            style={'width': '50%'}
-        ),
-        dcc.Dropdown(
-            id='metric-dropdown',
-            options=[],
-            placeholder="Select a metric",
-            style={'width': '50%'}
-        ),
-        dcc.Graph(id="gauge"),
-        dcc.Interval(
-            id="gauge-interval",
-            interval=5000,  # update every 5 seconds
-            n_intervals=0
-        )
-    ])
-
-def table_page():
-    return html.Div([
-        html.H1("Table Dashboard"),
-        dcc.Link("Go to Gauge", href="/dash/gauge"),
-        html.Br(),
-        dcc.Link("Go to Histogram", href="/dash/histogram"),
-        html.Br(),
-        html.A(html.Button('Refresh Data'),href='/dash/table'),
-        html.Br(),
-        dash_table.DataTable(
-            id="records-table",
-            columns=[
-                {"name": col, "id": col}
-                for col in [
-                    "metric_snapshot_id", "device_id", "device_name",
-                    "metric_type_id", "metric_type_name", "metric_value",
-                    "timestamp_utc"
-                ]
-            ],
-            data=[],
-        ),
-        html.Div(id="page-number-display", children="Page 1 of X"),
-        html.Button("Previous", id="previous-page", n_clicks=0, disabled=True),
-        html.Button("Next", id="next-page", n_clicks=0, disabled=True),
-        dcc.Store(id="current-page", data=1),  # store current page number
-    ])
-
-def histogram_page():
-    return html.Div([
-        html.H1("Histogram Dashboard"),
-        dcc.Link("Go to Gauge", href="/dash/gauge"),
-        html.Br(),
-        dcc.Link("Go to Table", href="/dash/table"),
-        html.Br(),
-        dcc.Graph(id="histogram")
-    ])
-
-dash_app.layout = html.Div([
-    dcc.Location(id="url", refresh=False),
-    html.Div(id="page-content")
-])
-
-# current page callback
-@dash_app.callback(
-    dash.dependencies.Output("page-content", "children"),
-    [dash.dependencies.Input("url", "pathname")]
-)
-def display_page(pathname):
-    if pathname == "/dash/gauge":
-        return gauge_page()
-    elif pathname == "/dash/table":
-        return table_page()
-    elif pathname == "/dash/histogram":
-        return histogram_page()
-    else:
-        # 404 page
-        return html.Div([
-            html.H1("404 - Page Not Found"),
-            dcc.Link("Go to Gauge", href="/dash/gauge"),
-            html.Br(),
-            dcc.Link("Go to Table", href="/dash/table"),
-            html.Br(),
-            dcc.Link("Go to Histogram", href="/dash/histogram"),
-        ])
-
-# gauge callback
-@dash_app.callback(
-    dash.dependencies.Output("gauge", "figure"),
-    [
-        dash.dependencies.Input("device-dropdown", "value"),
-        dash.dependencies.Input("metric-dropdown", "value"),
-        dash.dependencies.Input("gauge-interval", "n_intervals")
-    ]
-)
-
-def update_gauge(device_name, metric_type, n):
-    return _update_gauge_callback(device_name, metric_type)
-    
-def _update_gauge_callback(device_name, metric_type):
-    session = None
-    final_value = 0
-    try:
-        with DatabaseManager(application.logger, application.engine) as session:
-            latest_metric_value = session.query(
-                MetricValue.value,
-                MetricSnapshot.metric_snapshot_id
-            )\
-                .join(MetricSnapshot, MetricValue.metric_snapshot_id == MetricSnapshot.metric_snapshot_id)\
-                .join(DeviceMetricType, MetricValue.device_metric_type_id == DeviceMetricType.device_metric_type_id)\
-                .join(Device, DeviceMetricType.device_id == Device.device_id)\
-                .filter(
-                    Device.device_name == device_name,  # now using the selected device name
-                    DeviceMetricType.name == metric_type  # now using the selected metric type
-                )\
-                .order_by(MetricSnapshot.metric_snapshot_id.desc())\
-                .first()
-    
-    except Exception as e:
-        application.logger.error(f"Error fetching data: {e}")
-        final_value = 0
-
-    if latest_metric_value:
-        final_value = latest_metric_value[0]
-    else:
-        final_value = 0
-
-    # update the gauge figure
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number",
-        value=final_value,
-        title={"text": f"{metric_type} Value"},
-        gauge={"axis": {"range": [0, 100]}}
-    ))
-    return fig
-
-# metrics callback
-@dash_app.callback(
-    dash.dependencies.Output("metric-dropdown", "options"),
-    [dash.dependencies.Input("device-dropdown", "value")]
-)
-def update_metrics_dropdown(device_name):
-    # updating the metrics dropdown options based on the selected device
-    session = None
-    try:
-        # getting metrics types for the selected device
-        with DatabaseManager(application.logger, application.engine) as session:
-            metrics = session.query(DeviceMetricType.name)\
-                .join(Device, DeviceMetricType.device_id == Device.device_id)\
-                .filter(Device.device_name == device_name)\
-                .all()
-            
-            # format results for the dropdown
-            metric_options = [{'label': metric[0], 'value': metric[0]} for metric in metrics]
-            return metric_options
-    except Exception as e:
-        application.logger.error(f"Error fetching metrics for device '{device_name}': {e}")
-        return []
-
-def get_total_records(session):
-    try:
-        # count total number of MetricSnapshots in db
-        total_records = session.query(MetricSnapshot).count()
-        return total_records
-    except Exception as e:
-        print(f"Error calculating total records: {e}")
-        return 0
-
-def fetch_metric_details_paginated(session, page, page_size=20):
-    try:
-        # calculating the offset
-        offset = (page - 1) * page_size
-
-        # paginated query
-        results = session.query(
-            MetricSnapshot.metric_snapshot_id,
-            Device.device_name,
-            Device.device_id,
-            DeviceMetricType.device_metric_type_id,
-            DeviceMetricType.name.label("metric_type_name"),
-            MetricValue.value,
-            MetricSnapshot.server_timestamp_utc
-        )\
-        .join(Device, MetricSnapshot.device_id == Device.device_id)\
-        .join(MetricValue, MetricSnapshot.metric_snapshot_id == MetricValue.metric_snapshot_id)\
-        .join(DeviceMetricType, MetricValue.device_metric_type_id == DeviceMetricType.device_metric_type_id)\
-        .order_by(MetricSnapshot.metric_snapshot_id.desc())\
-        .offset(offset)\
-        .limit(page_size)\
-        .all()
-
-        result_list = [
-            {
-                "metric_snapshot_id": row.metric_snapshot_id,
-                "device_id": row.device_id,
-                "device_name": row.device_name,
-                "metric_type_id": row.device_metric_type_id,
-                "metric_type_name": row.metric_type_name,
-                "metric_value": row.value,
-                "timestamp_utc": row.server_timestamp_utc,
-            }
-            for row in results
-        ]
-        return result_list
-
-    except Exception as e:
-        print(f"Error fetching metric details: {e}")
-        return []
-
-# table callback
-@dash_app.callback(
-    [
-        dash.dependencies.Output("records-table", "data"),
-        dash.dependencies.Output("page-number-display", "children"),
-        dash.dependencies.Output("next-page", "disabled"),
-        dash.dependencies.Output("previous-page", "disabled"),
-        dash.dependencies.Output("current-page", "data")
-    ],
-    [
-        dash.dependencies.Input("next-page", "n_clicks"),
-        dash.dependencies.Input("previous-page", "n_clicks")
-    ],
-    [
-        dash.dependencies.State("current-page", "data")
-    ]
-)
-def update_table(next_clicks, previous_clicks, current_page):
-    page = current_page or 1
-    page_size = 20  # number of records per page
-
-    # find which button was clicked and update page number accordingly
-    ctx = dash.callback_context
-    if ctx.triggered:
-        button_id = ctx.triggered[0]["prop_id"].split(".")[0]
-        if button_id == "next-page":
-            page += 1
-        elif button_id == "previous-page" and page > 1:
-            page -= 1
-
-    try:
-        with DatabaseManager(application.logger, application.engine) as session:
-            # number of total records
-            total_records = get_total_records(session)
-            max_page = (total_records + page_size - 1) // page_size  # formula for page number calculation
-            
-            # fetch data for the current page
-            data = fetch_metric_details_paginated(session, page, page_size)
-            
-            # determine whether buttons should be disabled
-            disable_next = page >= max_page
-            disable_previous = page <= 1
-            
-            application.logger.debug(f"Page: {page}, Max Page: {max_page}, Next: {disable_next}, Previous: {disable_previous}")
-
-        return data, f"Page {page} of {max_page}", disable_next, disable_previous, page
-    except Exception as e:
-        print(f"Error updating table: {e}")
-        return [], "Error loading data", True, True, current_page
-
-@dash_app.callback(
-    dash.dependencies.Output("histogram", "figure"),
-    [dash.dependencies.Input("url", "pathname")]  # trigger when the page is loaded
-)
-def update_histogram(pathname):
-    if pathname != "/dash/histogram":
-        return dash.no_update
-    
-    try:
-        # query to fetch all metric data grouped by metric_type_id
-        with DatabaseManager(application.logger, application.engine) as session:
-            query = session.query(
-                MetricValue.device_metric_type_id,
-                DeviceMetricType.name.label("metric_type_name"),
-                MetricValue.value
-            )\
-            .join(DeviceMetricType, MetricValue.device_metric_type_id == DeviceMetricType.device_metric_type_id)\
-            .order_by(MetricValue.device_metric_type_id).all()
-
-            # processing the data
-            data_by_type = {}
-            names_by_type = {}
-            for record in query:
-                metric_type_id = record.device_metric_type_id
-                metric_type_name = record.metric_type_name
-                value = record.value
-
-                if metric_type_id not in names_by_type:
-                    names_by_type[metric_type_id] = metric_type_name
-
-                if metric_type_id not in data_by_type:
-                    data_by_type[metric_type_id] = []
-                data_by_type[metric_type_id].append(value)
-
-            # creating traces for each metric_type_id
-            traces = []
-            for metric_type_id, values in data_by_type.items():
-                x_indices = list(range(len(values)))  # indexing for x-axis
-                metric_type_name = names_by_type[metric_type_id]
-                traces.append(go.Scatter(
-                    x=x_indices,
-                    y=values,
-                    mode="lines",
-                    name=f"Metric Type {metric_type_name}"
-                ))
-
-            # layout
-            layout = go.Layout(
-                title="Metric Values by Metric Type",
-                xaxis={"title": "Index"},
-                yaxis={"title": "Metric Value"},
-                legend={"title": "Metric Types"}
-            )
-
-            return {"data": traces, "layout": layout}
-
-    except Exception as e:
-        print(f"Error fetching data for histogram: {e}")
-        return {
-            "data": [],
-            "layout": {"title": "Error loading histogram"}
-        }
-
 class Application:
     def __init__(self):
         self.config = Config()
         self.logger = logging.getLogger(__name__)
         self.logger.debug("Application starting...")
-        # connect to the SQLite database
-        try:
-            self.engine = create_engine(self.config.database.engine_string)
-
-        except Exception as e:
-            self.logger.error("An error occurred: %s", e)
-            raise e
-        self.data = Metrics(self.logger)
+        # standalone, or under gunicorn.conf.py one "writer" process and any number of "worker" processes
+        self.role = os.environ.get("APP_ROLE", "standalone")
+        if self.role not in ("standalone", "worker", "writer"):
+            raise ValueError(f"Unknown APP_ROLE: {self.role}")
+        # compact JSON (or msgpack), compression and conditional GETs for every route
+        self.responses = ResponseManager(self.logger, app, self.config.responses)
+        # connect to the SQLite database through a shared pool and session factory
+        self.connection_manager = ConnectionManager(self.logger, self.config.database)
+        self.engine = self.connection_manager.engine
+        self.session_factory = self.connection_manager.session_factory
+        # route, callback and database timings for /metrics, recorded per thread
+        self.instrumentation = None
+        if self.config.instrumentation.enabled:
+            self.instrumentation = Instrumentation(self.logger, self.config.instrumentation)
+            self.instrumentation.instrument_engine(self.engine)
+            self.instrumentation.instrument_app(app)
+        if self.config.database.auto_migrate and self.role != "worker":
+            Migrations(self.logger, self.engine, self.config.database.migration_batch_size,
+                       self.config.retention.incremental_vacuum).run()
+        # device and metric type lookups are served from memory after warm up
+        self.identity_cache = IdentityCache(self.logger,
+                                            self.config.identity_cache.max_devices,
+                                            self.config.identity_cache.max_metric_types)
+        self.data = Metrics(self.logger, self.identity_cache)
+        self.writer = None
+        if self.role == "worker":
+            # writes go to the writer process, committed changes come back to keep the caches current
+            self.data.ingest = WriterClient(self.logger, self.config.multiprocess)
+        elif self.role == "writer":
+            self.writer = WriterServer(self.logger, self.session_factory, self.data.ingest,
+                                       self.identity_cache, self.config.multiprocess)
+        # days older than retention.raw_days live in memory mapped .npy column files
+        self.cold_storage = None
+        if self.config.cold_storage.enabled:
+            self.cold_storage = ColdStorage(self.logger, self.config.cold_storage.path,
+                                            self.config.retention.batch_size)
+        # the writer process only commits and maintains, the read side lives in the workers
+        serves_reads = self.role != "writer"
+        self.export_manager = None
+        if serves_reads:
+            self.export_manager = ExportManager(self.logger, self.session_factory, self.data,
+                                                self.config.export.chunk_size, self.cold_storage,
+                                                self.config.export.max_limit)
+        # 1m / 1h / 1d aggregates maintained inside every ingest transaction
+        self.rollups = Rollups(self.logger, self.config.rollups.resolutions)
+        if self.config.rollups.enabled:
+            self.data.ingest.add_writer(self.rollups.apply)
+        if self.role != "worker":
+            # aggregates only read rollups over the range they are known to be complete for
+            if self.config.rollups.enabled:
+                self.rollups.start_coverage(self.engine)
+            else:
+                self.rollups.clear_coverage(self.engine)
+        self.aggregates = None
+        if serves_reads:
+            self.aggregates = Aggregates(self.logger,
+                                         self.rollups if self.config.aggregates.use_rollups and self.config.rollups.enabled else None,
+                                         self.cold_storage)
+        # in-process publish/subscribe feeding the Server-Sent Events stream
+        self.pubsub = None
+        if serves_reads:
+            self.pubsub = PubSub(self.logger, self.config.live_updates.subscriber_queue_size,
+                                 self.config.live_updates.max_streams_per_worker)
+            self.data.ingest.add_listener(self.pubsub.on_ingest)
+        # recent points of every series in fixed size arrays, recent windows never touch SQLite;
+        # warmed with the identity cache once every listener is in place
+        self.ring_buffers = None
+        if self.config.ring_buffers.enabled and serves_reads:
+            self.ring_buffers = RingBufferStore(self.logger, self.config.ring_buffers.capacity,
+                                                self.config.ring_buffers.warm_window_ms)
+            self.data.ingest.add_listener(self.ring_buffers.on_ingest)
+        # threshold and rate rules evaluated on every committed value, in each worker from the writer's broadcasts
+        self.alerts = None
+        if self.config.alerts.enabled and serves_reads:
+            self.alerts = AlertManager(self.logger, self.identity_cache, self.config.alerts)
+            self.data.ingest.add_listener(self.alerts.on_ingest)
+        self.row_count = RowCountCache(self.logger, self.config.pagination.count_resync_seconds)
+        self.data.ingest.add_listener(self.row_count.on_ingest)
+        # background retention, deletes expired raw values and rollups in small batches,
+        # started by start_retention() from the process entry points, never by importing this module
+        self.retention = None
+        if self.config.retention.enabled and self.role != "worker":
+            self.retention = RetentionManager(self.logger, self.engine, self.config.retention, self.row_count,
+                                              self.cold_storage)
+        self.ingest_manager = IngestManager(self.logger, self.session_factory, self.data.ingest,
+                                            self.config.ingest.bulk_chunk_size)
+        # optional write-behind mode, a single writer thread group-commits queued payloads
+        self.write_behind = None
+        write_behind_config = self.config.ingest.write_behind
+        if write_behind_config.enabled and self.role == "standalone":
+            self.write_behind = WriteBehindQueue(self.logger, self.session_factory, self.data.ingest,
+                                                 write_behind_config.max_queue_size,
+                                                 write_behind_config.batch_size,
+                                                 write_behind_config.flush_interval_ms)
+            self.write_behind.start()
+        if self.instrumentation is not None:
+            self._add_collectors()
+        if self.role == "worker":
+            # subscribed before warming, what commits meanwhile is replayed on top of the loaded state
+            self.data.ingest.subscribe(self.identity_cache, self._resync)
+        self._warm()
+
+    def build_series(self, session, device_metric_type_id, start_ms, end_ms, width_px, method="lttb"):
+        # raw series reduced to what the chart can actually draw
+        downsample_config = self.config.downsample
+        recent = None
+        if self.ring_buffers is not None:
+            recent = self.ring_buffers.window(device_metric_type_id, start_ms, end_ms)
+        if recent is not None:
+            ts_ms, values = recent
+        else:
+            ts_ms, values = fetch_series(session, device_metric_type_id, start_ms, end_ms,
+                                         cold_storage=self.cold_storage)
+        n_out = target_points(width_px, downsample_config.points_per_pixel, downsample_config.max_points)
+        sampled_ts, sampled_values = downsample(ts_ms, values, n_out, method)
+        return len(ts_ms), sampled_ts.astype("int64"), sampled_values
+
+    def start_retention(self):
+        if self.retention is not None:
+            self.retention.start()
+
+    def _resync(self):
+        # the writer asked for a reload, or updates may have been lost while disconnected
+        self._warm()
+
+    def _warm(self):
+        with DatabaseManager(self.logger, self.session_factory) as session:
+            self.identity_cache.warm(session)
+            if self.ring_buffers is not None:
+                self.ring_buffers.warm(session)
+
+    def _add_collectors(self):
+        self.data.ingest.add_listener(self.instrumentation.on_ingest)
+        caches = [("identity", self.identity_cache)]
+        if self.ring_buffers is not None:
+            caches.append(("ring_buffers", self.ring_buffers))
+        self.instrumentation.add_collector("cache_hits_total", lambda: {
+            (("cache", name),): cache.hits for name, cache in caches
+        })
+        self.instrumentation.add_collector("cache_misses_total", lambda: {
+            (("cache", name),): cache.misses for name, cache in caches
+        })
+        if self.write_behind is not None:
+            self.instrumentation.add_collector("write_behind_queue_depth", self.write_behind.queue.qsize)
+        if self.pubsub is not None:
+            self.instrumentation.add_collector("live_streams_open", self.pubsub.subscriber_count)
+        if self.alerts is not None:
+            self.instrumentation.add_collector("alert_samples_rejected_total", lambda: self.alerts.rejected)
 
 application = Application()
 
+# API-only workers (server.dashboard false, or APP_API_ONLY=1) never import Dash, Plotly or the UI
+api_only = os.environ.get("APP_API_ONLY")
+dash_app = None
+if (application.config.server.dashboard if api_only is None else api_only.lower() not in ("1", "true", "yes")):
+    from dashboard import init_dashboard
+    dash_app = init_dashboard(app, application)
+    if application.instrumentation is not None:
+        application.instrumentation.instrument_dash(dash_app.config.routes_pathname_prefix + "_dash-update-component",
+                                                    dash_app.callback_map)
+
 @app.route("/")
 def home():
     application.logger.info("Home called")
@@ -406,7 +227,9 @@ def post_metric_snapshot():
     # }
     try:
         application.logger.info("Post metric called")
-        with DatabaseManager(application.logger, application.engine) as session:
+        if application.write_behind is not None:
+            return queue_metric_snapshot(request.json)
+        with DatabaseManager(application.logger, application.session_factory) as session:
             data = request.json
             device_id = data["device_id"]
             device_name = data["device_name"]
@@ -422,73 +245,566 @@ def post_metric_snapshot():
                 "status": "success",
                 "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
             }
-            pretty_response = json.dumps(response, indent=4)
-            return app.response_class(pretty_response, content_type="application/json")
+            return application.responses.respond(response)
     
     except Exception as e:
         application.logger.error("An error occurred: %s", e)
         response = {
-            "error": str(e),
+            "error": client_error(e, "Could not store the metric snapshot"),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+def queue_metric_snapshot(data):
+    # validated up front so a bad payload still gets a 400, the write happens later
+    record = parse_payload(data)
+    if not application.write_behind.submit(record):
+        application.logger.warning("Write-behind queue full, rejecting snapshot")
+        response = {
+            "error": "Ingest queue full, retry later",
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=429, headers={"Retry-After": "1"})
+    response = {
+        "data": data["snapshots"],
+        "status": "queued",
+        "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+    }
+    return application.responses.respond(response, status=202)
+
+@app.route(application.config.server.api.endpoints.post_metric_snapshots_bulk, methods=["POST"])
+def post_metric_snapshots_bulk():
+    # body is newline-delimited JSON, one post_metric_snapshot payload per line,
+    # or the compact binary format when sent as BINARY_MIMETYPE (ids registered through register_series),
+    # optionally sent with "Content-Encoding: gzip"
+    try:
+        application.logger.info("Post metric snapshots bulk called")
+        if request.mimetype == BINARY_MIMETYPE:
+            summary = application.ingest_manager.ingest_binary(request.stream,
+                                                               request.headers.get("Content-Encoding"))
+        else:
+            summary = application.ingest_manager.ingest_ndjson(request.stream,
+                                                               request.headers.get("Content-Encoding"))
+        response = {
+            "data": summary,
+            "status": "success",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.register_series, methods=["POST"])
+def register_series():
+    # structure of body:
+    # {"device_id": 1, "device_name": "ConorG",
+    #  "metric_types": [{"device_metric_type_id": 1, "name": "RamUsage"}, ...]}
+    try:
+        application.logger.info("Register series called")
+        data = request.json
+        if not isinstance(data, dict):
+            raise ValueError("Payload must be a JSON object")
+        device_id = int(data["device_id"])
+        metric_types = [(int(metric_type["device_metric_type_id"]), metric_type["name"])
+                        for metric_type in data.get("metric_types", [])]
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            application.data.ingest.register(session, device_id, data["device_name"], metric_types)
+        response = {
+            "data": {
+                "device_id": device_id,
+                "metric_types": [device_metric_type_id for device_metric_type_id, _ in metric_types]
+            },
+            "status": "success",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.get_ingest_stats, methods=["GET"])
+def get_ingest_stats():
+    # queue depth and group commit latency, only populated in write-behind mode
+    stats = {"role": application.role, "write_behind_enabled": application.write_behind is not None}
+    if application.write_behind is not None:
+        stats.update(application.write_behind.stats())
+    if application.ring_buffers is not None:
+        stats["ring_buffers"] = application.ring_buffers.stats()
+    response = {
+        "data": stats,
+        "status": "success",
+        "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+    }
+    return application.responses.respond(response)
+
+@app.route(application.config.server.api.endpoints.get_retention_stats, methods=["GET"])
+def get_retention_stats():
+    # rows and pages reclaimed by the retention job
+    stats = {"retention_enabled": application.retention is not None}
+    if application.retention is not None:
+        stats.update(application.retention.stats())
+    response = {
+        "data": stats,
+        "status": "success",
+        "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+    }
+    return application.responses.respond(response)
+
+@app.route(application.config.server.api.endpoints.metrics, methods=["GET"])
+def metrics():
+    # Prometheus text exposition of the server's own timings and counters
+    if application.instrumentation is None:
+        response = {
+            "error": "Instrumentation is disabled",
             "status": "failure",
             "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
         }
-        pretty_response = json.dumps(response, indent=4)
-        return app.response_class(pretty_response, status=400, content_type="application/json")
+        return application.responses.respond(response, status=404)
+    return app.response_class(application.instrumentation.render(), content_type=PROMETHEUS_MIMETYPE)
+
+@app.route(application.config.server.api.endpoints.invalidate_identity_cache, methods=["POST"])
+def invalidate_identity_cache():
+    # for when devices or metric types are edited in the database directly
+    if application.role == "worker":
+        # the writer reloads first, then tells every worker to resync
+        application.data.ingest.invalidate()
+    else:
+        application.identity_cache.invalidate()
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            application.identity_cache.warm(session)
+    response = {
+        "status": "success",
+        "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+    }
+    return application.responses.respond(response)
 
 @app.route(application.config.server.api.endpoints.get_all_metrics, methods=["GET"])
 def get_all_metrics():
-    session = None
+    # ?format=json|ndjson|csv&device_id=&start=&end=&limit=
+    # start and end are epoch milliseconds or "%d-%m-%Y %H:%M:%S" in UTC
     try:
         application.logger.info("Get all called")
-        with DatabaseManager(application.logger, application.engine) as session:
-            all_metrics = application.data.getAllMetrics(session)
-            if not all_metrics:
-                raise Exception("No metrics found")
-            return_data = [metric.to_dict() for metric in all_metrics]
+        export = application.export_manager.open(
+            request.args.get("format", "json"),
+            device_id=request.args.get("device_id", type=int),
+            start_ms=parse_time_arg(request.args.get("start")),
+            end_ms=parse_time_arg(request.args.get("end")),
+            limit=request.args.get("limit", type=int)
+        )
+        if export is None:
+            raise LookupError("No metrics found")
+        mimetype, body = export
+        # rows are serialized and sent chunk by chunk while the cursor is still open
+        return app.response_class(flask.stream_with_context(body), content_type=mimetype)
+
+    except ValueError as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+    
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=404)
+
+@app.route(application.config.server.api.endpoints.get_metric_values, methods=["GET"])
+def get_metric_values():
+    # ?cursor=<next_cursor from the previous page>&limit=<rows>
+    try:
+        application.logger.info("Get metric values called")
+        cursor = decode_cursor(request.args.get("cursor"))
+        limit = min(request.args.get("limit", 100, type=int), application.config.pagination.max_page_size)
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            rows, next_cursor = application.data.getMetricValuesPage(session, cursor, limit)
+            response = {
+                "data": format_metric_rows(rows),
+                "next_cursor": encode_cursor(next_cursor),
+                "total": application.row_count.count(session),
+                "status": "success",
+                "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+            }
+        return application.responses.respond(response)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.get_current_values, methods=["GET"])
+def get_current_values():
+    # newest value per (device, metric type), optionally for one ?device_id=
+    try:
+        application.logger.info("Get current values called")
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            current_values = application.data.getCurrentValues(session, request.args.get("device_id", type=int))
+            return_data = []
+            for current_value in current_values:
+                row = current_value.to_dict()
+                row["device_name"] = application.identity_cache.get_device_name(current_value.device_id)
+                row["metric_type_name"] = application.identity_cache.get_metric_type_name(
+                    current_value.device_id, current_value.device_metric_type_id)
+                return_data.append(row)
             response = {
                 "data": return_data,
                 "status": "success",
                 "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
             }
-            application.logger.debug(f"Type of response: {type(response)}")
-            pretty_response = json.dumps(response, indent=4)
-            return app.response_class(pretty_response, content_type="application/json")
-    
+        last_modified_ms = max((row["server_ts_ms"] or 0 for row in return_data), default=None)
+        return application.responses.respond(response, last_modified_ms=last_modified_ms)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.get_metric_rollups, methods=["GET"])
+def get_metric_rollups():
+    # ?device_metric_type_id=&start=&end=&max_points=&resolution=1m|1h|1d
+    # without an explicit resolution the finest one that fits in max_points is used
+    try:
+        application.logger.info("Get metric rollups called")
+        device_metric_type_id = request.args.get("device_metric_type_id", type=int)
+        if device_metric_type_id is None:
+            raise ValueError("device_metric_type_id is required")
+        end_ms = parse_time_arg(request.args.get("end")) or int(datetime.now().timestamp() * 1000)
+        start_ms = parse_time_arg(request.args.get("start")) or end_ms - ROLLUP_RESOLUTIONS["1d"]
+        resolution = request.args.get("resolution")
+        if resolution is not None and resolution not in ROLLUP_RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        max_points = request.args.get("max_points", application.config.rollups.default_max_points, type=int)
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            resolution_ms, rows = application.rollups.query(
+                session, device_metric_type_id, start_ms, end_ms, max_points,
+                ROLLUP_RESOLUTIONS.get(resolution)
+            )
+            response = {
+                "data": {
+                    "resolution_ms": resolution_ms,
+                    "buckets": [row.to_dict() for row in rows]
+                },
+                "status": "success",
+                "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+            }
+        return application.responses.respond(response)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.get_metric_series, methods=["GET"])
+def get_metric_series():
+    # ?device_metric_type_id=&start=&end=&width=<chart width in px>&method=lttb|minmax
+    try:
+        application.logger.info("Get metric series called")
+        device_metric_type_id = request.args.get("device_metric_type_id", type=int)
+        if device_metric_type_id is None:
+            raise ValueError("device_metric_type_id is required")
+        method = request.args.get("method", "lttb")
+        if method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f"Unknown downsampling method: {method}")
+        width_px = request.args.get("width", application.config.downsample.default_width_px, type=int)
+        if width_px <= 0:
+            raise ValueError("width must be positive")
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            raw_points, ts_ms, values = application.build_series(
+                session, device_metric_type_id,
+                parse_time_arg(request.args.get("start")),
+                parse_time_arg(request.args.get("end")),
+                width_px, method
+            )
+        response = {
+            "data": {
+                "raw_points": raw_points,
+                "ts_ms": ts_ms.tolist(),
+                "values": values.tolist()
+            },
+            "status": "success",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.get_recent_values, methods=["GET"])
+def get_recent_values():
+    # ?device_metric_type_id=&window_ms=, raw points of the last window_ms, from memory when covered
+    try:
+        device_metric_type_id = request.args.get("device_metric_type_id", type=int)
+        if device_metric_type_id is None:
+            raise ValueError("device_metric_type_id is required")
+        window_ms = request.args.get("window_ms", application.config.ring_buffers.default_window_ms, type=int)
+        if window_ms <= 0:
+            raise ValueError("window_ms must be positive")
+        start_ms = int(datetime.now().timestamp() * 1000) - window_ms
+        source = "memory"
+        recent = None
+        if application.ring_buffers is not None:
+            recent = application.ring_buffers.window(device_metric_type_id, start_ms)
+        if recent is None:
+            source = "database"
+            with DatabaseManager(application.logger, application.session_factory) as session:
+                recent = fetch_series(session, device_metric_type_id, start_ms,
+                                      cold_storage=application.cold_storage)
+        ts_ms, values = recent
+        response = {
+            "data": {
+                "source": source,
+                "ts_ms": ts_ms.tolist(),
+                "values": values.tolist()
+            },
+            "status": "success",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, last_modified_ms=int(ts_ms[-1]) if len(ts_ms) else None)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.get_active_alerts, methods=["GET"])
+def get_active_alerts():
+    # alerts whose condition currently holds
+    if application.alerts is None:
+        response = {
+            "error": "Alerting is disabled",
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=404)
+    response = {
+        "data": application.alerts.active(),
+        "status": "success",
+        "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+    }
+    return application.responses.respond(response)
+
+@app.route(application.config.server.api.endpoints.get_alert_history, methods=["GET"])
+def get_alert_history():
+    # ?limit=&rule=&device_metric_type_id=, fired and resolved events, newest first
+    try:
+        if application.alerts is None:
+            raise ValueError("Alerting is disabled")
+        limit = request.args.get("limit", 100, type=int)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        response = {
+            "data": application.alerts.recent_history(limit, request.args.get("rule"),
+                                                      request.args.get("device_metric_type_id", type=int)),
+            "status": "success",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.get_metric_aggregates, methods=["GET"])
+def get_metric_aggregates():
+    # ?device_id=&device_metric_type_id=|metric_type_name=&start=&end=&bucket=5m&aggs=avg,min,max,p95
+    try:
+        application.logger.info("Get metric aggregates called")
+        aggregates_config = application.config.aggregates
+        device_id = request.args.get("device_id", type=int)
+        device_metric_type_id = request.args.get("device_metric_type_id", type=int)
+        metric_type_name = request.args.get("metric_type_name")
+        bucket_ms = parse_bucket(request.args.get("bucket", aggregates_config.default_bucket))
+        aggregations = parse_aggregations(request.args.get("aggs"))
+        end_ms = parse_time_arg(request.args.get("end")) or int(datetime.now().timestamp() * 1000)
+        start_ms = parse_time_arg(request.args.get("start")) or end_ms - 24 * 60 * 60 * 1000
+        if end_ms <= start_ms:
+            raise ValueError("end must be after start")
+        if (end_ms - start_ms) / bucket_ms > aggregates_config.max_buckets:
+            raise ValueError(f"More than {aggregates_config.max_buckets} buckets requested, use a wider bucket")
+
+        with DatabaseManager(application.logger, application.session_factory) as session:
+            if metric_type_name is not None:
+                if device_id is None:
+                    raise ValueError("metric_type_name needs a device_id")
+                device_metric_type_id = application.identity_cache.get_metric_type_id(device_id, metric_type_name)
+                if device_metric_type_id is None:
+                    metric = session.query(DeviceMetricType.device_metric_type_id)\
+                        .filter(DeviceMetricType.device_id == device_id, DeviceMetricType.name == metric_type_name)\
+                        .first()
+                    if metric is None:
+                        raise ValueError(f"Unknown metric type: {metric_type_name}")
+                    device_metric_type_id = metric[0]
+            rows = application.aggregates.query(session, start_ms, end_ms, bucket_ms, aggregations,
+                                                device_id, device_metric_type_id)
+        response = {
+            "data": {
+                "bucket_ms": bucket_ms,
+                "start_ms": start_ms,
+                "end_ms": end_ms,
+                "buckets": rows
+            },
+            "status": "success",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response)
+
+    except Exception as e:
+        application.logger.error("An error occurred: %s", e)
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+@app.route(application.config.server.api.endpoints.stream_latest_values, methods=["GET"])
+def stream_latest_values():
+    # Server-Sent Events, ?series=<device_id>:<device_metric_type_id>[,...]
+    # the current value of every series is sent first, then one event per ingested value
+    try:
+        keys = parse_series_keys(request.args.get("series"))
+        if not keys:
+            raise ValueError("series is required")
+    except ValueError as e:
+        response = {
+            "error": client_error(e),
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=400)
+
+    # subscribed before the current values are read so nothing committed in between is missed
+    subscription = application.pubsub.subscribe(keys)
+    if subscription is None:
+        application.logger.warning("Live stream refused, %d streams already open",
+                                   application.pubsub.max_subscriptions)
+        response = {
+            "error": "Too many live streams, retry later",
+            "status": "failure",
+            "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+        }
+        return application.responses.respond(response, status=503,
+                                             headers={"Retry-After": str(application.config.live_updates.keepalive_seconds)})
+    try:
+        current = []
+        missing = []
+        for device_id, device_metric_type_id in keys:
+            recent = application.ring_buffers.latest(device_metric_type_id) \
+                if application.ring_buffers is not None else None
+            if recent is None:
+                missing.append((device_id, device_metric_type_id))
+                continue
+            current.append({
+                "device_id": device_id,
+                "device_metric_type_id": device_metric_type_id,
+                "metric_snapshot_id": recent[2],
+                "value": recent[1],
+                "server_ts_ms": recent[0]
+            })
+        if missing:
+            with DatabaseManager(application.logger, application.session_factory) as session:
+                latest_values = [application.data.getLatestValue(session, *key) for key in missing]
+                current.extend(latest.to_dict() for latest in latest_values if latest is not None)
     except Exception as e:
+        application.pubsub.unsubscribe(subscription)
         application.logger.error("An error occurred: %s", e)
         response = {
-            "error": str(e),
+            "error": "Could not read the current values",
             "status": "failure",
             "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
         }
-        pretty_response = json.dumps(response, indent=4)
-        return app.response_class(pretty_response, status=404, content_type="application/json")
+        return application.responses.respond(response, status=400)
+
+    def events():
+        for latest in current:
+            yield b"data: " + dumps(latest) + b"\n\n"
+        while True:
+            message = subscription.get(application.config.live_updates.keepalive_seconds)
+            if message is None:
+                yield b": keepalive\n\n"
+            else:
+                yield b"data: " + dumps(message) + b"\n\n"
+
+    response = app.response_class(events(), content_type="text/event-stream",
+                                  headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # runs when the server closes the response, even if the generator was never started
+    response.call_on_close(lambda: application.pubsub.unsubscribe(subscription))
+    return response
 
 @app.route(application.config.server.api.endpoints.get_metric_snapshot + "/<int:metric_snapshot_id>", methods=["GET"])
 def getMetricSnapshot(metric_snapshot_id):
     try:
         application.logger.info("Get metric snapshot called")
-        with DatabaseManager(application.logger, application.engine) as session:
+        with DatabaseManager(application.logger, application.session_factory) as session:
             snapshot = application.data.getMetricSnapshot(metric_snapshot_id, session)
             if snapshot is None:
-                raise Exception("snapshot not found")
+                raise LookupError("Snapshot not found")
             response = {
                 "data": snapshot.to_dict(),
                 "status": "success",
                 "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
             }
-            pretty_response = json.dumps(response, indent=4)
-            return app.response_class(pretty_response, content_type="application/json")
+            return application.responses.respond(response, last_modified_ms=snapshot.server_ts_ms)
     
     except Exception as e:
         application.logger.error("An error occurred: %s", e)
         response = {
-            "error": str(e),
+            "error": client_error(e),
             "status": "failure",
             "time": datetime.now().strftime("%H:%M:%S %d-%m-%Y")
         }
-        pretty_response = json.dumps(response, indent=4)
-        return app.response_class(pretty_response, content_type="application/json")
+        return application.responses.respond(response, status=404 if isinstance(e, LookupError) else 400)
 
 if __name__ == "__main__":
+    application.start_retention()
     app.run()
@@ -0,0 +1,206 @@
+import operator
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+CONDITIONS = ("threshold", "rate")
+
+@dataclass
+class AlertRule:
+    # threshold: value op limit, rate: change per second op limit, either has to hold for for_seconds
+    name: str
+    condition: str
+    op: str
+    limit: float
+    for_seconds: float = 0
+    device_id: int = None
+    device_metric_type_id: int = None
+    metric: str = None  # metric type name, matched on any device unless device_id is set
+
+    def __post_init__(self):
+        if self.condition not in CONDITIONS:
+            raise ValueError(f"Alert rule {self.name}: condition must be one of {', '.join(CONDITIONS)}")
+        if self.op not in OPERATORS:
+            raise ValueError(f"Alert rule {self.name}: op must be one of {', '.join(OPERATORS)}")
+        self.compare = OPERATORS[self.op]
+
+    def matches(self, device_id, device_metric_type_id, name):
+        return ((self.device_id is None or self.device_id == device_id)
+                and (self.device_metric_type_id is None or self.device_metric_type_id == device_metric_type_id)
+                and (self.metric is None or self.metric == name))
+
+def parse_rule(rule):
+    try:
+        return AlertRule(
+            name=rule["name"],
+            condition=rule.get("condition", "threshold"),
+            op=rule.get("op", ">"),
+            limit=float(rule["value"]),
+            for_seconds=float(rule.get("for_seconds", 0)),
+            device_id=rule.get("device_id"),
+            device_metric_type_id=rule.get("device_metric_type_id"),
+            metric=rule.get("metric")
+        )
+    except KeyError as e:
+        raise ValueError(f"Alert rule is missing {e.args[0]}")
+
+class SeriesState:
+    # everything one rule remembers about one series, constant size
+    __slots__ = ("device_id", "last_server_ts_ms", "last_ts_ms", "last_value", "breach_since_ms", "active",
+                 "fired_ms", "value")
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.last_server_ts_ms = None
+        self.last_ts_ms = None
+        self.last_value = None
+        self.breach_since_ms = None
+        self.active = False
+        self.fired_ms = None
+        self.value = None
+
+class AlertManager:
+    # rules are evaluated on every committed value, no query ever looks back at history.
+    # samples are ordered by the server timestamp, a client clock can be skewed or in the future.
+    # a bulk body is committed with a single server timestamp, so within one commit the client
+    # timestamps only space its samples out: the newest lands on the server time, the others keep
+    # their distance before it but never fall behind the series' previous sample. rates are taken
+    # between samples with distinct times, a sample sharing the previous one's time is skipped
+    def __init__(self, logger, identity_cache, alerts_config):
+        self.logger = logger
+        self.identity_cache = identity_cache
+        self.rules = [parse_rule(rule.data) for rule in alerts_config.rules]
+        self.history = deque(maxlen=alerts_config.history_size)
+        self._lock = threading.Lock()
+        self._rules_by_type = {}  # device_metric_type_id -> [(rule index, rule)]
+        self._states = {}         # (rule index, device_metric_type_id) -> SeriesState
+        # samples committed before one already evaluated for their series
+        self.rejected = 0
+        self.logger.info("Alerting with %d rules", len(self.rules))
+
+    def _rules_for(self, device_id, device_metric_type_id):
+        rules = self._rules_by_type.get(device_metric_type_id)
+        if rules is None:
+            name = self.identity_cache.get_metric_type_name(device_id, device_metric_type_id)
+            rules = [(index, rule) for index, rule in enumerate(self.rules)
+                     if rule.matches(device_id, device_metric_type_id, name)]
+            if name is not None or not any(rule.metric for rule in self.rules):
+                # a type the cache does not know yet is looked up again next time
+                self._rules_by_type[device_metric_type_id] = rules
+        return rules
+
+    def on_ingest(self, values):
+        # BulkIngest listener
+        if not self.rules:
+            return
+        values = [value for value in values if value.value is not None and value.server_ts_ms is not None]
+        # newest client timestamp of every series in every commit, it is placed at the commit's server time
+        newest = {}
+        for value in values:
+            if value.client_ts_ms is not None:
+                key = (value.device_metric_type_id, value.server_ts_ms)
+                newest[key] = max(newest.get(key, value.client_ts_ms), value.client_ts_ms)
+        timed = []
+        for value in values:
+            ts_ms = value.server_ts_ms
+            if value.client_ts_ms is not None:
+                ts_ms -= newest[(value.device_metric_type_id, value.server_ts_ms)] - value.client_ts_ms
+            timed.append((value.server_ts_ms, ts_ms, value))
+        timed.sort(key=lambda item: item[:2])
+        with self._lock:
+            for server_ts_ms, ts_ms, value in timed:
+                for index, rule in self._rules_for(value.device_id, value.device_metric_type_id):
+                    self._evaluate(index, rule, value, server_ts_ms, ts_ms)
+
+    def _evaluate(self, index, rule, value, server_ts_ms, ts_ms):
+        key = (index, value.device_metric_type_id)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = SeriesState(value.device_id)
+        if state.last_server_ts_ms is not None and server_ts_ms < state.last_server_ts_ms:
+            # committed before a sample the series has already moved past
+            self.rejected += 1
+            self.logger.warning("Alert %s skipped a late sample of series %d (snapshot %d)",
+                                rule.name, value.device_metric_type_id, value.metric_snapshot_id)
+            return
+        state.last_server_ts_ms = server_ts_ms
+        if state.last_ts_ms is not None:
+            ts_ms = max(ts_ms, state.last_ts_ms)
+
+        if rule.condition == "threshold":
+            observed = value.value
+        elif state.last_ts_ms is None:
+            observed = None
+        elif ts_ms == state.last_ts_ms:
+            # no interval to take a rate over, the earlier sample stays the reference
+            return
+        else:
+            observed = (value.value - state.last_value) * 1000 / (ts_ms - state.last_ts_ms)
+        state.last_ts_ms = ts_ms
+        state.last_value = value.value
+        if observed is None:
+            return
+
+        if rule.compare(observed, rule.limit):
+            if state.breach_since_ms is None:
+                state.breach_since_ms = ts_ms
+            state.value = observed
+            if not state.active and ts_ms - state.breach_since_ms >= rule.for_seconds * 1000:
+                state.active = True
+                state.fired_ms = ts_ms
+                self._record("fired", rule, value, observed, ts_ms)
+        else:
+            state.breach_since_ms = None
+            if state.active:
+                state.active = False
+                self._record("resolved", rule, value, observed, ts_ms)
+
+    def _record(self, event, rule, value, observed, ts_ms):
+        self.history.append({
+            "event": event,
+            "rule": rule.name,
+            "device_id": value.device_id,
+            "device_metric_type_id": value.device_metric_type_id,
+            "metric_snapshot_id": value.metric_snapshot_id,
+            "value": observed,
+            "limit": rule.limit,
+            "ts_ms": ts_ms
+        })
+        if event == "fired":
+            self.logger.warning("Alert %s fired for series %d: %s %s %s",
+                                rule.name, value.device_metric_type_id, observed, rule.op, rule.limit)
+        else:
+            self.logger.info("Alert %s resolved for series %d", rule.name, value.device_metric_type_id)
+
+    def active(self):
+        with self._lock:
+            return [
+                {
+                    "rule": self.rules[index].name,
+                    "device_id": state.device_id,
+                    "device_metric_type_id": device_metric_type_id,
+                    "value": state.value,
+                    "limit": self.rules[index].limit,
+                    "breach_since_ms": state.breach_since_ms,
+                    "fired_ms": state.fired_ms
+                }
+                for (index, device_metric_type_id), state in self._states.items() if state.active
+            ]
+
+    def recent_history(self, limit=100, rule=None, device_metric_type_id=None):
+        # newest first
+        with self._lock:
+            events = list(self.history)
+        events.reverse()
+        if rule is not None:
+            events = [event for event in events if event["rule"] == rule]
+        if device_metric_type_id is not None:
+            events = [event for event in events if event["device_metric_type_id"] == device_metric_type_id]
+        return events[:limit]
+
+    def thresholds(self, device_id, device_metric_type_id):
+        # threshold limits that apply to a series, for drawing them on the gauge
+        with self._lock:
+            return [rule.limit for _, rule in self._rules_for(device_id, device_metric_type_id)
+                    if rule.condition == "threshold"]
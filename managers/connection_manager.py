@@ -0,0 +1,41 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+class ConnectionManager:
+    def __init__(self, logger, database_config):
+        self.logger = logger
+        self.pragmas = database_config.sqlite_pragmas.data
+        pool_config = database_config.pool
+        try:
+            # one pooled engine and one session factory for the lifetime of the process
+            self.engine = create_engine(
+                database_config.engine_string,
+                poolclass=QueuePool,
+                pool_size=pool_config.pool_size,
+                max_overflow=pool_config.max_overflow,
+                pool_timeout=pool_config.pool_timeout,
+                pool_pre_ping=pool_config.pool_pre_ping,
+                pool_recycle=pool_config.pool_recycle
+            )
+            if self.engine.dialect.name == "sqlite":
+                event.listen(self.engine, "connect", self._apply_pragmas)
+            self.session_factory = scoped_session(sessionmaker(bind=self.engine))
+        except Exception as e:
+            self.logger.error("An error occurred: %s", e)
+            raise e
+        self.logger.debug("Connection pool ready (size %d, overflow %d)",
+                          pool_config.pool_size, pool_config.max_overflow)
+
+    def _apply_pragmas(self, dbapi_connection, connection_record):
+        # runs once per new pooled connection, not per checkout
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma, value in self.pragmas.items():
+                cursor.execute(f"PRAGMA {pragma}={value}")
+        finally:
+            cursor.close()
+
+    def dispose(self):
+        self.session_factory.remove()
+        self.engine.dispose()
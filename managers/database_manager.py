@@ -1,28 +1,28 @@
-from sqlalchemy.orm import sessionmaker
-
 class DatabaseManager:
-    def __init__(self, logger, engine):
+    def __init__(self, logger, session_factory):
         self.logger = logger
+        self.session_factory = session_factory
         try:
-            # create a session
-            Session = sessionmaker(bind=engine)
-            self.session = Session()
+            # thread-local session from the shared scoped session factory
+            self.session = session_factory()
             self.logger.debug("Connected to the database")
         except Exception as e:
             self.logger.error("An error occurred: %s", e)
             raise e
 
     def __enter__(self):
-        self.logger.info("Transaction started.")
+        self.logger.debug("Transaction started.")
         return self.session
 
     def __exit__(self, exc_type, exc_value, traceback):
         if exc_type is None:
-            self.logger.info("Transaction committed.")
+            self.logger.debug("Transaction committed.")
             self.session.commit()
         else:
-            self.logger.error(f"Transaction rolled back due to: {exc_value}")
+            self.logger.error("Transaction rolled back due to: %s", exc_value)
             self.session.rollback()
         self.session.close()
-        self.logger.info("Session closed.")
-        return False
\ No newline at end of file
+        if hasattr(self.session_factory, "remove"):
+            self.session_factory.remove()
+        self.logger.debug("Session closed.")
+        return False
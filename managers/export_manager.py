@@ -0,0 +1,84 @@
+import csv
+import io
+from datetime import datetime
+from itertools import chain
+from managers.database_manager import DatabaseManager
+from managers.response_manager import dumps
+
+EXPORT_COLUMNS = [
+    "metric_snapshot_id", "device_id",
+    "client_timestamp_utc", "client_timezone_mins",
+    "server_timestamp_utc", "server_timezone_mins",
+    "client_ts_ms", "server_ts_ms"
+]
+
+EXPORT_MIMETYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+class ExportManager:
+    def __init__(self, logger, session_factory, metrics, chunk_size=1000, cold_storage=None,
+                 max_limit=1000000):
+        self.logger = logger
+        self.session_factory = session_factory
+        self.metrics = metrics
+        self.chunk_size = chunk_size
+        self.cold_storage = cold_storage
+        self.max_limit = max_limit
+
+    def open(self, export_format, device_id=None, start_ms=None, end_ms=None, limit=None):
+        # returns (mimetype, body generator), or None when nothing matches
+        if export_format not in EXPORT_MIMETYPES:
+            raise ValueError(f"Unsupported format: {export_format}")
+        if limit is not None:
+            # a negative LIMIT means no limit at all in SQLite
+            if limit < 1:
+                raise ValueError("limit must be positive")
+            limit = min(limit, self.max_limit)
+        chunks = self._chunks(device_id, start_ms, end_ms, limit)
+        # pull the first chunk eagerly so an empty export can still be answered with a 404
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            chunks.close()
+            return None
+        serializer = getattr(self, f"_serialize_{export_format}")
+        return EXPORT_MIMETYPES[export_format], serializer(chain([first_chunk], chunks))
+
+    def _chunks(self, device_id, start_ms, end_ms, limit):
+        if self.cold_storage is not None:
+            # tiered days come first, they are older than every row still in SQLite
+            for chunk in self.cold_storage.iter_snapshots(device_id, start_ms, end_ms, limit, self.chunk_size):
+                if limit is not None:
+                    limit -= len(chunk)
+                yield chunk
+            if limit == 0:
+                return
+        with DatabaseManager(self.logger, self.session_factory) as session:
+            yield from self.metrics.iterMetricSnapshots(session, device_id, start_ms, end_ms,
+                                                        limit, self.chunk_size)
+
+    def _serialize_json(self, chunks):
+        # same envelope as before, written out a chunk at a time
+        yield b'{"data":['
+        first = True
+        for chunk in chunks:
+            body = b",".join(dumps(dict(zip(EXPORT_COLUMNS, row))) for row in chunk)
+            yield body if first else b"," + body
+            first = False
+        yield b'],"status":"success","time":' + dumps(datetime.now().strftime("%H:%M:%S %d-%m-%Y")) + b"}"
+
+    def _serialize_ndjson(self, chunks):
+        for chunk in chunks:
+            yield b"".join(dumps(dict(zip(EXPORT_COLUMNS, row))) + b"\n" for row in chunk)
+
+    def _serialize_csv(self, chunks):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
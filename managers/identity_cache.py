@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import select
+from db.models import Device, DeviceMetricType
+
+class IdentityCache:
+    def __init__(self, logger, max_devices=1024, max_metric_types=16384):
+        self.logger = logger
+        self.max_devices = max_devices
+        self.max_metric_types = max_metric_types
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        # entries added while warm() queries, applied again on top of what it loaded
+        self._pending = None
+        self.hits = 0
+        self.misses = 0
+        self._reset()
+
+    def _reset(self):
+        self._devices = OrderedDict()            # device_id -> device_name
+        self._device_ids_by_name = {}            # device_name -> device_id
+        self._metric_types = OrderedDict()       # (device_id, device_metric_type_id) -> name
+        self._metric_type_ids_by_name = {}       # (device_id, name) -> device_metric_type_id
+        # listings can only be served from memory while nothing has been evicted
+        self._complete = False
+
+    def warm(self, session):
+        with self._warm_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                self._warm(session)
+            finally:
+                with self._lock:
+                    self._pending = None
+
+    def _warm(self, session):
+        devices = session.execute(select(Device.device_id, Device.device_name)).all()
+        metric_types = session.execute(select(
+            DeviceMetricType.device_id,
+            DeviceMetricType.device_metric_type_id,
+            DeviceMetricType.name
+        )).all()
+        with self._lock:
+            self._reset()
+            for device_id, device_name in devices:
+                self._add_device(device_id, device_name)
+            for device_id, device_metric_type_id, name in metric_types:
+                self._add_metric_type(device_id, device_metric_type_id, name)
+            self._complete = (len(devices) <= self.max_devices
+                              and len(metric_types) <= self.max_metric_types)
+            for add, args in self._pending:
+                add(*args)
+        self.logger.info("Identity cache warmed with %d devices, %d metric types",
+                         len(devices), len(metric_types))
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+        self.logger.info("Identity cache invalidated")
+
+    def get_device_name(self, device_id):
+        with self._lock:
+            return self._lookup(self._devices, device_id)
+
+    def get_device_id(self, device_name):
+        with self._lock:
+            device_id = self._device_ids_by_name.get(device_name)
+            return self._lookup(self._devices, device_id) and device_id
+
+    def get_metric_type_name(self, device_id, device_metric_type_id):
+        with self._lock:
+            return self._lookup(self._metric_types, (device_id, device_metric_type_id))
+
+    def get_metric_type_id(self, device_id, name):
+        with self._lock:
+            device_metric_type_id = self._metric_type_ids_by_name.get((device_id, name))
+            key = (device_id, device_metric_type_id)
+            return self._lookup(self._metric_types, key) and device_metric_type_id
+
+    def resolve_device_id(self, session, device_name):
+        device_id = self.get_device_id(device_name)
+        if device_id is None:
+            device = session.query(Device.device_id).filter(Device.device_name == device_name).first()
+            device_id = device[0] if device else None
+        return device_id
+
+    def resolve_series(self, session, device_name, metric_type):
+        # names to (device_id, device_metric_type_id), from memory when possible
+        device_id = self.resolve_device_id(session, device_name)
+        if device_id is None:
+            return None, None
+        device_metric_type_id = self.get_metric_type_id(device_id, metric_type)
+        if device_metric_type_id is None:
+            metric = session.query(DeviceMetricType.device_metric_type_id)\
+                .filter(DeviceMetricType.device_id == device_id, DeviceMetricType.name == metric_type)\
+                .first()
+            if metric is None:
+                return device_id, None
+            device_metric_type_id = metric[0]
+        return device_id, device_metric_type_id
+
+    def list_devices(self):
+        # None means the cache cannot answer and the caller should query the database
+        with self._lock:
+            if not self._complete:
+                return None
+            return sorted(self._devices.items())
+
+    def list_metric_types(self, device_id):
+        with self._lock:
+            if not self._complete:
+                return None
+            return sorted((device_metric_type_id, name)
+                          for (owner_id, device_metric_type_id), name in self._metric_types.items()
+                          if owner_id == device_id)
+
+    def add_device(self, device_id, device_name):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._add_device, (device_id, device_name)))
+            self._add_device(device_id, device_name)
+
+    def add_metric_type(self, device_id, device_metric_type_id, name):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._add_metric_type, (device_id, device_metric_type_id, name)))
+            self._add_metric_type(device_id, device_metric_type_id, name)
+
+    def _lookup(self, entries, key):
+        value = entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _add_device(self, device_id, device_name):
+        self._devices[device_id] = device_name
+        self._devices.move_to_end(device_id)
+        self._device_ids_by_name[device_name] = device_id
+        while len(self._devices) > self.max_devices:
+            evicted_id, evicted_name = self._devices.popitem(last=False)
+            if self._device_ids_by_name.get(evicted_name) == evicted_id:
+                del self._device_ids_by_name[evicted_name]
+            self._complete = False
+
+    def _add_metric_type(self, device_id, device_metric_type_id, name):
+        key = (device_id, device_metric_type_id)
+        self._metric_types[key] = name
+        self._metric_types.move_to_end(key)
+        self._metric_type_ids_by_name[(device_id, name)] = device_metric_type_id
+        while len(self._metric_types) > self.max_metric_types:
+            (evicted_device_id, evicted_type_id), evicted_name = self._metric_types.popitem(last=False)
+            name_key = (evicted_device_id, evicted_name)
+            if self._metric_type_ids_by_name.get(name_key) == evicted_type_id:
+                del self._metric_type_ids_by_name[name_key]
+            self._complete = False
@@ -0,0 +1,114 @@
+import gzip
+import json
+import zlib
+from db.ingest import client_error, parse_payload
+from db.binary_ingest import iter_snapshot_records
+from managers.database_manager import DatabaseManager
+
+# what a truncated or corrupt (gzip) body raises while it is being read
+READ_ERRORS = (OSError, EOFError, zlib.error)
+
+class IngestManager:
+    def __init__(self, logger, session_factory, ingest, chunk_size=500):
+        self.logger = logger
+        self.session_factory = session_factory
+        self.ingest = ingest
+        self.chunk_size = chunk_size
+
+    def open_stream(self, stream, content_encoding=None):
+        # decompress on the fly so the body never has to be held in memory
+        if content_encoding and content_encoding.lower() == "gzip":
+            return gzip.GzipFile(fileobj=stream, mode="rb")
+        return stream
+
+    def ingest_ndjson(self, stream, content_encoding=None):
+        results = []
+        chunk = []
+        line_number = 0
+        lines = iter(self.open_stream(stream, content_encoding))
+        while True:
+            try:
+                line = next(lines, None)
+            except READ_ERRORS as e:
+                # chunks already committed stay written, the unreadable rest is reported as one entry
+                self.logger.error("Bulk body unreadable after line %d: %s", line_number, e)
+                results.append({"line": line_number + 1, "status": "rejected",
+                                "error": f"Unreadable body after line {line_number}"})
+                break
+            if line is None:
+                break
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                chunk.append((line_number, parse_payload(json.loads(line))))
+            except ValueError as e:
+                # json.JSONDecodeError is a ValueError as well
+                results.append({"line": line_number, "status": "rejected", "error": str(e)})
+                continue
+            if len(chunk) >= self.chunk_size:
+                results.extend(self._ingest_chunk(chunk))
+                chunk = []
+        if chunk:
+            results.extend(self._ingest_chunk(chunk))
+        return self._summary(results, "line")
+
+    def ingest_binary(self, stream, content_encoding=None):
+        # compact body of numeric ids, see db/binary_ingest.py for the layout;
+        # read record by record and written in chunks like the NDJSON path
+        results = []
+        chunk = []
+        record_number = 0
+        try:
+            # a bad header rejects the whole body
+            records = iter_snapshot_records(self.open_stream(stream, content_encoding))
+        except READ_ERRORS:
+            raise ValueError("Unreadable binary body")
+        try:
+            for record_number, record in enumerate(records, start=1):
+                chunk.append((record_number, record))
+                if len(chunk) >= self.chunk_size:
+                    results.extend(self._ingest_chunk(chunk, "record"))
+                    chunk = []
+        except (ValueError, *READ_ERRORS) as e:
+            # the framing is lost, whatever was decoded before the error is still written
+            self.logger.error("Binary body unreadable after record %d: %s", record_number, e)
+            if chunk:
+                results.extend(self._ingest_chunk(chunk, "record"))
+            summary = self._summary(results, "record")
+            summary["error"] = str(e) if isinstance(e, ValueError) else f"Unreadable body after record {record_number}"
+            return summary
+        if chunk:
+            results.extend(self._ingest_chunk(chunk, "record"))
+        return self._summary(results, "record")
+
+    def _summary(self, results, key):
+        results.sort(key=lambda result: result[key])
+        accepted = sum(1 for result in results if result["status"] == "accepted")
+        return {
+            "accepted": accepted,
+            "rejected": len(results) - accepted,
+            "results": results
+        }
+
+    def _ingest_chunk(self, chunk, key="line"):
+        numbers = [number for number, _ in chunk]
+        try:
+            # one transaction per chunk
+            with DatabaseManager(self.logger, self.session_factory) as session:
+                ingested = self.ingest.ingest(session, [record for _, record in chunk])
+        except Exception as e:
+            self.logger.error("Bulk chunk starting at %s %d failed: %s", key, numbers[0], e)
+            if len(chunk) > 1:
+                # isolate the bad record instead of rejecting the whole chunk
+                return [result for item in chunk for result in self._ingest_chunk([item], key)]
+            return [{key: numbers[0], "status": "rejected", "error": client_error(e)}]
+
+        results = []
+        for number, result in zip(numbers, ingested):
+            if result.error:
+                results.append({key: number, "status": "rejected", "error": result.error})
+            else:
+                results.append({key: number, "status": "accepted",
+                                "metric_snapshot_id": result.metric_snapshot_id})
+        return results
@@ -0,0 +1,233 @@
+import bisect
+import threading
+import time
+from flask import request
+from sqlalchemy import event
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name -> (type, help), every recorded or collected metric is described here
+METRICS = {
+    "http_request_duration_seconds": ("histogram", "Time spent in a Flask route, by rule, method and status"),
+    "dash_callback_duration_seconds": ("histogram", "Time spent in a Dash callback request, by callback"),
+    "db_transaction_duration_seconds": ("histogram", "Time from BEGIN to COMMIT or ROLLBACK"),
+    "db_query_duration_seconds": ("histogram", "Time spent executing a single statement"),
+    "db_queries_total": ("counter", "Statements sent to the database, by outcome"),
+    "ingested_values_total": ("counter", "Metric values committed by ingest"),
+    "cache_hits_total": ("counter", "Lookups served from an in-memory cache"),
+    "cache_misses_total": ("counter", "Lookups an in-memory cache could not serve"),
+    "write_behind_queue_depth": ("gauge", "Records waiting for the write-behind writer"),
+    "live_streams_open": ("gauge", "Server-Sent Events streams open in this worker"),
+    "alert_samples_rejected_total": ("counter", "Samples alert rules skipped, committed before one already evaluated"),
+    "process_start_time_seconds": ("gauge", "Start time of the process since the epoch")
+}
+
+class Instrumentation:
+    # every thread records into its own shard without locking, scrapes merge the shards
+    def __init__(self, logger, instrumentation_config):
+        self.logger = logger
+        self.server_timing = instrumentation_config.server_timing
+        self.buckets = sorted(bucket / 1000 for bucket in instrumentation_config.buckets_ms)
+        self.started = time.time()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []          # [(thread, counters, histograms)]
+        self._retired = ({}, {})   # shards of finished threads, folded together
+        self._collectors = []
+        self._dash_update_path = None
+        self._callback_map = {}
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = ({}, {})
+            self._local.shard = shard
+            with self._lock:
+                # the threaded dev server starts a thread per request, keep the list short
+                if len(self._shards) >= 64:
+                    self._retire()
+                self._shards.append((threading.current_thread(), *shard))
+        return shard
+
+    def inc(self, name, amount=1, labels=()):
+        counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, labels=()):
+        histograms = self._shard()[1]
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            # one slot per bucket, one for +Inf, then the sum
+            histogram = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram[-1] += seconds
+
+    def add_collector(self, name, collect):
+        # collect() returns a number or {labels: number}, read at scrape time
+        self._collectors.append((name, collect))
+
+    def on_ingest(self, ingested):
+        self.inc("ingested_values_total", len(ingested))
+
+    def instrument_engine(self, engine):
+        # every statement and transaction, ORM sessions and Core connections alike
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+        event.listen(engine, "begin", self._begin)
+        event.listen(engine, "commit", lambda connection: self._end(connection, "commit"))
+        event.listen(engine, "rollback", lambda connection: self._end(connection, "rollback"))
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        # kept on the execution context, a statement that fails leaves nothing behind on the connection
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        self._record_query(context, "ok")
+
+    def _handle_error(self, exception_context):
+        if exception_context.execution_context is not None:
+            self._record_query(exception_context.execution_context, "error")
+
+    def _record_query(self, context, outcome):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        del context._query_started
+        seconds = time.perf_counter() - started
+        self.inc("db_queries_total", labels=(("outcome", outcome),))
+        self.observe("db_query_duration_seconds", seconds)
+        timings = getattr(self._local, "timings", None)
+        if timings is not None:
+            timings[0] += 1
+            timings[1] += seconds
+
+    def _begin(self, connection):
+        connection.info["transaction_started"] = time.perf_counter()
+
+    def _end(self, connection, outcome):
+        started = connection.info.pop("transaction_started", None)
+        if started is not None:
+            self.observe("db_transaction_duration_seconds", time.perf_counter() - started,
+                         (("outcome", outcome),))
+
+    def instrument_dash(self, dash_update_path, callback_map):
+        # Dash serves every callback from one route, requests there are also labelled by callback
+        self._dash_update_path = dash_update_path
+        self._callback_map = callback_map
+
+    def _callback_name(self):
+        data = request.get_json(silent=True) or {}
+        callback = self._callback_map.get(data.get("output"), {}).get("callback")
+        return getattr(callback, "__name__", "unknown")
+
+    def instrument_app(self, app):
+        # route and callback timings, plus an optional Server-Timing header
+        @app.before_request
+        def start_timer():
+            self._local.request_started = time.perf_counter()
+            self._local.timings = [0, 0.0] if self.server_timing else None
+
+        @app.after_request
+        def record(response):
+            started = getattr(self._local, "request_started", None)
+            if started is None:
+                return response
+            seconds = time.perf_counter() - started
+            rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            self.observe("http_request_duration_seconds", seconds,
+                         (("method", request.method), ("route", rule), ("status", str(response.status_code))))
+            if rule == self._dash_update_path:
+                self.observe("dash_callback_duration_seconds", seconds, (("callback", self._callback_name()),))
+            timings = self._local.timings
+            if timings is not None:
+                response.headers.add("Server-Timing",
+                                     f'db;dur={timings[1] * 1000:.2f};desc="{timings[0]} queries", '
+                                     f"total;dur={seconds * 1000:.2f}")
+            return response
+
+        @app.teardown_request
+        def clear(exception):
+            self._local.request_started = None
+            self._local.timings = None
+
+    def _retire(self):
+        # caller holds the lock, dead threads can no longer write to their shard
+        alive = []
+        for thread, counters, histograms in self._shards:
+            if thread.is_alive():
+                alive.append((thread, counters, histograms))
+            else:
+                self._merge(self._retired, counters, histograms)
+        self._shards = alive
+
+    def _merge(self, into, counters, histograms):
+        for key, value in list(counters.items()):
+            into[0][key] = into[0].get(key, 0) + value
+        for key, histogram in list(histograms.items()):
+            merged = into[1].get(key)
+            if merged is None:
+                into[1][key] = list(histogram)
+            else:
+                for index, value in enumerate(histogram):
+                    merged[index] += value
+
+    def snapshot(self):
+        # (counters, histograms) summed over every thread, live shards are copied not locked
+        with self._lock:
+            self._retire()
+            shards = [shard[1:] for shard in self._shards]
+            merged = ({}, {})
+            self._merge(merged, *self._retired)
+        for counters, histograms in shards:
+            self._merge(merged, counters, histograms)
+        return merged
+
+    def render(self):
+        counters, histograms = self.snapshot()
+        series = {}
+        for (name, labels), value in counters.items():
+            series.setdefault(name, []).append((labels, value))
+        for name, collect in self._collectors:
+            try:
+                value = collect()
+            except Exception as e:
+                self.logger.error("Collector %s failed: %s", name, e)
+                continue
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            series.setdefault(name, []).extend(items)
+        series.setdefault("process_start_time_seconds", []).append(((), self.started))
+        for (name, labels), histogram in histograms.items():
+            series.setdefault(name, []).append((labels, histogram))
+
+        lines = []
+        for name in sorted(series):
+            kind, help_text = METRICS.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series[name], key=lambda item: item[0]):
+                if kind == "histogram":
+                    lines.extend(self._histogram_lines(name, labels, value))
+                else:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(self, name, labels, histogram):
+        cumulative = 0
+        for bound, count in zip(self.buckets + [float("inf")], histogram):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            yield f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}"
+        yield f"{name}_sum{_labels(labels)} {_number(histogram[-1])}"
+        yield f"{name}_count{_labels(labels)} {cumulative}"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
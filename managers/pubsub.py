@@ -0,0 +1,92 @@
+import queue
+import threading
+
+def parse_series_keys(value):
+    # "<device_id>:<device_metric_type_id>[,...]" -> set of key tuples
+    keys = set()
+    for series in (value or "").split(","):
+        if not series:
+            continue
+        try:
+            device_id, device_metric_type_id = series.split(":")
+            keys.add((int(device_id), int(device_metric_type_id)))
+        except ValueError:
+            raise ValueError(f"Invalid series: {series}, expected <device_id>:<device_metric_type_id>")
+    return keys
+
+class Subscription:
+    def __init__(self, keys, queue_size):
+        self.keys = set(keys)
+        self.queue = queue.Queue(maxsize=queue_size)
+
+    def put(self, message):
+        # a slow client loses its oldest update rather than blocking ingest
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class PubSub:
+    def __init__(self, logger, queue_size=100, max_subscriptions=4):
+        self.logger = logger
+        self.queue_size = queue_size
+        # every open stream holds a server thread, past the cap the caller turns clients away
+        self.max_subscriptions = max_subscriptions
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._subscribers = {}  # (device_id, device_metric_type_id) -> set of Subscription
+
+    def subscribe(self, keys):
+        # None when max_subscriptions streams are already open
+        subscription = Subscription(keys, self.queue_size)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscriptions:
+                return None
+            self._subscriptions.add(subscription)
+            for key in subscription.keys:
+                self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            for key in subscription.keys:
+                subscribers = self._subscribers.get(key)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[key]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def publish(self, key, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def on_ingest(self, values):
+        # BulkIngest listener, only series somebody is watching cost anything
+        if not self._subscribers:
+            return
+        for value in values:
+            self.publish((value.device_id, value.device_metric_type_id), {
+                "device_id": value.device_id,
+                "device_metric_type_id": value.device_metric_type_id,
+                "metric_snapshot_id": value.metric_snapshot_id,
+                "value": value.value,
+                "server_ts_ms": value.server_ts_ms
+            })
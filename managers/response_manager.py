@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+from datetime import datetime, timezone
+from flask import request
+
+# optional accelerators, the standard library covers everything without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+
+def _default(value):
+    # NumPy scalars and arrays that slip through to the encoder
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value, pretty=False):
+    # bytes, compact unless pretty is asked for
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(value, default=_default, option=option)
+    if pretty:
+        return json.dumps(value, indent=4, default=_default).encode()
+    return json.dumps(value, separators=(",", ":"), default=_default).encode()
+
+class ResponseManager:
+    def __init__(self, logger, app, responses_config):
+        self.logger = logger
+        self.app = app
+        self.compression = responses_config.compression
+        self.etags = responses_config.etags
+        self.msgpack = responses_config.msgpack and msgpack is not None
+
+    def respond(self, response, status=200, headers=None, last_modified_ms=None):
+        # response is the usual {"data"/"error", "status", "time"} envelope
+        mimetype = self._negotiate_mimetype()
+        pretty = request.args.get("pretty", "").lower() in ("1", "true", "yes")
+
+        etag = None
+        if self.etags and status == 200 and request.method in ("GET", "HEAD"):
+            # "time" changes every second, the validator covers everything else
+            envelope = {key: value for key, value in response.items() if key != "time"}
+            if mimetype == JSON_MIMETYPE and not pretty:
+                body = dumps(envelope)
+                etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+                if "time" in response:
+                    # put the time back in without encoding the payload a second time
+                    body = body[:-1] + b',"time":' + dumps(response["time"]) + b"}"
+            else:
+                # same content, different bytes, so a different validator per representation
+                variant = "pretty" if mimetype == JSON_MIMETYPE else "msgpack"
+                etag = hashlib.blake2b(dumps(envelope), digest_size=16).hexdigest() + "-" + variant
+                body = None
+            matched = self._not_modified(etag, last_modified_ms)
+            if matched is not None:
+                result = self.app.response_class(status=304)
+                result.vary.update(("Accept", "Accept-Encoding"))
+                result.set_etag(matched)
+                return result
+        else:
+            body = None
+
+        if body is None:
+            body = msgpack.packb(response, default=_default) if mimetype != JSON_MIMETYPE \
+                else dumps(response, pretty)
+        result = self.app.response_class(body, status=status, mimetype=mimetype, headers=headers)
+        return self._finish(result, etag, last_modified_ms, body)
+
+    def _negotiate_mimetype(self):
+        if self.msgpack:
+            best = request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES, JSON_MIMETYPE)
+            if best in MSGPACK_MIMETYPES:
+                return best
+        return JSON_MIMETYPE
+
+    def _not_modified(self, etag, last_modified_ms):
+        # the validator the client already holds, or None when the body has to be sent
+        if request.if_none_match:
+            for candidate in (etag, f"{etag}-gzip", f"{etag}-br"):
+                if request.if_none_match.contains(candidate):
+                    return candidate
+            return None
+        if last_modified_ms is not None and request.if_modified_since is not None \
+                and int(last_modified_ms // 1000) <= int(request.if_modified_since.timestamp()):
+            return etag
+        return None
+
+    def _finish(self, result, etag, last_modified_ms, body):
+        result.vary.update(("Accept", "Accept-Encoding"))
+        encoding = self._negotiate_encoding(body)
+        if encoding == "br":
+            result.set_data(brotli.compress(body, quality=self.compression.brotli_quality))
+        elif encoding == "gzip":
+            result.set_data(gzip.compress(body, compresslevel=self.compression.gzip_level))
+        if encoding is not None:
+            result.content_encoding = encoding
+        if etag is not None:
+            # one validator per representation, compressed bodies are not byte identical
+            result.set_etag(f"{etag}-{encoding}" if encoding else etag)
+        if last_modified_ms is not None:
+            result.last_modified = datetime.fromtimestamp(last_modified_ms / 1000, timezone.utc)
+        return result
+
+    def _negotiate_encoding(self, body):
+        if body is None or not self.compression.enabled or len(body) < self.compression.min_size:
+            return None
+        accepted = request.accept_encodings
+        if brotli is not None and accepted["br"]:
+            return "br"
+        if accepted["gzip"]:
+            return "gzip"
+        return None
@@ -0,0 +1,165 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import delete, select, tuple_, update
+from db.models import MetricRollup, MetricSnapshot, MetricValue, RollupCoverage
+from db.rollups import ROLLUP_RESOLUTIONS
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+class RetentionManager:
+    def __init__(self, logger, engine, retention_config, row_count=None, cold_storage=None):
+        self.logger = logger
+        self.engine = engine
+        self.config = retention_config
+        self.row_count = row_count
+        self.cold_storage = cold_storage
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "last_run": None,
+            "last_run_seconds": 0.0,
+            "last_reclaimed": {},
+            "total_snapshots_deleted": 0,
+            "total_values_deleted": 0,
+            "total_rollups_deleted": 0,
+            "total_pages_freed": 0,
+            "total_values_tiered": 0,
+            "total_cold_values_dropped": 0
+        }
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+        self.logger.info("Retention started (raw %d days, every %d s)",
+                         self.config.raw_days, self.config.interval_seconds)
+
+    def stop(self):
+        self._stopping.set()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error("Retention run failed: %s", e)
+            self._stopping.wait(self.config.interval_seconds)
+
+    def run_once(self, now_ms=None):
+        started = time.perf_counter()
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        raw_cutoff_ms = now_ms - self.config.raw_days * DAY_MS
+        snapshots = values = tiered = cold_dropped = 0
+        if self.cold_storage is not None:
+            # expired raw days move to the columnar files instead of being deleted, the rest of
+            # the newest expired day stays in SQLite until the day is complete
+            _, tiered = self.cold_storage.tier(self.engine, raw_cutoff_ms)
+            if self.row_count is not None:
+                self.row_count.adjust(-tiered)
+            cold_dropped = self.cold_storage.drop_before(now_ms - self.config.cold_days * DAY_MS)
+        else:
+            snapshots, values = self.delete_raw(raw_cutoff_ms)
+        rollups = 0
+        for policy in self.config.rollup_days:
+            rollups += self.delete_rollups(ROLLUP_RESOLUTIONS[policy["resolution"]],
+                                           now_ms - policy["days"] * DAY_MS)
+        pages = self.incremental_vacuum()
+
+        reclaimed = {
+            "snapshots_deleted": snapshots,
+            "values_deleted": values,
+            "rollups_deleted": rollups,
+            "pages_freed": pages,
+            "values_tiered": tiered,
+            "cold_values_dropped": cold_dropped
+        }
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._stats["runs"] += 1
+            self._stats["last_run"] = datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+            self._stats["last_run_seconds"] = elapsed
+            self._stats["last_reclaimed"] = reclaimed
+            self._stats["total_snapshots_deleted"] += snapshots
+            self._stats["total_values_deleted"] += values
+            self._stats["total_rollups_deleted"] += rollups
+            self._stats["total_pages_freed"] += pages
+            self._stats["total_values_tiered"] += tiered
+            self._stats["total_cold_values_dropped"] += cold_dropped
+        self.logger.info("Retention deleted %d snapshots, %d values and %d rollups, tiered %d values, "
+                         "dropped %d cold values, freed %d pages in %.2fs",
+                         snapshots, values, rollups, tiered, cold_dropped, pages, elapsed)
+        return reclaimed
+
+    def delete_raw(self, cutoff_ms):
+        # oldest first, one short transaction per batch so ingest is never locked out for long
+        snapshots_deleted = 0
+        values_deleted = 0
+        while not self._stopping.is_set():
+            with self.engine.begin() as connection:
+                snapshot_ids = connection.execute(
+                    select(MetricSnapshot.metric_snapshot_id)
+                    .where(MetricSnapshot.server_ts_ms < cutoff_ms)
+                    .order_by(MetricSnapshot.server_ts_ms)
+                    .limit(self.config.batch_size)
+                ).scalars().all()
+                if not snapshot_ids:
+                    break
+                values = connection.execute(
+                    delete(MetricValue).where(MetricValue.metric_snapshot_id.in_(snapshot_ids))
+                ).rowcount
+                snapshots_deleted += connection.execute(
+                    delete(MetricSnapshot).where(MetricSnapshot.metric_snapshot_id.in_(snapshot_ids))
+                ).rowcount
+            values_deleted += values
+            if self.row_count is not None:
+                self.row_count.adjust(-values)
+            time.sleep(self.config.pause_ms / 1000)
+        return snapshots_deleted, values_deleted
+
+    def delete_rollups(self, resolution_ms, cutoff_ms):
+        deleted = 0
+        rollups = MetricRollup.__table__
+        while not self._stopping.is_set():
+            with self.engine.begin() as connection:
+                batch = connection.execute(
+                    select(rollups.c.device_metric_type_id, rollups.c.bucket_start_ms)
+                    .where(rollups.c.resolution_ms == resolution_ms, rollups.c.bucket_start_ms < cutoff_ms)
+                    .limit(self.config.batch_size)
+                ).all()
+                if not batch:
+                    break
+                deleted += connection.execute(delete(rollups).where(
+                    rollups.c.resolution_ms == resolution_ms,
+                    tuple_(rollups.c.device_metric_type_id, rollups.c.bucket_start_ms).in_(
+                        [tuple(row) for row in batch])
+                )).rowcount
+            time.sleep(self.config.pause_ms / 1000)
+        # aggregates read the deleted range raw from now on
+        coverage = RollupCoverage.__table__
+        with self.engine.begin() as connection:
+            connection.execute(update(coverage).where(
+                coverage.c.resolution_ms == resolution_ms,
+                coverage.c.start_ms < cutoff_ms
+            ).values(start_ms=cutoff_ms - cutoff_ms % resolution_ms + resolution_ms))
+        return deleted
+
+    def incremental_vacuum(self):
+        # hands free pages back to the filesystem, needs auto_vacuum=INCREMENTAL (see Migrations)
+        if self.engine.dialect.name != "sqlite":
+            return 0
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                return 0
+            before = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+            # pysqlite only steps the pragma once (one page), executescript runs it to completion
+            connection.connection.executescript(
+                f"PRAGMA incremental_vacuum({int(self.config.incremental_vacuum_pages)});")
+            after = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        return before - after
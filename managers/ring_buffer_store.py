@@ -0,0 +1,180 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+import numpy as np
+from sqlalchemy import text
+
+class SeriesRingBuffer:
+    # grows up to capacity, then the oldest point is overwritten first, kept in server_ts_ms order
+    __slots__ = ("device_id", "capacity", "ts_ms", "values", "snapshot_ids", "head", "size", "complete_from_ms")
+
+    def __init__(self, device_id, capacity, complete_from_ms):
+        self.device_id = device_id
+        self.capacity = capacity
+        self.ts_ms = array("q")
+        self.values = array("d")
+        self.snapshot_ids = array("q")
+        self.head = 0  # slot of the oldest point
+        self.size = 0
+        # every point at or after this time is held in the buffer
+        self.complete_from_ms = complete_from_ms
+
+    def append(self, ts_ms, value, snapshot_id):
+        # converted before anything moves, a bad value must not leave half a point behind
+        ts_ms, value, snapshot_id = int(ts_ms), float(value), int(snapshot_id)
+        if self.size == self.capacity:
+            self.complete_from_ms = max(self.complete_from_ms, self.ts_ms[self.head] + 1)
+            self.head = (self.head + 1) % self.capacity
+            self.size -= 1
+        elif len(self.ts_ms) < self.capacity:
+            # quiet series only hold the slots they have used, head stays at 0 until the ring is full
+            self.ts_ms.append(0)
+            self.values.append(0.0)
+            self.snapshot_ids.append(0)
+        slot = (self.head + self.size) % self.capacity
+        self.size += 1
+        # concurrent ingest transactions can commit slightly out of order, walk the point back into place
+        while slot != self.head:
+            previous = (slot - 1) % self.capacity
+            if self.ts_ms[previous] <= ts_ms:
+                break
+            self.ts_ms[slot] = self.ts_ms[previous]
+            self.values[slot] = self.values[previous]
+            self.snapshot_ids[slot] = self.snapshot_ids[previous]
+            slot = previous
+        self.ts_ms[slot] = ts_ms
+        self.values[slot] = value
+        self.snapshot_ids[slot] = snapshot_id
+
+    def latest(self):
+        if not self.size:
+            return None
+        slot = (self.head + self.size - 1) % self.capacity
+        return self.ts_ms[slot], self.values[slot], self.snapshot_ids[slot]
+
+    def window(self, start_ms=None, end_ms=None):
+        # (ts_ms, values) arrays in time order, unrolled from the ring with two slices
+        end = self.head + self.size
+        if end <= self.capacity:
+            ts_ms = self.ts_ms[self.head:end]
+            values = self.values[self.head:end]
+        else:
+            ts_ms = self.ts_ms[self.head:] + self.ts_ms[:end - self.capacity]
+            values = self.values[self.head:] + self.values[:end - self.capacity]
+        low = bisect_left(ts_ms, start_ms) if start_ms is not None else 0
+        high = bisect_left(ts_ms, end_ms) if end_ms is not None else len(ts_ms)
+        return ts_ms[low:high], values[low:high]
+
+class RingBufferStore:
+    def __init__(self, logger, capacity=1024, warm_window_ms=3600000):
+        self.logger = logger
+        self.capacity = capacity
+        self.warm_window_ms = warm_window_ms
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self._buffers = {}  # device_metric_type_id -> SeriesRingBuffer
+        # values ingested while a warm query runs, replayed into the new buffers before the swap
+        self._replay = None
+        # series without a buffer had no points since this time
+        self._complete_from_ms = int(time.time() * 1000)
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, session):
+        with self._warm_lock:
+            with self._lock:
+                self._replay = []
+            try:
+                self._warm(session)
+            finally:
+                with self._lock:
+                    self._replay = None
+
+    def _warm(self, session):
+        # newest `capacity` points of every series inside the warm window, one query
+        warm_from_ms = int(time.time() * 1000) - self.warm_window_ms
+        rows = session.execute(text("""
+            SELECT device_id, device_metric_type_id, server_ts_ms, value, metric_snapshot_id, newest
+            FROM (
+                SELECT ms.device_id, mv.device_metric_type_id, ms.server_ts_ms, mv.value, mv.metric_snapshot_id,
+                       row_number() OVER (
+                           PARTITION BY mv.device_metric_type_id
+                           ORDER BY ms.server_ts_ms DESC, mv.metric_snapshot_id DESC
+                       ) AS newest
+                FROM metric_snapshots ms
+                JOIN metric_values mv ON mv.metric_snapshot_id = ms.metric_snapshot_id
+                WHERE ms.server_ts_ms >= :warm_from AND mv.value IS NOT NULL
+            )
+            WHERE newest <= :capacity
+            ORDER BY device_metric_type_id, server_ts_ms, metric_snapshot_id
+        """), {"warm_from": warm_from_ms, "capacity": self.capacity}).all()
+
+        buffers = {}
+        for device_id, device_metric_type_id, ts_ms, value, snapshot_id, newest in rows:
+            buffer = buffers.get(device_metric_type_id)
+            if buffer is None:
+                # a full buffer only vouches for what it holds, otherwise for the whole warm window
+                complete_from_ms = ts_ms + 1 if newest == self.capacity else warm_from_ms
+                buffer = buffers[device_metric_type_id] = SeriesRingBuffer(device_id, self.capacity, complete_from_ms)
+            buffer.append(ts_ms, value, snapshot_id)
+        with self._lock:
+            # commits that landed while the query ran, the query may or may not have seen them
+            seen = {(row[1], row[4]) for row in rows}
+            replay = [value for value in self._replay
+                      if (value.device_metric_type_id, value.metric_snapshot_id) not in seen]
+            self._append(buffers, warm_from_ms, replay)
+            self._buffers = buffers
+            self._complete_from_ms = warm_from_ms
+        self.logger.info("Ring buffers warmed with %d points for %d series", len(rows), len(buffers))
+
+    def on_ingest(self, values):
+        # BulkIngest listener, runs after commit so the buffers never hold rolled back points
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(values)
+            self._append(self._buffers, self._complete_from_ms, values)
+
+    def _append(self, buffers, complete_from_ms, values):
+        for value in values:
+            if value.value is None or value.server_ts_ms is None:
+                continue
+            buffer = buffers.get(value.device_metric_type_id)
+            if buffer is None:
+                buffer = buffers[value.device_metric_type_id] = SeriesRingBuffer(
+                    value.device_id, self.capacity, complete_from_ms)
+            try:
+                buffer.append(value.server_ts_ms, value.value, value.metric_snapshot_id)
+            except (TypeError, ValueError):
+                self.logger.warning("Skipped non-numeric value for series %s", value.device_metric_type_id)
+
+    def latest(self, device_metric_type_id):
+        # (ts_ms, value, metric_snapshot_id) or None
+        with self._lock:
+            buffer = self._buffers.get(device_metric_type_id)
+            return buffer.latest() if buffer is not None else None
+
+    def window(self, device_metric_type_id, start_ms, end_ms=None):
+        # (ts_ms, values) as NumPy views of the copied slices, or None when the buffer
+        # cannot vouch for the whole window and the caller has to read the database
+        with self._lock:
+            buffer = self._buffers.get(device_metric_type_id)
+            complete_from_ms = buffer.complete_from_ms if buffer is not None else self._complete_from_ms
+            if start_ms is None or start_ms < complete_from_ms:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if buffer is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+            ts_ms, values = buffer.window(start_ms, end_ms)
+        return np.frombuffer(ts_ms, dtype=np.int64), np.frombuffer(values, dtype=np.float64)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "series": len(self._buffers),
+                "points": sum(buffer.size for buffer in self._buffers.values()),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses
+            }
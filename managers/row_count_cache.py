@@ -0,0 +1,32 @@
+import threading
+import time
+from sqlalchemy import func, select
+from db.models import MetricValue
+
+class RowCountCache:
+    def __init__(self, logger, resync_seconds=300):
+        self.logger = logger
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+        self._count = None
+        self._synced_at = 0.0
+
+    def count(self, session):
+        # exact count at most every resync_seconds, kept current in between by ingest
+        with self._lock:
+            if self._count is not None and time.monotonic() - self._synced_at < self.resync_seconds:
+                return self._count
+        count = session.execute(select(func.count()).select_from(MetricValue)).scalar()
+        with self._lock:
+            self._count = count
+            self._synced_at = time.monotonic()
+        self.logger.debug("Row count resynced: %d", count)
+        return count
+
+    def adjust(self, delta):
+        with self._lock:
+            if self._count is not None:
+                self._count = max(0, self._count + delta)
+
+    def on_ingest(self, values):
+        self.adjust(len(values))
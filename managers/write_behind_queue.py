@@ -0,0 +1,111 @@
+import atexit
+import queue
+import threading
+import time
+from managers.database_manager import DatabaseManager
+
+class WriteBehindQueue:
+    def __init__(self, logger, session_factory, ingest, max_queue_size=10000,
+                 batch_size=500, flush_interval_ms=200):
+        self.logger = logger
+        self.session_factory = session_factory
+        self.ingest = ingest
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "commits": 0,
+            "records_written": 0,
+            "records_rejected": 0,
+            "records_dropped": 0,
+            "last_commit_ms": 0.0,
+            "max_commit_ms": 0.0,
+            "total_commit_ms": 0.0
+        }
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+        self.logger.info("Write-behind queue started (max %d, batch %d, %.0f ms)",
+                         self.queue.maxsize, self.batch_size, self.flush_interval * 1000)
+
+    def submit(self, record):
+        # False tells the caller to push back on the client
+        if self._stopping.is_set():
+            return False
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            return False
+
+    def stop(self, timeout=30):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        self.logger.info("Write-behind queue drained, %d records left", self.queue.qsize())
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self.queue.qsize()
+        stats["queue_capacity"] = self.queue.maxsize
+        stats["avg_commit_ms"] = stats["total_commit_ms"] / stats["commits"] if stats["commits"] else 0.0
+        return stats
+
+    def _run(self):
+        # single writer, drains whatever is left once stop has been requested
+        while not (self._stopping.is_set() and self.queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._commit(batch)
+
+    def _collect(self):
+        # flush when the batch is full or the oldest record has waited flush_interval
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, batch):
+        start = time.perf_counter()
+        try:
+            with DatabaseManager(self.logger, self.session_factory) as session:
+                results = self.ingest.ingest(session, batch)
+        except Exception as e:
+            self.logger.error("Write-behind group commit of %d records failed: %s", len(batch), e)
+            if len(batch) > 1:
+                # isolate the bad record instead of losing the whole group
+                for record in batch:
+                    self._commit([record])
+            else:
+                with self._stats_lock:
+                    self._stats["records_dropped"] += 1
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        rejected = [result.error for result in results if result.error]
+        for error in rejected:
+            self.logger.warning("Write-behind record rejected: %s", error)
+        with self._stats_lock:
+            self._stats["commits"] += 1
+            self._stats["records_written"] += len(batch) - len(rejected)
+            self._stats["records_rejected"] += len(rejected)
+            self._stats["last_commit_ms"] = elapsed_ms
+            self._stats["max_commit_ms"] = max(self._stats["max_commit_ms"], elapsed_ms)
+            self._stats["total_commit_ms"] += elapsed_ms
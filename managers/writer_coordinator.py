@@ -0,0 +1,375 @@
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from managers.database_manager import DatabaseManager
+
+# SQLite takes one writer at a time, so in a multi-worker deployment every write is handed to a
+# single writer process over a Unix socket. The writer group-commits what the workers send and
+# pushes every committed change back to them, so each worker's in-memory caches stay current.
+#
+# worker -> writer  ("ingest", [SnapshotRecord]) | ("register", (device_id, name, metric_types)) | ("invalidate", None)
+# writer -> worker  ("ok", result) | ("error", exception name, message)
+# subscribers get   ("subscribed",) first, then ("values", [IngestedValue]) | ("identity", devices, metric_types) | ("resync",)
+
+def _authkey():
+    # the gunicorn master generates one per deployment and hands it to the writer and every worker,
+    # without it nothing connects
+    authkey = os.environ.get("APP_WRITER_AUTHKEY")
+    if not authkey:
+        raise RuntimeError("APP_WRITER_AUTHKEY is not set, start the deployment with gunicorn -c gunicorn.conf.py")
+    return bytes.fromhex(authkey)
+
+class WriteRequest:
+    def __init__(self, op, payload):
+        self.op = op
+        self.payload = payload
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class Subscriber:
+    def __init__(self, logger, connection, queue_size):
+        self.logger = logger
+        self.connection = connection
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+        # set when a message had to be dropped, the worker then reloads its caches
+        self.overflowed = False
+        self._thread = threading.Thread(target=self._run, name="writer-subscriber", daemon=True)
+        self._thread.start()
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def close(self):
+        self.closed = True
+        self.put(None)
+
+    def _run(self):
+        try:
+            while True:
+                message = self.queue.get()
+                if message is None:
+                    break
+                self.connection.send(message)
+                if self.overflowed and self.queue.empty():
+                    self.overflowed = False
+                    self.connection.send(("resync",))
+        except (OSError, EOFError):
+            self.logger.info("Writer subscriber disconnected")
+        self.closed = True
+        self.connection.close()
+
+class WriterServer:
+    def __init__(self, logger, session_factory, ingest, identity_cache, multiprocess_config):
+        self.logger = logger
+        self.session_factory = session_factory
+        self.ingest = ingest
+        self.identity_cache = identity_cache
+        self.socket_path = multiprocess_config.socket_path
+        self.authkey = _authkey()
+        self.batch_size = multiprocess_config.batch_size
+        self.flush_interval = multiprocess_config.flush_interval_ms / 1000
+        self.subscriber_queue_size = multiprocess_config.subscriber_queue_size
+        self.requests = queue.Queue()
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._listener = None
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._stats_lock = threading.Lock()
+        self._stats = {"commits": 0, "records": 0, "failed_requests": 0, "max_commit_ms": 0.0}
+        ingest.add_listener(self._publish_values)
+
+    def listen(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        # the socket is created owner-only, never briefly reachable by other users
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+
+    def serve_forever(self):
+        if self._listener is None:
+            self.listen()
+        self._thread.start()
+        self.logger.info("Writer listening on %s (batch %d, %.0f ms)",
+                         self.socket_path, self.batch_size, self.flush_interval * 1000)
+        while not self._stopping.is_set():
+            try:
+                connection = self._listener.accept()
+            except AuthenticationError as e:
+                self.logger.warning("Rejected writer connection: %s", e)
+                continue
+            except OSError:
+                # the listener was closed by stop()
+                break
+            threading.Thread(target=self._serve_connection, args=(connection,),
+                             name="writer-connection", daemon=True).start()
+        self._thread.join()
+        self.logger.info("Writer stopped, %d requests left", self.requests.qsize())
+
+    def stop(self):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        if self._listener is not None:
+            self._listener.close()
+        with self._subscribers_lock:
+            for subscriber in self._subscribers:
+                subscriber.close()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._subscribers_lock:
+            stats["subscribers"] = sum(1 for subscriber in self._subscribers if not subscriber.closed)
+        stats["queue_depth"] = self.requests.qsize()
+        return stats
+
+    def _serve_connection(self, connection):
+        try:
+            message = connection.recv()
+            if message == ("subscribe",):
+                subscriber = Subscriber(self.logger, connection, self.subscriber_queue_size)
+                # queued ahead of every broadcast, the worker starts warming once it arrives
+                subscriber.put(("subscribed",))
+                with self._subscribers_lock:
+                    self._subscribers = [subscriber for subscriber in self._subscribers if not subscriber.closed]
+                    self._subscribers.append(subscriber)
+                return
+            while True:
+                request = WriteRequest(*message)
+                self.requests.put(request)
+                request.done.wait()
+                if request.error is not None:
+                    connection.send(("error", type(request.error).__name__, str(request.error)))
+                else:
+                    connection.send(("ok", request.result))
+                message = connection.recv()
+        except (OSError, EOFError):
+            connection.close()
+
+    def _run(self):
+        # the only thread in the deployment that writes, drains the queue once stop is requested
+        while not (self._stopping.is_set() and self.requests.empty()):
+            batch = self._collect()
+            ingest_requests = [request for request in batch if request.op == "ingest"]
+            if ingest_requests:
+                self._commit(ingest_requests)
+            for request in batch:
+                if request.op != "ingest":
+                    self._execute(request)
+
+    def _collect(self):
+        # waits flush_interval for more requests so concurrent workers share one commit
+        try:
+            batch = [self.requests.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        records = len(batch[0].payload) if batch[0].op == "ingest" else 0
+        deadline = time.monotonic() + self.flush_interval
+        while records < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            if request.op == "ingest":
+                records += len(request.payload)
+        return batch
+
+    def _commit(self, batch):
+        records = [record for request in batch for record in request.payload]
+        start = time.perf_counter()
+        try:
+            with DatabaseManager(self.logger, self.session_factory) as session:
+                results = self.ingest.ingest(session, records)
+        except Exception as e:
+            if len(batch) > 1:
+                # one bad request must not fail the workers it was grouped with
+                for request in batch:
+                    self._commit([request])
+                return
+            self.logger.error("Writer commit of %d records failed: %s", len(records), e)
+            with self._stats_lock:
+                self._stats["failed_requests"] += 1
+            batch[0].error = e
+            batch[0].done.set()
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats["commits"] += 1
+            self._stats["records"] += len(records)
+            self._stats["max_commit_ms"] = max(self._stats["max_commit_ms"], elapsed_ms)
+        self._publish_identity([record for record, result in zip(records, results) if not result.error])
+        offset = 0
+        for request in batch:
+            request.result = results[offset:offset + len(request.payload)]
+            offset += len(request.payload)
+            request.done.set()
+
+    def _execute(self, request):
+        try:
+            if request.op == "register":
+                device_id, device_name, metric_types = request.payload
+                with DatabaseManager(self.logger, self.session_factory) as session:
+                    self.ingest.register(session, device_id, device_name, metric_types)
+                self._broadcast(("identity", [(device_id, device_name)],
+                                 [(device_id, device_metric_type_id, name) for device_metric_type_id, name in metric_types]))
+            elif request.op == "invalidate":
+                # edited outside the app, every process reloads from the database
+                self.identity_cache.invalidate()
+                with DatabaseManager(self.logger, self.session_factory) as session:
+                    self.identity_cache.warm(session)
+                self._broadcast(("resync",))
+            else:
+                raise ValueError(f"Unknown writer operation: {request.op}")
+        except Exception as e:
+            with self._stats_lock:
+                self._stats["failed_requests"] += 1
+            request.error = e
+        request.done.set()
+
+    def _publish_values(self, ingested):
+        # BulkIngest listener, runs after every commit on the writer thread
+        self._broadcast(("values", ingested))
+
+    def _publish_identity(self, records):
+        # names that arrived with the records, binary records carry none and were registered earlier
+        devices = {record.device_id: record.device_name for record in records if record.device_name}
+        metric_types = {
+            (record.device_id, device_metric_type_id): name
+            for record in records for device_metric_type_id, name, _ in record.values if name
+        }
+        if devices or metric_types:
+            self._broadcast(("identity", list(devices.items()),
+                             [(device_id, device_metric_type_id, name)
+                              for (device_id, device_metric_type_id), name in metric_types.items()]))
+
+    def _broadcast(self, message):
+        with self._subscribers_lock:
+            subscribers = [subscriber for subscriber in self._subscribers if not subscriber.closed]
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+class WriterClient:
+    # stands in for BulkIngest in worker processes, writes are forwarded to the writer process
+    # and committed changes come back through the subscription
+    def __init__(self, logger, multiprocess_config):
+        self.logger = logger
+        self.socket_path = multiprocess_config.socket_path
+        self.authkey = _authkey()
+        self.timeout = multiprocess_config.request_timeout_seconds
+        self.listeners = []
+        self._local = threading.local()
+        self._stopping = threading.Event()
+
+    def add_listener(self, listener):
+        # listener(values) is called with the IngestedValue list of every commit in the deployment
+        self.listeners.append(listener)
+
+    def add_writer(self, writer):
+        # writers run inside the writer process's transaction, nothing to do here
+        pass
+
+    def ingest(self, session, records):
+        return self._call("ingest", list(records))
+
+    def register(self, session, device_id, device_name, metric_types):
+        self._call("register", (device_id, device_name, list(metric_types)))
+
+    def invalidate(self):
+        self._call("invalidate", None)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = Client(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+        return connection
+
+    def _call(self, op, payload):
+        # one connection per worker thread, a broken one is replaced on the next call
+        try:
+            connection = self._connection()
+            connection.send((op, payload))
+            if not connection.poll(self.timeout):
+                raise TimeoutError(f"Writer did not answer within {self.timeout} s")
+            reply = connection.recv()
+        except (OSError, EOFError) as e:
+            connection = getattr(self._local, "connection", None)
+            if connection is not None:
+                connection.close()
+            self._local.connection = None
+            raise RuntimeError(f"Writer unavailable: {e}")
+        if reply[0] == "error":
+            _, name, message = reply
+            raise ValueError(message) if name == "ValueError" else RuntimeError(f"Writer {name}: {message}")
+        return reply[1]
+
+    def subscribe(self, identity_cache, on_resync):
+        # background thread applying the writer's broadcasts, reconnects if the writer restarts;
+        # returns once the writer has registered the subscription, so caches warmed afterwards miss nothing
+        subscribed = threading.Event()
+
+        def run():
+            backoff = 0.5
+            while not self._stopping.is_set():
+                try:
+                    connection = Client(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+                except OSError as e:
+                    self.logger.warning("Writer subscription failed, retrying: %s", e)
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 10)
+                    continue
+                if backoff > 0.5:
+                    # updates may have been missed while disconnected
+                    on_resync()
+                backoff = 0.5
+                try:
+                    connection.send(("subscribe",))
+                    while True:
+                        message = connection.recv()
+                        if message[0] == "subscribed":
+                            subscribed.set()
+                            continue
+                        self._apply(message, identity_cache, on_resync)
+                except (OSError, EOFError):
+                    self.logger.warning("Writer subscription lost, reconnecting")
+                    backoff = 1
+                finally:
+                    connection.close()
+
+        threading.Thread(target=run, name="writer-subscription", daemon=True).start()
+        if not subscribed.wait(self.timeout):
+            raise RuntimeError(f"Writer subscription not established within {self.timeout} s")
+
+    def _apply(self, message, identity_cache, on_resync):
+        if message[0] == "values":
+            for listener in self.listeners:
+                try:
+                    listener(message[1])
+                except Exception as e:
+                    self.logger.error("Ingest listener failed: %s", e)
+        elif message[0] == "identity":
+            _, devices, metric_types = message
+            for device_id, device_name in devices:
+                identity_cache.add_device(device_id, device_name)
+            for device_id, device_metric_type_id, name in metric_types:
+                identity_cache.add_metric_type(device_id, device_metric_type_id, name)
+        elif message[0] == "resync":
+            on_resync()
+
+    def stop(self):
+        self._stopping.set()
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+import db.ingest
+import lib_config.config
+from db.ingest import SnapshotRecord
+from db.migrations import Migrations
+from db.rollups import Rollups
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "lib_config", "config.json")
+DAY_MS = 24 * 60 * 60 * 1000
+# a UTC midnight, so every rollup resolution starts a bucket here
+T0 = 1700000000000 - 1700000000000 % DAY_MS
+
+@pytest.fixture
+def logger():
+    return logging.getLogger("tests")
+
+@pytest.fixture
+def engine(tmp_path, logger):
+    # a fresh file per test, built the way auto_migrate builds a new database
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    Migrations(logger, engine).run()
+    yield engine
+    engine.dispose()
+
+@pytest.fixture(scope="session")
+def main_module(tmp_path_factory):
+    # the app module is a singleton, imported once against its own database and config;
+    # tests that share it use device ids of their own
+    path = tmp_path_factory.mktemp("app")
+    with open(CONFIG_PATH) as file:
+        config = json.load(file)
+    config["server"]["dashboard"] = False
+    config["database"]["engine_string"] = f"sqlite:///{path / 'app.db'}?check_same_thread=False"
+    config["cold_storage"]["path"] = str(path / "cold")
+    config["multiprocess"]["socket_path"] = str(path / "writer.sock")
+    config["logging_config"]["console_output"]["level"] = "WARNING"
+    config["logging_config"]["file_output"]["enabled"] = False
+    (path / "config.json").write_text(json.dumps(config))
+    engine = create_engine(config["database"]["engine_string"])
+    Migrations(logging.getLogger("tests"), engine).run()
+    engine.dispose()
+    os.environ["APP_CONFIG_PATH"] = str(path / "config.json")
+    os.environ["APP_API_ONLY"] = "1"
+    import main
+    return main
+
+@pytest.fixture
+def client(main_module):
+    return main_module.app.test_client()
+
+@pytest.fixture
+def rollups(logger):
+    return Rollups(logger, ["1m", "1h", "1d"])
+
+@pytest.fixture
+def session_factory(engine):
+    factory = scoped_session(sessionmaker(bind=engine))
+    yield factory
+    factory.remove()
+
+@pytest.fixture
+def clock(monkeypatch):
+    # server_ts_ms of the next ingest call, tests move it by assigning clock[0]
+    now = [T0]
+    monkeypatch.setattr(db.ingest, "server_timestamp", lambda: ("14-11-2023 00:00:00", 0, now[0]))
+    return now
+
+def record(device_id, values, device_name="device", client_timestamp_utc="14-11-2023 00:00:00"):
+    # values: [(device_metric_type_id, metric_value)], metric types are named after their id
+    return SnapshotRecord(device_id, device_name, client_timestamp_utc, 0,
+                          [(device_metric_type_id, f"type-{device_metric_type_id}", value)
+                           for device_metric_type_id, value in values])
+
+@pytest.fixture
+def root_logging():
+    # Config replaces the root handlers, put the test process back afterwards
+    root = logging.getLogger()
+    level = root.level
+    yield
+    for handler in lib_config.config._installed_logging["handlers"]:
+        root.removeHandler(handler)
+        handler.close()
+    if lib_config.config._installed_logging["listener"] is not None:
+        lib_config.config._installed_logging["listener"].stop()
+    lib_config.config._installed_logging.update(handlers=[], listener=None)
+    root.setLevel(level)
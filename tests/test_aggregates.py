@@ -0,0 +1,117 @@
+import pytest
+from analytics.aggregates import Aggregates, parse_aggregations, parse_bucket
+from db.ingest import BulkIngest
+from managers.database_manager import DatabaseManager
+from conftest import DAY_MS, T0, record
+from test_rollups import MINUTE_MS, ingest_series
+
+AGGREGATIONS = ["min", "max", "avg", "sum", "count"]
+
+def query(logger, session_factory, rollups, bucket_ms, start_ms=T0, end_ms=T0 + 2 * DAY_MS):
+    with DatabaseManager(logger, session_factory) as session:
+        return Aggregates(logger, rollups).query(session, start_ms, end_ms, bucket_ms, AGGREGATIONS)
+
+def assert_same_buckets(rows, expected):
+    assert [(row["device_metric_type_id"], row["bucket_start_ms"], row["count"]) for row in rows] == \
+           [(row["device_metric_type_id"], row["bucket_start_ms"], row["count"]) for row in expected]
+    for row, raw in zip(rows, expected):
+        assert row["min"] == raw["min"] and row["max"] == raw["max"]
+        assert row["sum"] == pytest.approx(raw["sum"]) and row["avg"] == pytest.approx(raw["avg"])
+
+@pytest.mark.parametrize("bucket_ms", [MINUTE_MS * 15, 60 * MINUTE_MS, DAY_MS])
+def test_rollups_maintained_at_ingest_match_raw(logger, engine, session_factory, clock, rollups, bucket_ms):
+    rollups.start_coverage(engine, now_ms=T0 - 1)
+    ingest = BulkIngest(logger)
+    ingest.add_writer(rollups.apply)
+    ingest_series(logger, session_factory, ingest, clock, T0, T0 + 2 * DAY_MS)
+
+    expected = query(logger, session_factory, None, bucket_ms)
+    assert expected
+    assert_same_buckets(query(logger, session_factory, rollups, bucket_ms), expected)
+
+def test_backfilled_rollups_match_raw(logger, engine, session_factory, clock, rollups):
+    rollups.start_coverage(engine, now_ms=T0 + 2 * DAY_MS)
+    ingest_series(logger, session_factory, BulkIngest(logger), clock, T0, T0 + 2 * DAY_MS)
+    rollups.backfill(engine)
+    with DatabaseManager(logger, session_factory) as session:
+        assert rollups.coverage(session) == {resolution_ms: T0 for resolution_ms in rollups.resolutions}
+    assert_same_buckets(query(logger, session_factory, rollups, 60 * MINUTE_MS),
+                        query(logger, session_factory, None, 60 * MINUTE_MS))
+
+def test_range_without_rollups_is_read_raw(logger, engine, session_factory, clock, rollups):
+    # history written before rollups were maintained, never backfilled
+    ingest_series(logger, session_factory, BulkIngest(logger), clock, T0, T0 + DAY_MS)
+    rollups.start_coverage(engine, now_ms=T0 + DAY_MS - 1)
+    ingest = BulkIngest(logger)
+    ingest.add_writer(rollups.apply)
+    ingest_series(logger, session_factory, ingest, clock, T0 + DAY_MS, T0 + 2 * DAY_MS, seed=2)
+
+    expected = query(logger, session_factory, None, 60 * MINUTE_MS)
+    assert {row["bucket_start_ms"] for row in expected} >= {T0, T0 + DAY_MS}
+    assert_same_buckets(query(logger, session_factory, rollups, 60 * MINUTE_MS), expected)
+
+def test_existing_history_is_read_raw_until_backfilled(logger, engine, session_factory, clock, rollups):
+    # a database upgraded in place, rollups are only maintained from the first start on
+    ingest_series(logger, session_factory, BulkIngest(logger), clock, T0, T0 + DAY_MS)
+    rollups.start_coverage(engine, now_ms=T0 + 2 * DAY_MS)
+    expected = query(logger, session_factory, None, DAY_MS)
+    assert expected
+    assert_same_buckets(query(logger, session_factory, rollups, DAY_MS), expected)
+
+def test_cleared_coverage_is_read_raw(logger, engine, session_factory, clock, rollups):
+    rollups.start_coverage(engine, now_ms=T0 - 1)
+    ingest = BulkIngest(logger)
+    ingest.add_writer(rollups.apply)
+    ingest_series(logger, session_factory, ingest, clock, T0, T0 + DAY_MS)
+    # started once with rollups disabled, ingest in that time left no rollups behind
+    rollups.clear_coverage(engine)
+    ingest_series(logger, session_factory, BulkIngest(logger), clock, T0 + DAY_MS, T0 + 2 * DAY_MS, seed=2)
+    assert_same_buckets(query(logger, session_factory, rollups, DAY_MS), query(logger, session_factory, None, DAY_MS))
+
+def test_ragged_edges_are_read_raw_around_rollup_buckets(logger, engine, session_factory, clock, rollups,
+                                                         monkeypatch):
+    rollups.start_coverage(engine, now_ms=T0 - 1)
+    ingest = BulkIngest(logger)
+    ingest.add_writer(rollups.apply)
+    ingest_series(logger, session_factory, ingest, clock, T0, T0 + 2 * DAY_MS)
+    # an unaligned range such as the default "last 24 hours until now"
+    start_ms, end_ms = T0 + 7 * MINUTE_MS + 123, T0 + 2 * DAY_MS - 5 * MINUTE_MS
+    expected = query(logger, session_factory, None, 60 * MINUTE_MS, start_ms, end_ms)
+
+    read = []
+    from_rollups = Aggregates._from_rollups
+    monkeypatch.setattr(Aggregates, "_from_rollups",
+                        lambda self, session, resolution_ms, start_ms, end_ms, *args:
+                        read.append((resolution_ms, start_ms, end_ms))
+                        or from_rollups(self, session, resolution_ms, start_ms, end_ms, *args))
+    assert_same_buckets(query(logger, session_factory, rollups, 60 * MINUTE_MS, start_ms, end_ms), expected)
+    assert read == [(60 * MINUTE_MS, T0 + 60 * MINUTE_MS, T0 + 2 * DAY_MS - 60 * MINUTE_MS)]
+
+def test_percentiles_and_empty_ranges(logger, session_factory, clock):
+    with DatabaseManager(logger, session_factory) as session:
+        for value in range(1, 101):
+            clock[0] = T0 + value
+            BulkIngest(logger).ingest(session, [record(1, [(1, float(value))])])
+    with DatabaseManager(logger, session_factory) as session:
+        rows = Aggregates(logger).query(session, T0, T0 + DAY_MS, DAY_MS, ["p50", "p99", "count"])
+        assert Aggregates(logger).query(session, T0 + DAY_MS, T0 + 2 * DAY_MS, DAY_MS, ["avg"]) == []
+    assert len(rows) == 1
+    assert rows[0]["p50"] == pytest.approx(50.5)
+    assert rows[0]["p99"] == pytest.approx(99.01)
+    assert rows[0]["count"] == 100
+
+def test_parse_bucket_and_aggregations():
+    assert parse_bucket("30s") == 30000
+    assert parse_bucket("5m") == 5 * MINUTE_MS
+    assert parse_bucket("1500") == 1500
+    assert parse_aggregations("avg, p95,p99.9") == ["avg", "p95", "p99.9"]
+    for bucket in ("0m", "5w", None):
+        with pytest.raises(ValueError, match="Invalid bucket"):
+            parse_bucket(bucket)
+    with pytest.raises(ValueError, match="Unknown aggregation: median"):
+        parse_aggregations("median")
+
+def test_get_metric_aggregates_rejects_inverted_ranges(client):
+    response = client.get(f"/get_metric_aggregates?start={T0 + DAY_MS}&end={T0}")
+    assert response.status_code == 400
+    assert response.json["error"] == "end must be after start"
@@ -0,0 +1,66 @@
+from lib_config.config import freeze
+from db.ingest import IngestedValue
+from managers.alert_manager import AlertManager
+from managers.identity_cache import IdentityCache
+from conftest import DAY_MS, T0
+
+def alert_manager(logger, *rules):
+    identity_cache = IdentityCache(logger)
+    identity_cache.add_device(1, "device")
+    identity_cache.add_metric_type(1, 10, "cpu")
+    return AlertManager(logger, identity_cache, freeze({"history_size": 100, "rules": list(rules)}, "alerts"))
+
+def batch(samples, server_ts_ms=T0):
+    # one bulk body: every value shares the server timestamp, client timestamps differ
+    return [IngestedValue(snapshot_id, 1, 10, value, server_ts_ms, client_ts_ms)
+            for snapshot_id, (client_ts_ms, value) in enumerate(samples, start=1)]
+
+def test_rate_rule_fires_within_one_bulk_batch(logger):
+    alerts = alert_manager(logger, {"name": "rise", "metric": "cpu", "condition": "rate", "op": ">", "value": 5})
+    alerts.on_ingest(batch([(T0, 10.0), (T0 + 1000, 12.0), (T0 + 2000, 30.0)]))
+    assert [(event["event"], event["value"]) for event in alerts.recent_history()] == [("fired", 18.0)]
+
+def test_rate_skips_samples_without_a_distinct_timestamp(logger):
+    alerts = alert_manager(logger, {"name": "rise", "metric": "cpu", "condition": "rate", "op": ">", "value": 5})
+    alerts.on_ingest(batch([(T0, 10.0), (T0, 90.0), (T0 + 1000, 12.0)]))
+    assert alerts.recent_history() == []
+
+def test_threshold_must_hold_for_seconds(logger):
+    alerts = alert_manager(logger, {"name": "hot", "metric": "cpu", "op": ">=", "value": 80, "for_seconds": 2})
+    alerts.on_ingest(batch([(T0, 85.0), (T0 + 1000, 90.0)], server_ts_ms=T0 + 1000))
+    assert alerts.active() == []
+    alerts.on_ingest(batch([(T0 + 2000, 95.0)], server_ts_ms=T0 + 2000))
+    assert [alert["rule"] for alert in alerts.active()] == ["hot"]
+    alerts.on_ingest(batch([(T0 + 3000, 10.0)], server_ts_ms=T0 + 3000))
+    assert alerts.active() == []
+    assert [event["event"] for event in alerts.recent_history()] == ["resolved", "fired"]
+
+def test_future_client_clock_does_not_silence_the_series(logger):
+    alerts = alert_manager(logger, {"name": "hot", "metric": "cpu", "op": ">", "value": 80})
+    alerts.on_ingest(batch([(T0 + 365 * DAY_MS, 10.0)]))
+    alerts.on_ingest(batch([(T0, 90.0)], server_ts_ms=T0 + 1000))
+    assert [alert["rule"] for alert in alerts.active()] == ["hot"]
+    assert alerts.rejected == 0
+
+def test_client_time_only_spaces_samples_within_a_commit(logger):
+    alerts = alert_manager(logger, {"name": "rise", "metric": "cpu", "condition": "rate", "op": ">", "value": 5})
+    # a client hours behind, its spacing still gives the rate, the newest sample lands on the server time
+    alerts.on_ingest(batch([(T0 - DAY_MS + 2000, 30.0), (T0 - DAY_MS, 10.0), (T0 - DAY_MS + 1000, 12.0)]))
+    assert [(event["event"], event["value"], event["ts_ms"]) for event in alerts.recent_history()] == [("fired", 18.0, T0)]
+
+def test_samples_never_fall_behind_the_previous_commit(logger):
+    alerts = alert_manager(logger, {"name": "rise", "metric": "cpu", "condition": "rate", "op": ">", "value": 5})
+    alerts.on_ingest(batch([(T0, 10.0)]))
+    # spaced ten seconds apart by the client, one second apart on the server: the first is clamped
+    alerts.on_ingest(batch([(T0, 11.0), (T0 + 10000, 12.0)], server_ts_ms=T0 + 1000))
+    assert [(event["event"], event["value"]) for event in alerts.recent_history()] == []
+    alerts.on_ingest(batch([(T0, 50.0)], server_ts_ms=T0 + 2000))
+    assert [(event["event"], event["value"]) for event in alerts.recent_history()] == [("fired", 38.0)]
+
+def test_late_commits_are_counted(logger, caplog):
+    alerts = alert_manager(logger, {"name": "hot", "metric": "cpu", "op": ">", "value": 80})
+    alerts.on_ingest(batch([(T0, 10.0)], server_ts_ms=T0 + 1000))
+    alerts.on_ingest(batch([(T0, 90.0)]))
+    assert alerts.active() == []
+    assert alerts.rejected == 1
+    assert "skipped a late sample" in caplog.text
@@ -0,0 +1,49 @@
+import sqlite3
+import flask
+from benchmarks.compare import change, compare
+from benchmarks.load import PostMetricSnapshot, percentile, run_scenario
+from benchmarks.seed import seed
+
+def results(p50, rps, dataset="a"):
+    return {"git_commit": "abc", "started": "now", "dataset": dataset, "peak_rss_mb": {"total": 100},
+            "scenarios": {"gauge": {"latency_ms": {"p50": p50, "p99": p50 * 2}, "throughput_rps": rps}}}
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert (percentile(values, 0.5), percentile(values, 0.99), percentile(values, 0)) == (50, 99, 1)
+    assert percentile([], 0.5) is None
+
+def test_compare_reports_direction_per_metric():
+    assert change(10, 5, False) == "-50.0% better"
+    assert change(10, 5, True) == "-50.0% worse"
+    assert change(0, 5, True) == ""
+    report = compare(results(10, 100), results(5, 200, dataset="b"))
+    assert "warning: the runs used different datasets" in report
+    assert "-50.0% better" in report and "+100.0% better" in report
+
+def test_seed_writes_every_series(logger, tmp_path):
+    path = str(tmp_path / "bench.db")
+    dataset = seed(logger, path, devices=2, metric_types=3, snapshots=5, interval_ms=1000)
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT count(*) FROM metric_values").fetchone()[0] == 2 * 3 * 5
+    assert dataset.summary()["metric_values"] == 30
+    assert dataset.metric_types_by_device[2] == [(4, "Metric1"), (5, "Metric2"), (6, "Metric3")]
+
+def test_run_scenario_counts_statuses(logger, tmp_path):
+    app = flask.Flask("bench")
+    posted = []
+
+    @app.post("/post")
+    def post():
+        device_id = flask.request.json["device_id"]
+        posted.append(device_id)
+        return "", 503 if device_id == 2 else 200
+
+    dataset = seed(logger, str(tmp_path / "bench.db"), devices=2, metric_types=1, snapshots=1)
+    endpoints = type("Endpoints", (), {"post_metric_snapshot": "/post"})
+    stats = run_scenario(app, PostMetricSnapshot("post", dataset, endpoints), requests=8, concurrency=2)
+    assert stats["requests"] == 8 and len(posted) == 8
+    refused = posted.count(2)
+    assert stats["errors"] == refused
+    assert stats["statuses"] == {status: count for status, count in (("200", 8 - refused), ("503", refused)) if count}
+    assert stats["latency_ms"]["p50"] <= stats["latency_ms"]["max"]
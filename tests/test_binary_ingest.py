@@ -0,0 +1,50 @@
+import gzip
+import io
+import math
+import pytest
+from db.binary_ingest import BINARY_MIMETYPE, MAGIC, SNAPSHOT, VALUE, encode_snapshots, iter_snapshot_records
+from conftest import T0
+
+def test_round_trip_keeps_ids_timestamps_and_nulls():
+    body = encode_snapshots([(1, T0, 60, [(10, 1.5), (11, None)]), (2, T0 + 1000, 0, [])])
+    first, second = iter_snapshot_records(io.BytesIO(body))
+    assert (first.device_id, first.client_ts_ms, first.client_timezone_mins) == (1, T0, 60)
+    assert first.client_timestamp_utc == "14-11-2023 00:00:00"
+    assert first.device_name is None
+    assert first.values == [(10, None, 1.5), (11, None, None)]
+    assert (second.device_id, second.values) == (2, [])
+
+def test_bad_magic_fails_before_iteration():
+    with pytest.raises(ValueError, match="Not a version 1"):
+        iter_snapshot_records(io.BytesIO(b"XX\x01"))
+
+@pytest.mark.parametrize("cut, error", [(20, "Truncated snapshot header"), (5, "Truncated values")])
+def test_truncated_bodies_fail_while_iterating(cut, error):
+    body = encode_snapshots([(1, T0, 0, [(10, 1.0)]), (1, T0, 0, [(10, 2.0)])])
+    records = iter_snapshot_records(io.BytesIO(body[:-cut]))
+    assert next(records).values == [(10, None, 1.0)]
+    with pytest.raises(ValueError, match=error):
+        next(records)
+
+def test_nan_is_encoded_for_null():
+    body = encode_snapshots([(1, T0, 0, [(10, None)])])
+    assert body.startswith(MAGIC)
+    assert math.isnan(VALUE.unpack_from(body, len(MAGIC) + SNAPSHOT.size)[1])
+
+def test_bulk_route_accepts_gzipped_binary(client):
+    response = client.post("/register_series", json={"device_id": 906, "device_name": "binary",
+                                                      "metric_types": [{"device_metric_type_id": 9061, "name": "load"}]})
+    assert response.status_code == 200
+    body = gzip.compress(encode_snapshots([(906, T0 + i, 0, [(9061, float(i))]) for i in range(3)]))
+    response = client.post("/post_metric_snapshots_bulk", data=body,
+                           headers={"Content-Type": BINARY_MIMETYPE, "Content-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert (response.json["data"]["accepted"], response.json["data"]["rejected"]) == (3, 0)
+
+def test_bulk_route_rejects_unknown_series_and_bad_headers(client):
+    body = encode_snapshots([(907, T0, 0, [(9071, 1.0)])])
+    response = client.post("/post_metric_snapshots_bulk", data=body, headers={"Content-Type": BINARY_MIMETYPE})
+    assert response.json["data"]["results"][0]["error"] == "Unknown device 907"
+    response = client.post("/post_metric_snapshots_bulk", data=b"nope", headers={"Content-Type": BINARY_MIMETYPE})
+    assert response.status_code == 400
+    assert response.json["error"] == "Not a version 1 binary snapshot body"
@@ -0,0 +1,62 @@
+import json
+import pytest
+from analytics.aggregates import Aggregates
+from db.cold_storage import ColdStorage
+from db.metrics import Metrics
+from managers.database_manager import DatabaseManager
+from managers.export_manager import ExportManager
+from managers.retention_manager import RetentionManager
+from lib_config.config import load_config
+from conftest import DAY_MS, T0
+from test_retention import hot_days, ingest_days, retention_config, shipped_config
+
+@pytest.fixture
+def cold_storage(logger, tmp_path):
+    return ColdStorage(logger, str(tmp_path / "cold"), batch_size=1)
+
+def tier_days(logger, engine, session_factory, clock, cold_storage, days, now_day):
+    ingest_days(logger, session_factory, clock, days)
+    manager = RetentionManager(logger, engine, retention_config(raw_days=7, cold_days=365), cold_storage=cold_storage)
+    return manager.run_once(now_ms=T0 + now_day * DAY_MS)
+
+def test_cold_days_shorter_than_raw_days_is_rejected(tmp_path):
+    config = shipped_config()
+    config["cold_storage"]["enabled"] = True
+    config["retention"].update(raw_days=7, cold_days=3)
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    with pytest.raises(ValueError, match="cold_days"):
+        load_config(str(path))
+
+def test_run_once_tiers_expired_days_instead_of_deleting(logger, engine, session_factory, clock, tmp_path):
+    ingest_days(logger, session_factory, clock, [0, 1, 5, 9])
+    cold_storage = ColdStorage(logger, str(tmp_path / "cold"), batch_size=1)
+    manager = RetentionManager(logger, engine, retention_config(raw_days=7, cold_days=365), cold_storage=cold_storage)
+    reclaimed = manager.run_once(now_ms=T0 + 10 * DAY_MS)
+    assert (reclaimed["values_tiered"], reclaimed["values_deleted"], reclaimed["cold_values_dropped"]) == (2, 0, 0)
+    assert hot_days(logger, session_factory) == [5, 9]
+    ts_ms, values = cold_storage.read_series(1)
+    assert list(ts_ms) == [T0, T0 + DAY_MS] and list(values) == [0.0, 1.0]
+
+def test_reads_merge_cold_and_hot_rows(logger, engine, session_factory, clock, cold_storage):
+    tier_days(logger, engine, session_factory, clock, cold_storage, [0, 1, 5, 9], now_day=10)
+    assert cold_storage.partitions() == [T0, T0 + DAY_MS]
+    assert cold_storage.partitions(T0 + DAY_MS + 1) == [T0 + DAY_MS]
+    with DatabaseManager(logger, session_factory) as session:
+        rows = Aggregates(logger, cold_storage=cold_storage).query(session, T0, T0 + 10 * DAY_MS, DAY_MS, ["sum"])
+    assert [(row["bucket_start_ms"], row["sum"]) for row in rows] == \
+           [(T0 + day * DAY_MS, float(day)) for day in (0, 1, 5, 9)]
+
+def test_export_reads_cold_days_first(logger, engine, session_factory, clock, cold_storage):
+    tier_days(logger, engine, session_factory, clock, cold_storage, [0, 1, 5, 9], now_day=10)
+    exports = ExportManager(logger, session_factory, Metrics(logger), cold_storage=cold_storage)
+    lines = b"".join(exports.open("ndjson")[1]).splitlines()
+    assert [json.loads(line)["server_ts_ms"] for line in lines] == [T0 + day * DAY_MS for day in (0, 1, 5, 9)]
+    lines = b"".join(exports.open("ndjson", limit=3)[1]).splitlines()
+    assert len(lines) == 3
+
+def test_drop_before_removes_whole_expired_days(logger, engine, session_factory, clock, cold_storage):
+    tier_days(logger, engine, session_factory, clock, cold_storage, [0, 1, 9], now_day=10)
+    assert cold_storage.drop_before(T0 + DAY_MS + 1) == 1
+    assert cold_storage.partitions() == [T0 + DAY_MS]
+    assert hot_days(logger, session_factory) == [9]
@@ -0,0 +1,64 @@
+import dataclasses
+import json
+import os
+import subprocess
+import sys
+from types import MappingProxyType
+import pytest
+from lib_config.config import Config, freeze, load_config, validate
+from conftest import CONFIG_PATH
+
+def test_sections_are_frozen_and_typed():
+    settings = freeze({"server": {"port": 8000, "hosts": ["a", "b"], "headers": {"X-Id": "1"}}})
+    assert settings.server.port == 8000
+    assert settings.server.hosts == ("a", "b")
+    assert isinstance(settings.server.headers, MappingProxyType)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        settings.server.port = 9000
+    with pytest.raises(TypeError):
+        settings.server.headers["X-Id"] = "2"
+    assert "__slots__" in vars(type(settings.server))
+
+def test_same_shape_shares_a_class():
+    assert type(freeze({"a": 1}, "part")) is type(freeze({"a": 2}, "part"))
+
+def test_missing_keys_raise_key_error():
+    settings = freeze({"server": {"port": 8000}})
+    with pytest.raises(KeyError):
+        settings.server.host
+    assert settings.server["port"] == 8000
+
+def test_data_thaws_to_plain_json():
+    value = {"server": {"port": 8000, "hosts": ["a"], "headers": {"X-Id": "1"}}}
+    assert freeze(value).data == value
+
+def test_config_is_parsed_once(tmp_path, root_logging):
+    path = tmp_path / "config.json"
+    with open(CONFIG_PATH) as file:
+        value = json.load(file)
+    value["logging_config"]["file_output"]["enabled"] = False
+    path.write_text(json.dumps(value))
+    load_config.cache_clear()
+    first = Config(str(path)).settings
+    path.write_text("not json")
+    assert Config(str(path)).settings is first
+    assert load_config.cache_info().misses == 1
+
+def test_missing_file():
+    with pytest.raises(FileNotFoundError):
+        Config("/nonexistent/config.json")
+
+def test_validate_rejects_short_cold_retention():
+    with open(CONFIG_PATH) as file:
+        value = json.load(file)
+    value["cold_storage"]["enabled"] = True
+    value["retention"].update(raw_days=30, cold_days=7)
+    with pytest.raises(ValueError):
+        validate(freeze(value))
+
+def test_api_only_skips_the_dash_stack(main_module):
+    # dash registers a pytest plugin, so the import is checked in a fresh interpreter
+    code = "import sys, main; print(sorted({'dash', 'plotly', 'pandas'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(main_module.__file__), env=dict(os.environ))
+    assert result.stdout.splitlines()[-1] == "[]"
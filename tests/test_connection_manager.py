@@ -0,0 +1,30 @@
+import json
+from sqlalchemy import text
+from lib_config.config import freeze
+from managers.connection_manager import ConnectionManager
+from conftest import CONFIG_PATH
+
+def database_config(engine_string):
+    with open(CONFIG_PATH) as file:
+        database = json.load(file)["database"]
+    database["engine_string"] = engine_string
+    return freeze(database, "database")
+
+def test_pragmas_apply_to_every_pooled_connection(logger, tmp_path):
+    manager = ConnectionManager(logger, database_config(f"sqlite:///{tmp_path / 'pool.db'}"))
+    try:
+        with manager.engine.connect() as first, manager.engine.connect() as second:
+            for connection in (first, second):
+                assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+                assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    finally:
+        manager.dispose()
+
+def test_sessions_share_one_engine(logger, tmp_path):
+    manager = ConnectionManager(logger, database_config(f"sqlite:///{tmp_path / 'pool.db'}"))
+    try:
+        session = manager.session_factory()
+        assert session.get_bind() is manager.engine
+        assert manager.session_factory() is session
+    finally:
+        manager.dispose()
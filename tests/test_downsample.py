@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from analytics.downsample import downsample, lttb, min_max, target_points
+
+def series(n=1000, seed=1):
+    rng = np.random.default_rng(seed)
+    return np.arange(n, dtype=np.float64) * 1000, rng.normal(size=n).cumsum()
+
+def test_lttb_keeps_end_points_and_order():
+    x, y = series()
+    sampled_x, sampled_y = lttb(x, y, 50)
+    assert len(sampled_x) == 50
+    assert (sampled_x[0], sampled_x[-1]) == (x[0], x[-1])
+    assert np.all(np.diff(sampled_x) > 0)
+    assert set(sampled_x) <= set(x)
+
+def test_lttb_keeps_a_spike():
+    x = np.arange(100, dtype=np.float64)
+    y = np.zeros(100)
+    y[37] = 50
+    assert 37 in lttb(x, y, 10)[0]
+
+@pytest.mark.parametrize("method, n_out", [("lttb", 2), ("lttb", 1), ("lttb", 0), ("minmax", 1), ("minmax", 0)])
+def test_tiny_budgets_return_only_the_end_points(method, n_out):
+    x, y = series(10)
+    sampled_x, sampled_y = downsample(x, y, n_out, method)
+    assert sampled_x.tolist() == [x[0], x[-1]]
+    assert sampled_y.tolist() == [y[0], y[-1]]
+
+def test_short_series_is_returned_as_is():
+    x, y = series(5)
+    assert lttb(x, y, 10)[0].tolist() == x.tolist()
+
+def test_min_max_keeps_every_bucket_extreme():
+    x, y = series(1001)
+    sampled_x, sampled_y = min_max(x, y, 20)
+    assert len(sampled_x) <= 20
+    assert y.max() in sampled_y and y.min() in sampled_y
+    assert np.all(np.diff(sampled_x) > 0)
+
+def test_target_points():
+    assert target_points(800) == 1600
+    assert target_points(10000) == 5000
+    assert target_points(0) == 2
+
+def test_get_metric_series_rejects_non_positive_width(client):
+    response = client.get("/series?device_metric_type_id=1&width=0")
+    assert response.status_code == 400
+    assert response.json["error"] == "width must be positive"
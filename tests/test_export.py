@@ -0,0 +1,45 @@
+import json
+import pytest
+from db.ingest import BulkIngest
+from db.metrics import Metrics
+from managers.database_manager import DatabaseManager
+from managers.export_manager import ExportManager
+from conftest import record
+
+@pytest.fixture
+def exports(logger, session_factory, clock):
+    with DatabaseManager(logger, session_factory) as session:
+        BulkIngest(logger).ingest(session, [record(1, [(1, float(i))]) for i in range(5)])
+    return ExportManager(logger, session_factory, Metrics(logger), chunk_size=2, max_limit=3)
+
+def body(export):
+    return b"".join(part if isinstance(part, bytes) else part.encode() for part in export[1])
+
+def test_json_export_streams_every_row(exports):
+    export = exports.open("json")
+    assert export[0] == "application/json"
+    data = json.loads(body(export))["data"]
+    assert [row["metric_snapshot_id"] for row in data] == [1, 2, 3, 4, 5]
+
+def test_ndjson_and_csv_exports(exports):
+    assert len(body(exports.open("ndjson")).splitlines()) == 5
+    lines = body(exports.open("csv")).decode().splitlines()
+    assert lines[0].startswith("metric_snapshot_id,device_id")
+    assert len(lines) == 6
+
+def test_limit_is_clamped_to_the_configured_maximum(exports):
+    assert len(body(exports.open("ndjson", limit=2)).splitlines()) == 2
+    assert len(body(exports.open("ndjson", limit=100)).splitlines()) == 3
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_non_positive_limit_is_rejected(exports, limit):
+    with pytest.raises(ValueError, match="limit must be positive"):
+        exports.open("json", limit=limit)
+
+def test_empty_export_is_none(exports):
+    assert exports.open("json", device_id=99) is None
+
+def test_get_all_metrics_rejects_negative_limit(client):
+    response = client.get("/get_all_metrics?limit=-1")
+    assert response.status_code == 400
+    assert response.json["error"] == "limit must be positive"
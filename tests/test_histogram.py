@@ -0,0 +1,34 @@
+import numpy as np
+from analytics.histogram import compute_histograms, fetch_metric_values
+from db.ingest import BulkIngest
+from managers.database_manager import DatabaseManager
+from conftest import record
+
+def test_histograms_per_metric_type():
+    type_ids = np.array([2, 1, 2, 1, 2])
+    values = np.array([10.0, 1.0, 20.0, 3.0, 30.0])
+    histograms = compute_histograms(type_ids, values, bins=2)
+    assert sorted(histograms) == [1, 2]
+    counts, edges = histograms[2]
+    assert counts.tolist() == [1, 2]
+    assert edges.tolist() == [10.0, 20.0, 30.0]
+    assert histograms[1][0].sum() == 2
+
+def test_fixed_bin_width_aligns_edges():
+    counts, edges = compute_histograms(np.array([1, 1, 1]), np.array([3.0, 7.5, 12.0]), bin_width=5)[1]
+    assert edges.tolist() == [0.0, 5.0, 10.0, 15.0]
+    assert counts.tolist() == [1, 1, 1]
+    counts, edges = compute_histograms(np.array([1]), np.array([5.0]), bin_width=5)[1]
+    assert counts.sum() == 1 and len(edges) == 2
+
+def test_empty_input():
+    assert compute_histograms(np.empty(0, dtype=np.int64), np.empty(0)) == {}
+
+def test_fetch_skips_nulls_and_filters(logger, session_factory, clock):
+    with DatabaseManager(logger, session_factory) as session:
+        BulkIngest(logger).ingest(session, [record(1, [(1, 1.5), (2, None)]), record(2, [(3, 4.0)], device_name="other")])
+    with DatabaseManager(logger, session_factory) as session:
+        type_ids, values = fetch_metric_values(session, chunk_size=1)
+        assert sorted(zip(type_ids.tolist(), values.tolist())) == [(1, 1.5), (3, 4.0)]
+        type_ids, values = fetch_metric_values(session, device_id=2)
+        assert type_ids.tolist() == [3] and values.dtype == np.float64
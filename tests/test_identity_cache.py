@@ -0,0 +1,61 @@
+from db.ingest import BulkIngest
+from managers.database_manager import DatabaseManager
+from managers.identity_cache import IdentityCache
+from conftest import record
+
+def test_warm_serves_names_and_listings(logger, session_factory, clock):
+    with DatabaseManager(logger, session_factory) as session:
+        BulkIngest(logger).ingest(session, [record(1, [(1, 1.0), (2, 2.0)], device_name="a"), record(2, [(1, 1.0)], device_name="b")])
+    cache = IdentityCache(logger)
+    with DatabaseManager(logger, session_factory) as session:
+        cache.warm(session)
+        assert cache.resolve_series(session, "a", "type-2") == (1, 2)
+    assert cache.get_device_name(2) == "b"
+    assert cache.list_devices() == [(1, "a"), (2, "b")]
+    assert cache.list_metric_types(1) == [(1, "type-1"), (2, "type-2")]
+
+def test_ingest_fills_the_cache(logger, session_factory, clock):
+    cache = IdentityCache(logger)
+    with DatabaseManager(logger, session_factory) as session:
+        BulkIngest(logger, cache).ingest(session, [record(7, [(3, 1.0)], device_name="seven")])
+    assert cache.get_device_id("seven") == 7
+    assert cache.get_metric_type_id(7, "type-3") == 3
+
+def test_eviction_turns_listings_off(logger):
+    cache = IdentityCache(logger, max_devices=2)
+    cache._complete = True
+    for device_id in range(3):
+        cache.add_device(device_id, f"device-{device_id}")
+    assert cache.get_device_name(0) is None
+    assert cache.get_device_id("device-0") is None
+    assert cache.list_devices() is None
+    assert cache.misses == 2
+
+def test_lookups_refresh_recency(logger):
+    cache = IdentityCache(logger, max_devices=2)
+    cache.add_device(1, "one")
+    cache.add_device(2, "two")
+    assert cache.get_device_name(1) == "one"
+    cache.add_device(3, "three")
+    assert cache.get_device_name(1) == "one"
+    assert cache.get_device_name(2) is None
+
+def test_entries_added_during_warm_survive_it(logger, session_factory, clock):
+    with DatabaseManager(logger, session_factory) as session:
+        BulkIngest(logger).ingest(session, [record(1, [(1, 1.0)], device_name="a")])
+    cache = IdentityCache(logger)
+
+    class Session:
+        # a broadcast arriving between the warm queries and the swap
+        def __init__(self, session):
+            self.session = session
+
+        def execute(self, statement):
+            cache.add_device(2, "b")
+            cache.add_metric_type(2, 5, "type-5")
+            return self.session.execute(statement)
+
+    with DatabaseManager(logger, session_factory) as session:
+        cache.warm(Session(session))
+    assert cache.list_devices() == [(1, "a"), (2, "b")]
+    assert cache.get_metric_type_id(2, "type-5") == 5
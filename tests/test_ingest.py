@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from db.ingest import BulkIngest, client_error, parse_payload
+from db.models import LatestMetricValue, MetricValue
+from managers.database_manager import DatabaseManager
+from conftest import record
+
+def payload(metric_value):
+    return {
+        "device_id": 1,
+        "device_name": "device",
+        "client_timestamp_utc": "14-11-2023 00:00:00",
+        "client_timezone_mins": 0,
+        "snapshots": [{"device_metric_type_id": 1, "device_metric_type_name": "cpu", "metric_value": metric_value}]
+    }
+
+@pytest.mark.parametrize("metric_value, expected", [(7, 7.0), (2.5, 2.5), ("7", 7.0), (" 8.5 ", 8.5), (None, None)])
+def test_parse_payload_converts_metric_values(metric_value, expected):
+    value = parse_payload(payload(metric_value)).values[0][2]
+    assert value == expected
+    assert value is None or type(value) is float
+
+@pytest.mark.parametrize("metric_value", [True, False, "abc", {"a": 1}, [1], "nan", "inf"])
+def test_parse_payload_rejects_non_numeric_values(metric_value):
+    with pytest.raises(ValueError, match="metric_value"):
+        parse_payload(payload(metric_value))
+
+@pytest.mark.parametrize("timestamp, message", [
+    (None, "client_timestamp_utc is required"),
+    (1700000000, "client_timestamp_utc must look like"),
+    ("2023-11-14T00:00:00Z", "client_timestamp_utc must look like")
+])
+def test_parse_payload_validates_client_timestamp(timestamp, message):
+    data = payload(1)
+    data["client_timestamp_utc"] = timestamp
+    with pytest.raises(ValueError, match=message):
+        parse_payload(data)
+
+def test_parse_payload_reports_missing_fields():
+    data = payload(1)
+    del data["device_name"]
+    with pytest.raises(ValueError, match="Missing field: device_name"):
+        parse_payload(data)
+
+def test_client_error_hides_database_errors():
+    error = OperationalError("INSERT INTO metric_values (value) VALUES (?)", ("abc",), Exception("boom"))
+    assert "INSERT" not in client_error(error)
+    assert client_error(ValueError("metric_value must be a number")) == "metric_value must be a number"
+    assert client_error(KeyError("device_id")) == "Missing field: device_id"
+
+def test_bulk_ingest_writes_values_and_latest_values(logger, session_factory, clock):
+    ingest = BulkIngest(logger)
+    with DatabaseManager(logger, session_factory) as session:
+        results = ingest.ingest(session, [record(1, [(1, 1.0), (2, 2.0)]), record(1, [(1, 3.0)])])
+    assert [result.error for result in results] == [None, None]
+    with DatabaseManager(logger, session_factory) as session:
+        values = session.execute(select(MetricValue.device_metric_type_id, MetricValue.value)
+                                 .order_by(MetricValue.metric_snapshot_id, MetricValue.device_metric_type_id)).all()
+        latest = dict(session.execute(select(LatestMetricValue.device_metric_type_id, LatestMetricValue.value)).all())
+    assert values == [(1, 1.0), (2, 2.0), (1, 3.0)]
+    assert latest == {1: 3.0, 2: 2.0}
+
+def test_bulk_ingest_rejects_single_records(logger, session_factory, clock):
+    ingest = BulkIngest(logger)
+    records = [
+        record(1, [(1, 1.0), (1, 2.0)]),        # duplicate metric type
+        record(2, [(3, 1.0)], device_name=None),  # unknown device without a name
+        record(1, [(1, 5.0)])
+    ]
+    with DatabaseManager(logger, session_factory) as session:
+        results = ingest.ingest(session, records)
+    assert results[0].error == "Duplicate device_metric_type_id in snapshots"
+    assert results[1].error == "Unknown device 2"
+    assert results[2].error is None and results[2].metric_snapshot_id is not None
+
+def test_post_metric_snapshot_rejects_bad_values_cleanly(client):
+    data = payload("abc")
+    data["device_id"] = 101
+    response = client.post("/post_metric_snapshot", json=data)
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid payload: metric_value must be a number, got 'abc'"
+
+def test_post_metric_snapshot_requires_client_timestamp(client):
+    data = payload(1)
+    data.update(device_id=102, client_timestamp_utc=None)
+    response = client.post("/post_metric_snapshot", json=data)
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid payload: client_timestamp_utc is required"
+
+def test_route_errors_do_not_leak_internals(client):
+    response = client.post("/register_series", json={"device_id": 103, "device_name": "d", "metric_types": 5})
+    assert response.status_code == 400
+    assert response.json["error"] == "Internal server error"
+    response = client.get("/get_metric_snapshot/999999")
+    assert response.status_code == 404
+    assert response.json["error"] == "Snapshot not found"
@@ -0,0 +1,68 @@
+import gzip
+import io
+import json
+from sqlalchemy import func, select
+from db.binary_ingest import encode_snapshots
+from db.ingest import BulkIngest
+from db.models import MetricSnapshot
+from managers.database_manager import DatabaseManager
+from managers.ingest_manager import IngestManager
+from conftest import T0, record
+from test_ingest import payload
+
+class ShortReads(io.BytesIO):
+    # hands out at most a few bytes per read like a socket would
+    def read(self, size=-1):
+        return super().read(min(size, 5) if size and size > 0 else size)
+
+def ingest_manager(logger, session_factory, chunk_size=500):
+    return IngestManager(logger, session_factory, BulkIngest(logger), chunk_size)
+
+def snapshot_count(logger, session_factory):
+    with DatabaseManager(logger, session_factory) as session:
+        return session.execute(select(func.count()).select_from(MetricSnapshot)).scalar()
+
+def test_failed_chunk_is_retried_record_by_record(logger, session_factory, clock):
+    manager = ingest_manager(logger, session_factory)
+    chunk = [(1, record(1, [(1, 1.0)])), (2, record(1, [(1, object())])), (3, record(1, [(1, 3.0)]))]
+    results = manager._ingest_chunk(chunk)
+    assert [result["status"] for result in results] == ["accepted", "rejected", "accepted"]
+    assert "INSERT" not in results[1]["error"]
+
+def test_ndjson_rejects_only_invalid_lines(logger, session_factory, clock):
+    manager = ingest_manager(logger, session_factory)
+    body = "\n".join(json.dumps(payload(value)) for value in [1, "abc", "3", True]).encode()
+    summary = manager.ingest_ndjson(io.BytesIO(body))
+    assert (summary["accepted"], summary["rejected"]) == (2, 2)
+    rejected = [result for result in summary["results"] if result["status"] == "rejected"]
+    assert [result["line"] for result in rejected] == [2, 4]
+    assert all("metric_value" in result["error"] for result in rejected)
+
+def test_corrupt_gzip_keeps_committed_chunks(logger, session_factory, clock):
+    manager = ingest_manager(logger, session_factory, chunk_size=100)
+    lines = "".join(json.dumps(payload(value / 7)) + "\n" for value in range(2000)).encode()
+    body = gzip.compress(lines)
+    summary = manager.ingest_ndjson(io.BytesIO(body[:len(body) // 2]), "gzip")
+    results = summary["results"]
+    assert summary["accepted"] > 0
+    assert results[-1]["status"] == "rejected"
+    assert results[-1]["error"].startswith("Unreadable body after line")
+    assert all(result["status"] == "accepted" for result in results[:-1])
+    assert snapshot_count(logger, session_factory) == summary["accepted"]
+
+def test_binary_is_read_in_record_chunks(logger, session_factory, clock):
+    manager = ingest_manager(logger, session_factory, chunk_size=2)
+    # the binary format only carries ids, register the series first
+    manager._ingest_chunk([(1, record(1, [(1, 0.0)]))])
+    body = encode_snapshots([(1, T0 + i, 0, [(1, float(i))]) for i in range(5)])
+    summary = manager.ingest_binary(ShortReads(body))
+    assert (summary["accepted"], summary["rejected"]) == (5, 0)
+    assert [result["record"] for result in summary["results"]] == [1, 2, 3, 4, 5]
+
+def test_truncated_binary_keeps_decoded_records(logger, session_factory, clock):
+    manager = ingest_manager(logger, session_factory)
+    manager._ingest_chunk([(1, record(1, [(1, 0.0)]))])
+    body = encode_snapshots([(1, T0 + i, 0, [(1, float(i))]) for i in range(3)])
+    summary = manager.ingest_binary(io.BytesIO(body[:-4]))
+    assert summary["accepted"] == 2
+    assert summary["error"].startswith("Truncated values")
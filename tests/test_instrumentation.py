@@ -0,0 +1,69 @@
+import threading
+import flask
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from lib_config.config import freeze
+from managers.instrumentation import Instrumentation
+
+def instrumentation(logger, server_timing=False):
+    return Instrumentation(logger, freeze({"enabled": True, "server_timing": server_timing,
+                                          "buckets_ms": [1, 10, 100]}, "instrumentation"))
+
+def test_failed_statements_are_counted_and_leave_nothing_behind(logger):
+    metrics = instrumentation(logger)
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+        connection.execute(text("SELECT 2"))
+        assert "query_started" not in connection.info
+    counters, histograms = metrics.snapshot()
+    assert counters[("db_queries_total", (("outcome", "ok"),))] == 2
+    assert counters[("db_queries_total", (("outcome", "error"),))] == 1
+    assert sum(histograms[("db_query_duration_seconds", ())][:-1]) == 3
+
+def test_shards_of_finished_threads_are_kept(logger):
+    metrics = instrumentation(logger)
+    threads = [threading.Thread(target=metrics.inc, args=("ingested_values_total", 2)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    metrics.inc("ingested_values_total")
+    assert metrics.snapshot()[0][("ingested_values_total", ())] == 7
+
+def test_render_survives_a_failing_collector(logger):
+    metrics = instrumentation(logger)
+    metrics.observe("http_request_duration_seconds", 0.005, (("route", "/x"),))
+    metrics.add_collector("cache_hits_total", lambda: {(("cache", "identity"),): 3})
+    metrics.add_collector("write_behind_queue_depth", lambda: 1 / 0)
+    lines = metrics.render().splitlines()
+    assert 'http_request_duration_seconds_bucket{route="/x",le="0.001"} 0' in lines
+    assert 'http_request_duration_seconds_bucket{route="/x",le="0.01"} 1' in lines
+    assert 'http_request_duration_seconds_count{route="/x"} 1' in lines
+    assert 'cache_hits_total{cache="identity"} 3' in lines
+    assert not any(line.startswith("write_behind_queue_depth") for line in lines)
+
+def test_routes_are_timed_with_server_timing(logger):
+    metrics = instrumentation(logger, server_timing=True)
+    app = flask.Flask("instrumented")
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    metrics.instrument_app(app)
+
+    @app.get("/query/<int:n>")
+    def query(n):
+        with engine.connect() as connection:
+            return str(connection.execute(text("SELECT :n"), {"n": n}).scalar())
+    response = app.test_client().get("/query/3")
+    assert 'desc="1 queries"' in response.headers["Server-Timing"]
+    histograms = metrics.snapshot()[1]
+    assert (("http_request_duration_seconds",
+             (("method", "GET"), ("route", "/query/<int:n>"), ("status", "200")))) in histograms
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE db_queries_total counter" in response.get_data(as_text=True)
@@ -0,0 +1,35 @@
+from db.ingest import BulkIngest
+from db.metrics import Metrics
+from db.migrations import Migrations
+from managers.database_manager import DatabaseManager
+from conftest import record
+
+def test_latest_values_follow_the_newest_snapshot(logger, session_factory, clock):
+    ingest = BulkIngest(logger)
+    with DatabaseManager(logger, session_factory) as session:
+        ingest.ingest(session, [record(1, [(1, 1.0), (2, 2.0)]), record(2, [(3, 3.0)], device_name="other")])
+    with DatabaseManager(logger, session_factory) as session:
+        ingest.ingest(session, [record(1, [(1, 5.0)])])
+    with DatabaseManager(logger, session_factory) as session:
+        current = {(row.device_id, row.device_metric_type_id): row.value
+                   for row in Metrics(logger).getCurrentValues(session)}
+        assert [row.value for row in Metrics(logger).getCurrentValues(session, 2)] == [3.0]
+        assert Metrics(logger).getLatestValue(session, 1, 1).metric_snapshot_id == 3
+    assert current == {(1, 1): 5.0, (1, 2): 2.0, (2, 3): 3.0}
+
+def test_migration_seeds_an_empty_latest_table(logger, engine, session_factory, clock):
+    with DatabaseManager(logger, session_factory) as session:
+        BulkIngest(logger).ingest(session, [record(1, [(1, 1.0)]), record(1, [(1, 4.0), (2, 2.0)])])
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM latest_metric_values")
+    assert Migrations(logger, engine).backfill_latest_values() == 2
+    with DatabaseManager(logger, session_factory) as session:
+        assert [row.value for row in Metrics(logger).getCurrentValues(session)] == [4.0, 2.0]
+
+def test_get_current_values_names_the_series(client):
+    data = {"device_id": 901, "device_name": "gauge", "client_timestamp_utc": "14-11-2023 00:00:00",
+            "client_timezone_mins": 0,
+            "snapshots": [{"device_metric_type_id": 9011, "device_metric_type_name": "temp", "metric_value": 21.5}]}
+    assert client.post("/post_metric_snapshot", json=data).status_code == 200
+    rows = client.get("/get_current_values?device_id=901").json["data"]
+    assert [(row["device_name"], row["metric_type_name"], row["value"]) for row in rows] == [("gauge", "temp", 21.5)]
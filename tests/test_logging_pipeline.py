@@ -0,0 +1,83 @@
+import json
+import logging
+import queue
+import lib_config.config
+from lib_config.config import Config
+from lib_config.logging_pipeline import (DeferredQueueHandler, DeferredQueueListener, RateLimitFilter,
+                                         SamplingFilter, start_queue_listener)
+from conftest import CONFIG_PATH
+
+def make_record(name="main", level=logging.INFO, msg="hello %s", args=("world",)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+def write_config(tmp_path, **logging_config):
+    with open(CONFIG_PATH) as file:
+        config = json.load(file)
+    config["logging_config"].update(logging_config)
+    config["logging_config"]["console_output"]["level"] = "INFO"
+    config["logging_config"]["file_output"].update(level="INFO", log_dir=str(tmp_path), format="%(message)s")
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+def test_rate_limit_reports_suppressed_records(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("lib_config.logging_pipeline.time.monotonic", lambda: now[0])
+    rate_limit = RateLimitFilter(burst=2, interval_seconds=1)
+    assert [rate_limit.filter(make_record()) for _ in range(4)] == [True, True, False, False]
+    assert rate_limit.filter(make_record(level=logging.WARNING))
+    now[0] = 1.5
+    record = make_record()
+    assert rate_limit.filter(record)
+    assert record.getMessage() == "hello world (2 similar messages suppressed)"
+
+def test_sampling_matches_logger_and_children():
+    sampling = SamplingFilter([{"logger": "main", "max_level": "INFO", "rate": 0}])
+    assert not sampling.filter(make_record("main.child"))
+    assert sampling.filter(make_record("main", logging.WARNING))
+    assert sampling.filter(make_record("mainframe"))
+
+def test_queued_records_are_formatted_and_frozen():
+    log_queue = queue.Queue()
+    handler = DeferredQueueHandler(log_queue)
+    values = ["before"]
+    record = make_record(msg="value %s", args=(values,))
+    handler.emit(record)
+    values[0] = "after"
+    queued = log_queue.get_nowait()
+    assert (queued.msg, queued.args) == ("value ['before']", None)
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DeferredQueueHandler(queue.Queue(1))
+    handler.emit(make_record())
+    handler.emit(make_record())
+    assert handler.dropped == 1
+
+def test_listener_tracks_its_own_state():
+    listener = DeferredQueueListener(queue.Queue())
+    listener.stop()
+    listener.start()
+    listener.stop()
+    listener.stop()
+    assert not listener.running
+    _, listener = start_queue_listener([logging.NullHandler()], 10)
+    assert listener.running
+    listener.stop()
+
+def test_each_handler_rate_limits_on_its_own(tmp_path, root_logging, capsys):
+    rate_limit = {"enabled": True, "burst": 1, "interval_seconds": 60, "max_level": "INFO"}
+    config = Config(write_config(tmp_path, queue={"enabled": False}, rate_limit=rate_limit))
+    assert config.log_listener is None
+    for _ in range(3):
+        logging.getLogger("tests.pipeline").info("same message")
+    assert (tmp_path / "app.log").read_text().splitlines() == ["same message"]
+    assert capsys.readouterr().err.count("same message") == 1
+
+def test_second_config_replaces_the_handlers(tmp_path, root_logging):
+    root = logging.getLogger()
+    Config(write_config(tmp_path))
+    installed = len(root.handlers)
+    first = lib_config.config._installed_logging["listener"]
+    Config(write_config(tmp_path))
+    assert len(root.handlers) == installed
+    assert not first.running
@@ -0,0 +1,32 @@
+import pytest
+from db.ingest import BulkIngest
+from db.metrics import Metrics, decode_cursor, encode_cursor
+from managers.database_manager import DatabaseManager
+from conftest import record
+
+def test_pages_walk_every_row_once_newest_first(logger, session_factory, clock):
+    with DatabaseManager(logger, session_factory) as session:
+        BulkIngest(logger).ingest(session, [record(1, [(1, float(i)), (2, float(i))]) for i in range(5)])
+    metrics = Metrics(logger)
+    seen = []
+    cursor = None
+    with DatabaseManager(logger, session_factory) as session:
+        while True:
+            rows, cursor = metrics.getMetricValuesPage(session, cursor, page_size=3)
+            seen.extend((row.metric_snapshot_id, row.device_metric_type_id) for row in rows)
+            if cursor is None:
+                break
+    assert len(seen) == 10
+    assert seen == sorted(seen, reverse=True)
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor((12, 3))) == (12, 3)
+    assert decode_cursor(None) is None
+    with pytest.raises(ValueError, match="Invalid cursor: 12"):
+        decode_cursor("12")
+
+@pytest.mark.parametrize("query, error", [("cursor=abc", "Invalid cursor: abc"), ("limit=0", "limit must be positive")])
+def test_get_metric_values_rejects_bad_arguments(client, query, error):
+    response = client.get(f"/get_metric_values?{query}")
+    assert response.status_code == 400
+    assert response.json["error"] == error
@@ -0,0 +1,67 @@
+import json
+import pytest
+from db.ingest import IngestedValue
+from managers.pubsub import PubSub, parse_series_keys
+
+def test_parse_series_keys():
+    assert parse_series_keys("1:2,3:4,") == {(1, 2), (3, 4)}
+    assert parse_series_keys(None) == set()
+    with pytest.raises(ValueError, match="Invalid series: 1-2, expected <device_id>:<device_metric_type_id>"):
+        parse_series_keys("1-2")
+
+def test_ingest_reaches_only_matching_subscribers(logger):
+    pubsub = PubSub(logger)
+    watching = pubsub.subscribe({(1, 2)})
+    other = pubsub.subscribe({(1, 3)})
+    pubsub.on_ingest([IngestedValue(7, 1, 2, 4.5, 1000, None)])
+    assert watching.get(0) == {"device_id": 1, "device_metric_type_id": 2, "metric_snapshot_id": 7,
+                               "value": 4.5, "server_ts_ms": 1000}
+    assert other.get(0) is None
+
+def test_slow_subscriber_drops_its_oldest_messages(logger):
+    pubsub = PubSub(logger, queue_size=2)
+    subscription = pubsub.subscribe({(1, 1)})
+    for value in range(3):
+        pubsub.publish((1, 1), value)
+    assert [subscription.get(0), subscription.get(0), subscription.get(0)] == [1, 2, None]
+
+def test_subscriptions_are_capped(logger):
+    pubsub = PubSub(logger, max_subscriptions=2)
+    first = pubsub.subscribe({(1, 1)})
+    assert pubsub.subscribe({(1, 1), (1, 2)}) is not None
+    assert pubsub.subscribe({(1, 1)}) is None
+    pubsub.unsubscribe(first)
+    pubsub.unsubscribe(first)
+    assert pubsub.subscriber_count() == 1
+    assert pubsub.subscribe({(1, 1)}) is not None
+
+def test_stream_rejects_bad_series(client):
+    response = client.get("/stream/latest_values?series=abc")
+    assert response.status_code == 400
+    assert response.json["error"].startswith("Invalid series: abc")
+
+def test_stream_sends_current_values_then_unsubscribes(client, main_module):
+    data = {"device_id": 903, "device_name": "live", "client_timestamp_utc": "14-11-2023 00:00:00",
+            "client_timezone_mins": 0,
+            "snapshots": [{"device_metric_type_id": 9031, "device_metric_type_name": "load", "metric_value": 2}]}
+    assert client.post("/post_metric_snapshot", json=data).status_code == 200
+    pubsub = main_module.application.pubsub
+    response = client.get("/stream/latest_values?series=903:9031")
+    assert response.status_code == 200
+    assert pubsub.subscriber_count() == 1
+    event = next(response.response)
+    assert json.loads(event[len(b"data: "):])["value"] == 2.0
+    response.close()
+    assert pubsub.subscriber_count() == 0
+
+def test_stream_over_the_cap_is_refused(client, main_module):
+    pubsub = main_module.application.pubsub
+    held = [pubsub.subscribe({(0, 0)}) for _ in range(pubsub.max_subscriptions)]
+    try:
+        response = client.get("/stream/latest_values?series=903:9031")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"]
+        assert f"live_streams_open {pubsub.max_subscriptions}" in client.get("/metrics").get_data(as_text=True)
+    finally:
+        for subscription in held:
+            pubsub.unsubscribe(subscription)
@@ -0,0 +1,43 @@
+import gzip
+import json
+import numpy as np
+from managers.response_manager import dumps
+from conftest import T0
+
+def post_value(client, device_id, value, metric_types=1):
+    data = {"device_id": device_id, "device_name": f"device-{device_id}", "client_timestamp_utc": "14-11-2023 00:00:00",
+            "client_timezone_mins": 0,
+            "snapshots": [{"device_metric_type_id": device_id * 100 + type_id, "device_metric_type_name": f"m{type_id}",
+                           "metric_value": value} for type_id in range(metric_types)]}
+    assert client.post("/post_metric_snapshot", json=data).status_code == 200
+
+def test_dumps_is_compact_and_handles_numpy():
+    assert dumps({"a": np.int64(1), "b": np.array([1.5, 2.0])}) == b'{"a":1,"b":[1.5,2.0]}'
+    assert b"\n" in dumps({"a": 1}, pretty=True)
+
+def test_etag_answers_not_modified_until_the_data_changes(client):
+    post_value(client, 904, 1)
+    response = client.get("/get_current_values?device_id=904")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200 and response.headers["Last-Modified"]
+    assert client.get("/get_current_values?device_id=904", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/get_current_values?device_id=904",
+                      headers={"If-Modified-Since": response.headers["Last-Modified"]}).status_code == 304
+    post_value(client, 904, 2)
+    assert client.get("/get_current_values?device_id=904", headers={"If-None-Match": etag}).status_code == 200
+
+def test_large_bodies_are_compressed_with_their_own_etag(client):
+    post_value(client, 905, 1, metric_types=40)
+    plain = client.get("/get_current_values?device_id=905")
+    compressed = client.get("/get_current_values?device_id=905", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+    assert json.loads(gzip.decompress(compressed.data))["data"] == plain.json["data"]
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert client.get("/get_current_values?device_id=905", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]}).status_code == 304
+
+def test_errors_carry_no_validator(client):
+    response = client.get(f"/get_metric_aggregates?start={T0 + 1}&end={T0}")
+    assert response.status_code == 400
+    assert "ETag" not in response.headers
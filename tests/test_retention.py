@@ -0,0 +1,81 @@
+import json
+import os
+from sqlalchemy import select
+from lib_config.config import freeze, load_config
+from db.ingest import BulkIngest
+from db.models import MetricSnapshot
+from db.rollups import Rollups
+from managers.database_manager import DatabaseManager
+from managers.retention_manager import RetentionManager
+from db.migrations import Migrations
+from conftest import CONFIG_PATH, DAY_MS, T0, record
+
+def shipped_config():
+    with open(CONFIG_PATH) as file:
+        return json.load(file)
+
+def retention_config(**overrides):
+    config = shipped_config()["retention"]
+    config.update(pause_ms=0, **overrides)
+    return freeze(config, "retention")
+
+def ingest_days(logger, session_factory, clock, days):
+    ingest = BulkIngest(logger)
+    for day in days:
+        clock[0] = T0 + day * DAY_MS
+        with DatabaseManager(logger, session_factory) as session:
+            ingest.ingest(session, [record(1, [(1, float(day))])])
+
+def hot_days(logger, session_factory):
+    with DatabaseManager(logger, session_factory) as session:
+        return [(ts_ms - T0) // DAY_MS for ts_ms in session.execute(
+            select(MetricSnapshot.server_ts_ms).order_by(MetricSnapshot.server_ts_ms)).scalars()]
+
+def test_shipped_config_keeps_destructive_jobs_off():
+    config = load_config(os.path.abspath(CONFIG_PATH))
+    assert config.retention.enabled is False
+    assert config.retention.incremental_vacuum is False
+    assert config.cold_storage.enabled is False
+
+def test_retention_is_not_started_by_construction(logger, engine):
+    manager = RetentionManager(logger, engine, retention_config(enabled=True))
+    assert not manager._thread.is_alive()
+
+def test_run_once_deletes_only_expired_raw_rows(logger, engine, session_factory, clock):
+    ingest_days(logger, session_factory, clock, [0, 1, 5, 9])
+    reclaimed = RetentionManager(logger, engine, retention_config(raw_days=7)).run_once(now_ms=T0 + 10 * DAY_MS)
+    assert (reclaimed["snapshots_deleted"], reclaimed["values_deleted"]) == (2, 2)
+    assert hot_days(logger, session_factory) == [5, 9]
+
+def test_deleted_rollups_move_coverage_forward(logger, engine, session_factory, clock):
+    rollups = Rollups(logger, ["1m"])
+    rollups.start_coverage(engine, now_ms=T0 - 1)
+    config = retention_config(raw_days=30, rollup_days=[{"resolution": "1m", "days": 5}])
+    RetentionManager(logger, engine, config).run_once(now_ms=T0 + 10 * DAY_MS)
+    with DatabaseManager(logger, session_factory) as session:
+        assert rollups.coverage(session) == {60 * 1000: T0 + 5 * DAY_MS + 60 * 1000}
+
+def test_batches_update_row_count_and_stats(logger, engine, session_factory, clock):
+    class RowCount:
+        total = 0
+
+        def adjust(self, delta):
+            self.total += delta
+    row_count = RowCount()
+    ingest_days(logger, session_factory, clock, [0, 1, 2, 9])
+    manager = RetentionManager(logger, engine, retention_config(raw_days=7, batch_size=1), row_count=row_count)
+    manager.run_once(now_ms=T0 + 10 * DAY_MS)
+    stats = manager.stats()
+    assert row_count.total == -3
+    assert (stats["runs"], stats["total_snapshots_deleted"], stats["total_values_deleted"]) == (1, 3, 3)
+
+def test_incremental_vacuum_hands_pages_back(logger, engine, session_factory, clock):
+    Migrations(logger, engine, incremental_vacuum=True).enable_incremental_vacuum()
+    ingest = BulkIngest(logger)
+    with DatabaseManager(logger, session_factory) as session:
+        ingest.ingest(session, [record(1, [(type_id, float(type_id)) for type_id in range(1, 200)])
+                                for _ in range(20)])
+    manager = RetentionManager(logger, engine, retention_config(raw_days=7, incremental_vacuum_pages=1000))
+    reclaimed = manager.run_once(now_ms=T0 + 10 * DAY_MS)
+    assert reclaimed["values_deleted"] == 20 * 199
+    assert reclaimed["pages_freed"] > 0
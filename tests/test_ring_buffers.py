@@ -0,0 +1,74 @@
+import time
+from db.ingest import BulkIngest, IngestedValue
+from managers.database_manager import DatabaseManager
+from managers.ring_buffer_store import RingBufferStore, SeriesRingBuffer
+from conftest import record
+
+def value(snapshot_id, ts_ms, metric_value, device_metric_type_id=1):
+    return IngestedValue(snapshot_id, 1, device_metric_type_id, metric_value, ts_ms, None)
+
+def test_buffer_grows_lazily_and_wraps_in_time_order():
+    buffer = SeriesRingBuffer(1, 4, 0)
+    buffer.append(10, 1.0, 1)
+    assert len(buffer.ts_ms) == 1
+    for ts_ms in (30, 20, 40, 50):
+        buffer.append(ts_ms, ts_ms / 10, ts_ms)
+    assert len(buffer.ts_ms) == 4
+    ts_ms, values = buffer.window()
+    assert list(ts_ms) == [20, 30, 40, 50]
+    assert buffer.complete_from_ms == 11
+    assert buffer.latest() == (50, 5.0, 50)
+    assert list(buffer.window(25, 50)[0]) == [30, 40]
+
+def test_bad_value_leaves_the_buffer_untouched():
+    buffer = SeriesRingBuffer(1, 2, 0)
+    buffer.append(10, 1.0, 1)
+    try:
+        buffer.append(20, "x", 2)
+    except ValueError:
+        pass
+    assert (buffer.size, buffer.latest()) == (1, (10, 1.0, 1))
+
+def test_window_only_answers_what_the_buffers_hold(logger):
+    store = RingBufferStore(logger, capacity=2)
+    now_ms = store._complete_from_ms
+    store.on_ingest([value(1, now_ms + 1, 1.0), value(2, now_ms + 2, 2.0), value(3, now_ms + 3, 3.0)])
+    assert store.window(1, now_ms) is None
+    ts_ms, values = store.window(1, now_ms + 2)
+    assert list(values) == [2.0, 3.0]
+    assert list(store.window(2, now_ms)[1]) == []
+    assert store.stats()["points"] == 2 and (store.hits, store.misses) == (2, 1)
+
+def test_warm_keeps_points_committed_during_the_query(logger, session_factory, clock):
+    clock[0] = int(time.time() * 1000)
+    with DatabaseManager(logger, session_factory) as session:
+        BulkIngest(logger).ingest(session, [record(1, [(1, 1.0)]), record(1, [(1, 2.0)])])
+    store = RingBufferStore(logger)
+
+    class Session:
+        # a commit lands while the warm query runs, after the query already read its rows
+        def __init__(self, session):
+            self.session = session
+
+        def execute(self, *args):
+            result = self.session.execute(*args)
+            rows = result.all()
+            store.on_ingest([value(99, clock[0] + 1, 9.0), value(2, clock[0], 2.0)])
+            return type("Result", (), {"all": lambda self: rows})()
+    with DatabaseManager(logger, session_factory) as session:
+        store.warm(Session(session))
+    ts_ms, values = store.window(1, clock[0] - 1000)
+    assert list(values) == [1.0, 2.0, 9.0]
+    assert store._replay is None
+
+def test_failing_listener_does_not_stop_the_others(logger, session_factory, clock):
+    ingest = BulkIngest(logger)
+    seen = []
+
+    def broken(values):
+        raise TypeError("broken listener")
+    ingest.add_listener(broken)
+    ingest.add_listener(seen.extend)
+    with DatabaseManager(logger, session_factory) as session:
+        ingest.ingest(session, [record(1, [(1, 1.0)])])
+    assert [value.value for value in seen] == [1.0]
@@ -0,0 +1,58 @@
+import logging
+import random
+import pytest
+from db.ingest import BulkIngest, IngestedValue
+from db.rollups import Rollups
+from managers.database_manager import DatabaseManager
+from conftest import DAY_MS, T0, record
+
+MINUTE_MS = 60 * 1000
+
+def ingest_series(logger, session_factory, ingest, clock, start_ms, end_ms, seed=1):
+    # two series of one device, a value every 17 minutes with a few nulls
+    rng = random.Random(seed)
+    for ts_ms in range(start_ms, end_ms, 17 * MINUTE_MS):
+        clock[0] = ts_ms
+        values = [(1, round(rng.uniform(0, 100), 2)), (2, None if rng.random() < 0.1 else rng.uniform(-5, 5))]
+        with DatabaseManager(logger, session_factory) as session:
+            ingest.ingest(session, [record(1, values)])
+
+def test_rollup_query_reads_the_uncovered_span_raw(logger, engine, session_factory, clock, rollups):
+    ingest_series(logger, session_factory, BulkIngest(logger), clock, T0, T0 + DAY_MS)
+    rollups.start_coverage(engine, now_ms=T0 + DAY_MS - 1)
+    ingest = BulkIngest(logger)
+    ingest.add_writer(rollups.apply)
+    ingest_series(logger, session_factory, ingest, clock, T0 + DAY_MS, T0 + 2 * DAY_MS, seed=2)
+
+    def buckets(start_ms, end_ms):
+        with DatabaseManager(logger, session_factory) as session:
+            resolution_ms, rows = rollups.query(session, 1, start_ms, end_ms, resolution_ms=60 * MINUTE_MS)
+            return [row.to_dict() for row in rows]
+    mixed = buckets(T0 + 30 * MINUTE_MS, T0 + 2 * DAY_MS)
+    assert len(mixed) == 48
+    assert mixed[0]["bucket_start_ms"] == T0
+    rollups.backfill(engine)
+    assert mixed == [pytest.approx(bucket) for bucket in buckets(T0 + 30 * MINUTE_MS, T0 + 2 * DAY_MS)]
+
+def test_get_metric_rollups_without_coverage_is_read_raw(client):
+    data = {"device_id": 902, "device_name": "rollups", "client_timestamp_utc": "14-11-2023 00:00:00",
+            "client_timezone_mins": 0,
+            "snapshots": [{"device_metric_type_id": 9021, "device_metric_type_name": "load", "metric_value": 3}]}
+    assert client.post("/post_metric_snapshot", json=data).status_code == 200
+    data["snapshots"][0]["metric_value"] = 5
+    assert client.post("/post_metric_snapshot", json=data).status_code == 200
+    response = client.get("/get_metric_rollups?device_metric_type_id=9021&resolution=1d")
+    buckets = response.json["data"]["buckets"]
+    assert [(bucket["count"], bucket["min"], bucket["max"], bucket["last"]) for bucket in buckets] == [(2, 3.0, 5.0, 5.0)]
+
+def test_apply_folds_values_as_floats():
+    rows = []
+
+    class Session:
+        def execute(self, statement, parameters):
+            rows.extend(parameters)
+    values = [IngestedValue(snapshot_id, 1, 1, value, T0 + snapshot_id, None)
+              for snapshot_id, value in enumerate(["7", "8", 2.5, None, "x"], start=1)]
+    Rollups(logging.getLogger("tests"), ["1m"]).apply(Session(), values)
+    assert len(rows) == 1
+    assert (rows[0]["min_value"], rows[0]["max_value"], rows[0]["sum_value"], rows[0]["count"]) == (2.5, 8.0, 17.5, 3)
@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from db.migrations import Migrations
+from db.timestamps import parse_time_arg, to_epoch_ms
+from conftest import T0
+
+def test_to_epoch_ms_applies_the_timezone():
+    assert to_epoch_ms("14-11-2023 00:00:00") == T0
+    assert to_epoch_ms("14-11-2023 02:00:00", 120) == T0
+    assert to_epoch_ms("not a timestamp") is None
+    assert to_epoch_ms(None) is None
+
+def test_parse_time_arg():
+    assert parse_time_arg(None) is None
+    assert parse_time_arg("") is None
+    assert parse_time_arg(str(T0)) == T0
+    assert parse_time_arg("14-11-2023 00:00:00") == T0
+    with pytest.raises(ValueError, match="Invalid timestamp: yesterday"):
+        parse_time_arg("yesterday")
+
+def test_migrations_create_a_new_database(logger, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    Migrations(logger, engine).run()
+    columns = {column["name"] for column in inspect(engine).get_columns("metric_snapshots")}
+    assert {"client_ts_ms", "server_ts_ms"} <= columns
+    engine.dispose()
+
+def test_migrations_add_and_backfill_epoch_columns(logger, tmp_path):
+    # the schema as it was before the epoch columns existed
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE devices (device_id INTEGER PRIMARY KEY, device_name TEXT NOT NULL)"))
+        connection.execute(text("""
+            CREATE TABLE metric_snapshots (
+                metric_snapshot_id INTEGER PRIMARY KEY, device_id INTEGER NOT NULL,
+                client_timestamp_utc TEXT NOT NULL, client_timezone_mins INTEGER NOT NULL,
+                server_timestamp_utc TEXT NOT NULL, server_timezone_mins INTEGER NOT NULL)
+        """))
+        connection.execute(text("INSERT INTO devices VALUES (1, 'device')"))
+        connection.execute(text("INSERT INTO metric_snapshots VALUES (1, 1, '14-11-2023 00:00:00', 0, '14-11-2023 01:00:00', 60)"))
+    migrations = Migrations(logger, engine, batch_size=1)
+    migrations.run()
+    with engine.connect() as connection:
+        row = connection.execute(text("SELECT client_ts_ms, server_ts_ms FROM metric_snapshots")).one()
+    assert tuple(row) == (T0, T0)
+    assert migrations.backfill_timestamps() == 0
+    engine.dispose()
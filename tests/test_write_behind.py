@@ -0,0 +1,31 @@
+from sqlalchemy import func, select
+from db.ingest import BulkIngest
+from db.models import MetricValue
+from managers.database_manager import DatabaseManager
+from managers.write_behind_queue import WriteBehindQueue
+from conftest import record
+
+def test_group_commit_writes_everything_on_stop(logger, session_factory, clock):
+    writer = WriteBehindQueue(logger, session_factory, BulkIngest(logger), batch_size=3, flush_interval_ms=10)
+    writer.start()
+    assert all(writer.submit(record(1, [(1, float(i))])) for i in range(10))
+    writer.stop()
+    with DatabaseManager(logger, session_factory) as session:
+        assert session.execute(select(func.count()).select_from(MetricValue)).scalar() == 10
+    stats = writer.stats()
+    assert stats["records_written"] == 10
+    assert stats["commits"] >= 4
+    assert stats["queue_depth"] == 0
+
+def test_full_or_stopped_queue_pushes_back(logger, session_factory):
+    writer = WriteBehindQueue(logger, session_factory, BulkIngest(logger), max_queue_size=1)
+    assert writer.submit(record(1, [(1, 1.0)]))
+    assert not writer.submit(record(1, [(1, 2.0)]))
+    writer.stop()
+    assert not writer.submit(record(1, [(1, 3.0)]))
+
+def test_bad_record_does_not_lose_the_group(logger, session_factory, clock):
+    writer = WriteBehindQueue(logger, session_factory, BulkIngest(logger))
+    writer._commit([record(1, [(1, 1.0)]), record(1, [(1, object())]), record(1, [(1, 3.0)])])
+    stats = writer.stats()
+    assert (stats["records_written"], stats["records_dropped"]) == (2, 1)
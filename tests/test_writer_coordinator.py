@@ -0,0 +1,66 @@
+import os
+import stat
+import threading
+import pytest
+from db.ingest import BulkIngest
+from lib_config.config import freeze
+from managers.identity_cache import IdentityCache
+from managers.writer_coordinator import WriterClient, WriterServer
+from conftest import record
+
+def multiprocess_config(tmp_path, timeout=5):
+    return freeze({
+        "socket_path": str(tmp_path / "writer.sock"),
+        "batch_size": 100,
+        "flush_interval_ms": 5,
+        "request_timeout_seconds": timeout,
+        "subscriber_queue_size": 100
+    }, "multiprocess")
+
+@pytest.fixture
+def authkey(monkeypatch):
+    monkeypatch.setenv("APP_WRITER_AUTHKEY", os.urandom(32).hex())
+
+@pytest.fixture
+def writer(logger, session_factory, tmp_path, authkey, clock):
+    server = WriterServer(logger, session_factory, BulkIngest(logger), IdentityCache(logger),
+                          multiprocess_config(tmp_path))
+    server.listen()
+    # writer.py stops from a signal handler on the accepting thread, here accept() stays blocked
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.stop()
+
+def test_missing_authkey_fails_closed(logger, tmp_path, monkeypatch):
+    monkeypatch.delenv("APP_WRITER_AUTHKEY", raising=False)
+    with pytest.raises(RuntimeError):
+        WriterClient(logger, multiprocess_config(tmp_path))
+
+def test_socket_is_owner_only_from_bind(writer):
+    assert stat.S_IMODE(os.stat(writer.socket_path).st_mode) == 0o600
+
+def test_subscription_is_live_when_subscribe_returns(logger, tmp_path, writer):
+    client = WriterClient(logger, multiprocess_config(tmp_path))
+    received = []
+    committed = threading.Event()
+    client.add_listener(lambda values: (received.extend(values), committed.set()))
+    identity_cache = IdentityCache(logger)
+    client.subscribe(identity_cache, lambda: None)
+    # nothing sent after subscribe returns can be missed
+    assert writer.stats()["subscribers"] == 1
+    results = client.ingest(None, [record(1, [(1, 1.0), (2, 2.0)], device_name="one")])
+    assert [result.error for result in results] == [None]
+    assert committed.wait(5)
+    assert sorted(value.device_metric_type_id for value in received) == [1, 2]
+    for _ in range(50):
+        if identity_cache.get_device_name(1) is not None:
+            break
+        threading.Event().wait(0.05)
+    assert identity_cache.get_device_name(1) == "one"
+    client.stop()
+
+def test_subscribe_gives_up_without_a_writer(logger, tmp_path, authkey):
+    client = WriterClient(logger, multiprocess_config(tmp_path, timeout=0.5))
+    with pytest.raises(RuntimeError):
+        client.subscribe(IdentityCache(logger), lambda: None)
+    client.stop()
@@ -0,0 +1,16 @@
+# python writer.py, the single writer process of a multi-worker deployment (started by gunicorn.conf.py)
+# every worker forwards its writes here over the multiprocess.socket_path Unix socket
+import os
+import signal
+
+os.environ["APP_ROLE"] = "writer"
+os.environ.setdefault("APP_API_ONLY", "1")
+
+import main
+
+signal.signal(signal.SIGTERM, lambda signum, frame: main.application.writer.stop())
+signal.signal(signal.SIGINT, lambda signum, frame: main.application.writer.stop())
+# bound before any other thread starts, the socket is created under a process wide umask
+main.application.writer.listen()
+main.application.start_retention()
+main.application.writer.serve_forever()